@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench.py — micro-benchmark-uri offline pentru căile fierbinți ale botului.
+
+Generează un catalog sintetic (10k–100k magazine) în formatul *_for_bot.json,
+îl încarcă exact ca botul și măsoară: parsarea codurilor, haversine, programul
+(parsare + „deschis acum”), căutarea celor mai apropiate, paginile de
+butoane, fișa unui magazin și încărcarea datelor (JSON și snapshot).
+Căutarea celor mai apropiate se măsoară și pe catalogul real din data/
+(cazurile „@realN”; --no-real le sare). Fără rețea și fără Telegram.
+
+Rezultatele (ns/operație, minimul din mai multe repetări) se scriu în JSON;
+cu --baseline se compară cu o rulare anterioară și ieșirea e 1 dacă vreun
+caz a încetinit peste --tolerance.
+
+    python bench.py --stores 10000 100000 --out bench_results.json
+    python bench.py --baseline bench_results.json --tolerance 0.25
+"""
+import os, sys, json, time, random, platform, tempfile, argparse, statistics, subprocess, datetime as dt
+from typing import Any, Callable, Dict, List, Tuple
+
+os.environ.setdefault("TELEGRAM_TOKEN", "0:bench")     # bot.py cere tokenul la import
+os.environ.setdefault("SESSION_BACKEND", "memory")     # fără fișiere de sesiuni
+
+import numpy as np
+
+import bot
+from catalog import BRAND_FILES, Catalog, default_files
+from geo import haversine_km
+from schedule import day_intervals, compile_week, minute_of_week
+
+# ───────── Catalog sintetic ─────────
+_HOURS = [
+    ("08:00–23:00",) * 7,
+    ("07:00-22:00",) * 6 + ("08:00-20:00",),
+    ("nonstop",) * 7,
+    ("08:00-13:00, 14:00-18:00",) * 5 + ("închis", "închis"),
+    ("22:00-06:00",) * 7,
+    ("09:00-21:00",) * 5 + ("", ""),                   # weekend necunoscut
+]
+_STREETS = ["STEFAN CEL MARE", "CANTEMIR DIMITRIE", "GHIBU ONISIFOR", "CREANGA ION", "DACIA", "IALOVENI"]
+_CITIES = ["CHISINAU", "BALTI", "ORHEI", "CAHUL", "UNGHENI", "SOROCA", "COMRAT"]
+
+def synth_brands(n: int, seed: int = 1) -> Dict[str, Dict[str, Any]]:
+    """n magazine împărțite pe branduri, cu numere 1..k per brand (aceeași schemă ca datele reale)."""
+    rnd = random.Random(seed)
+    codes = list(BRAND_FILES)
+    out: Dict[str, Dict[str, Any]] = {c: {} for c in codes}
+    for j in range(n):
+        code = codes[j % len(codes)]
+        num = len(out[code]) + 1
+        week = rnd.choice(_HOURS)
+        out[code][str(num)] = {
+            "number": num,
+            "address": f"{rnd.choice(_CITIES)}, {rnd.choice(_STREETS)}, {rnd.randint(1, 200)}",
+            "lat": round(rnd.uniform(45.5, 48.4), 6),
+            "lon": round(rnd.uniform(26.7, 30.1), 6),
+            "hours": dict(zip(["mon", "tue", "wed", "thu", "fri", "sat", "sun"], week)),
+            "manager_name": f"Manager {j}",
+            "manager_email": f"manager.{code}{num}@example.md",
+            "manager_phone": f"0{rnd.randint(60, 79)}{rnd.randint(100000, 999999)}",
+        }
+    return out
+
+def write_synth(data: Dict[str, Dict[str, Any]], data_dir: str) -> Dict[str, str]:
+    files = {}
+    for code, items in data.items():
+        files[code] = os.path.join(data_dir, BRAND_FILES[code])
+        with open(files[code], "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+    return files
+
+# ───────── Măsurare ─────────
+def measure(fn: Callable[[], Any], ops: int = 1, min_time: float = 0.2, repeat: int = 5) -> Dict[str, Any]:
+    """fn() face `ops` operații; bucle calibrate ca o repetare să dureze >= min_time."""
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        el = time.perf_counter() - t0
+        if el >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2 if el <= 0 else max(2, min(10, int(min_time / el) + 1))
+    runs = [el]
+    for _ in range(repeat - 1 if el < 2.0 else 1):     # cazurile de secunde: doar două rulări
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        runs.append(time.perf_counter() - t0)
+    per_op = [r / loops / ops * 1e9 for r in runs]
+    return {"ns_per_op": round(min(per_op), 1), "ns_median": round(statistics.median(per_op), 1),
+            "loops": loops, "ops": ops, "runs": len(runs)}
+
+# ───────── Cazuri ─────────
+def cases(cat: Catalog, files: Dict[str, str], snapshot: str, seed: int = 2) -> Dict[str, Tuple[Callable[[], Any], int]]:
+    """nume -> (funcție, operații per apel)."""
+    rnd = random.Random(seed)
+    n = len(cat)
+    bot.CATALOG = cat
+    codes = list(BRAND_FILES)
+    tokens = [f"{rnd.choice(codes)}{rnd.randint(1, 199)}" for _ in range(100)]
+    line = " ".join(tokens[:10])
+    pts = [(rnd.uniform(45.5, 48.4), rnd.uniform(26.7, 30.1)) for _ in range(100)]
+    day_texts = [h for week in _HOURS for h in week]
+    weeks = [dict(zip(["mon", "tue", "wed", "thu", "fri", "sat", "sun"], w)) for w in _HOURS]
+    ids = [rnd.randrange(n) for _ in range(100)]
+    mows = [rnd.randrange(7*24*60) for _ in range(100)]
+    now = dt.datetime(2025, 3, 5, 12, 30, tzinfo=bot.TZ)
+    pairs = [bot.parse_code_token(t) for t in tokens[:10]]
+    page_keys = [(c, p) for c in codes for p in (1, 2, 3)]
+
+    def page_cold():
+        for k in [k for k in cat.derived if k[0] == "page"]:
+            del cat.derived[k]
+        for c, p in page_keys:
+            bot.page_kb(c, p)
+
+    def card_cold():
+        for k in [k for k in cat.derived if k[0] == "card"]:
+            del cat.derived[k]
+        for i in ids:
+            bot.item_text(cat, i, now, pts[0])
+
+    return {
+        "parse_code_token": (lambda: [bot.parse_code_token(t) for t in tokens], len(tokens)),
+        "parse_codes_line_10": (lambda: bot.parse_codes_line(line), 1),
+        "haversine_km": (lambda: [haversine_km(a, b, 47.0, 28.85) for a, b in pts], len(pts)),
+        "day_intervals": (lambda: [day_intervals(t) for t in day_texts], len(day_texts)),
+        "compile_week": (lambda: [compile_week(w) for w in weeks], len(weeks)),
+        "is_open": (lambda: [cat.schedules.is_open(i, m) for i, m in zip(ids, mows)], len(ids)),
+        "open_mask_all": (lambda: cat.schedules.open_mask(minute_of_week(now)), 1),
+        "nearest_k5": (lambda: [cat.index.nearest(a, b, 5) for a, b in pts[:20]], 20),
+        "lookup_10": (lambda: cat.lookup(pairs), 1),
+        "page_kb_cold": (page_cold, len(page_keys)),
+        "page_kb_warm": (lambda: [bot.page_kb(c, p) for c, p in page_keys], len(page_keys)),
+        "item_text_cold": (card_cold, len(ids)),
+        "item_text_warm": (lambda: [bot.item_text(cat, i, now, pts[0]) for i in ids], len(ids)),
+        "load_json": (lambda: Catalog.from_json_files(files), 1),
+        "load_snapshot": (lambda: Catalog.from_snapshot(snapshot), 1),
+    }
+
+def real_cases(cat: Catalog, seed: int = 3) -> Dict[str, Tuple[Callable[[], Any], int]]:
+    """Căutarea celor mai apropiate pe catalogul real (data/*_for_bot.json), 200 de puncte prin Moldova."""
+    rnd = random.Random(seed)
+    bot.CATALOG = cat
+    pts = [(rnd.uniform(45.5, 48.4), rnd.uniform(26.7, 30.1)) for _ in range(200)]
+    city = [(rnd.gauss(47.02, 0.03), rnd.gauss(28.84, 0.04)) for _ in range(200)]
+    codes = list(BRAND_FILES)
+    mask = bot.open_now_mask(cat)
+    return {
+        "nearest_k5": (lambda: [cat.index.nearest(a, b, 5) for a, b in pts], len(pts)),
+        "nearest_k5_city": (lambda: [cat.index.nearest(a, b, 5) for a, b in city], len(city)),
+        "nearest_k5_brand": (lambda: [cat.index.nearest(a, b, 5, brands=[codes[j % len(codes)]])
+                                      for j, (a, b) in enumerate(pts)], len(pts)),
+        "nearest_k5_open": (lambda: [cat.index.nearest(a, b, 5, allow=mask) for a, b in pts], len(pts)),
+    }
+
+def run(sizes: List[int], only: str = "", min_time: float = 0.2, real: bool = True) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    files = default_files()
+    if real and all(os.path.exists(p) for p in files.values()):
+        cat = Catalog.from_json_files(files)
+        for name, (fn, ops) in real_cases(cat).items():
+            if only and only not in name:
+                continue
+            key = f"{name}@real{len(cat)}"
+            results[key] = measure(fn, ops, min_time=min_time)
+            print(f"{key:<28} {results[key]['ns_per_op']:>14,.0f} ns/op", flush=True)
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as d:
+            files = write_synth(synth_brands(n), d)
+            cat = Catalog.from_json_files(files)
+            snapshot = os.path.join(d, "catalog.npz")
+            cat.save_snapshot(snapshot)
+            for name, (fn, ops) in cases(cat, files, snapshot).items():
+                if only and only not in name:
+                    continue
+                key = f"{name}@{n}"
+                results[key] = measure(fn, ops, min_time=min_time)
+                print(f"{key:<28} {results[key]['ns_per_op']:>14,.0f} ns/op", flush=True)
+    return results
+
+def meta() -> Dict[str, Any]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        rev = ""
+    return {"when": dt.datetime.now().isoformat(timespec="seconds"), "git": rev,
+            "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine()}
+
+def compare(cur: Dict[str, Any], base: Dict[str, Any], tolerance: float) -> List[str]:
+    """Cazurile mai lente decât baseline × (1 + tolerance)."""
+    bad = []
+    for key, r in cur.items():
+        b = base.get(key)
+        if not b:
+            continue
+        ratio = r["ns_per_op"] / max(b["ns_per_op"], 1e-9)
+        mark = "⚠️ " if ratio > 1 + tolerance else "  "
+        print(f"{mark}{key:<28} {b['ns_per_op']:>12,.0f} → {r['ns_per_op']:>12,.0f} ns/op  ×{ratio:.2f}")
+        if ratio > 1 + tolerance:
+            bad.append(key)
+    return bad
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmark-uri pe un catalog sintetic.")
+    ap.add_argument("--stores", type=int, nargs="+", default=[10000, 100000], help="mărimi de catalog")
+    ap.add_argument("--only", default="", help="doar cazurile care conțin textul")
+    ap.add_argument("--no-real", action="store_true", help="fără cazurile pe catalogul real din data/")
+    ap.add_argument("--min-time", type=float, default=0.2, help="secunde per repetare")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--baseline", default=None, help="rezultate anterioare de comparat")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="încetinire acceptată (0.25 = +25%%)")
+    args = ap.parse_args()
+
+    base = None
+    if args.baseline:                  # citit înainte: --out poate fi același fișier
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)["results"]
+    results = run(args.stores, args.only, args.min_time, real=not args.no_real)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta(), "results": results}, f, ensure_ascii=False, indent=1)
+    print(f"✅ {args.out}: {len(results)} rezultate")
+    if base is not None:
+        bad = compare(results, base, args.tolerance)
+        if bad:
+            print(f"❌ regresii (>{args.tolerance:.0%}): {', '.join(bad)}")
+            sys.exit(1)
+        print("✅ fără regresii")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, re, ssl, json, math, asyncio, datetime as dt
+import os, re, time, asyncio, threading, datetime as dt
 from typing import Dict, Any, Tuple, List, Optional
 from zoneinfo import ZoneInfo
 
-import aiohttp, certifi
+import numpy as np
 from dotenv import load_dotenv
 
 from aiogram import Router, F
@@ -15,9 +15,20 @@ from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton,
     ReplyKeyboardRemove,
 )
-from aiogram.filters import CommandStart
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+import gmaps
+from fleet import DEPOTS, depot_key, split_routes, route_cost
+from catalog import Catalog, SNAPSHOT_PATH, files_stamp, sources_signature, load as catalog_load
+from geo import haversine_km, travel_seconds_matrix
+from schedule import DAYS, minute_of_week, relative_windows, plan_time_windows
+from tsp import solve_path
+from ttl_cache import AsyncTTLCache
+from sessions import open_store as open_session_store
+from metrics import FALLBACKS
+from tracing import span
+
 # ─────────────────────────────────────────────────────────
 # Config
 # ─────────────────────────────────────────────────────────
@@ -30,33 +41,55 @@ if not BOT_TOKEN:
 
 TZ = ZoneInfo("Europe/Chisinau")
 DATA_DIR = "data"
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", SNAPSHOT_PATH)   # "" = doar JSON
+DATA_WATCH_S = float(os.getenv("DATA_WATCH_S", "5"))             # 0 = fără reîncărcare la cald
 
-# Acasă (coordonate păstrate pentru meniul de mentenanță)
-HOME_LAT = 46.995953742189705
-HOME_LON = 28.903641724548
-
-# Locații Mentenanță
-MENT_HOME_NAME = "Acasă"
-MENT_TAKEIT_NAME = "Take IT depo"
-MENT_TAKEIT_LAT = 46.995234693707985
-MENT_TAKEIT_LON = 28.903614191014114
-
-MENT_FRUCTE_NAME = "Fructe Legume Depo"
-MENT_FRUCTE_LAT = 46.99205105508518
-MENT_FRUCTE_LON = 28.88559278022606
-
-MENT_RENO_NAME = "Renovatie IT"
-MENT_RENO_LAT = 47.0426519229461
-MENT_RENO_LON = 28.862523753686208
-
-MENT_REZOMEDIA_NAME = "Rezomedia"
-MENT_REZOMEDIA_LAT = 47.01492352451698
-MENT_REZOMEDIA_LON = 28.85564912784494
+# Acasă + Locații Mentenanță (coordonatele stau în fleet.DEPOTS, folosite și la rute pe echipe)
+_, HOME_LAT, HOME_LON = DEPOTS["home"]
+MENT_HOME_NAME = DEPOTS["home"][0]
+MENT_TAKEIT_NAME, MENT_TAKEIT_LAT, MENT_TAKEIT_LON = DEPOTS["takeit"]
+MENT_FRUCTE_NAME, MENT_FRUCTE_LAT, MENT_FRUCTE_LON = DEPOTS["fructe"]
+MENT_RENO_NAME, MENT_RENO_LAT, MENT_RENO_LON = DEPOTS["renovatie"]
+MENT_REZOMEDIA_NAME, MENT_REZOMEDIA_LAT, MENT_REZOMEDIA_LON = DEPOTS["rezomedia"]
 
 # Paginare
 PER_PAGE = 20
 BUTTONS_PER_ROW = 5
 
+# Rută cu program: minute petrecute la fiecare magazin / așteptare maximă la ușă
+ROUTE_SERVICE_MIN = int(os.getenv("ROUTE_SERVICE_MIN", "15"))
+ROUTE_MAX_WAIT_MIN = int(os.getenv("ROUTE_MAX_WAIT_MIN", "30"))
+
+# Cache rute optimizate (în proces): LRU + TTL, pe ferestre de trafic de ROUTE_CACHE_BUCKET_MIN
+ROUTE_CACHE_MAX = int(os.getenv("ROUTE_CACHE_MAX", "512"))
+ROUTE_CACHE_TTL_S = float(os.getenv("ROUTE_CACHE_TTL_S", "900"))
+ROUTE_CACHE_BUCKET_MIN = int(os.getenv("ROUTE_CACHE_BUCKET_MIN", "15"))
+ROUTE_CACHE_DECIMALS = 5                                          # ~1 m
+
+# Sesiuni utilizatori: "sqlite" (supraviețuiesc redeploy-ului) sau "memory"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_DB = os.getenv("SESSION_DB", os.path.join("data", "sessions.sqlite3"))
+SESSION_TTL_DAYS = float(os.getenv("SESSION_TTL_DAYS", "30"))
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "5000"))
+SESSION_FLUSH_S = float(os.getenv("SESSION_FLUSH_S", "2"))
+
+# Procese uvicorn (--workers, implicit 1). Peste 1, sesiunile se citesc din SQLite
+# (fără cache în proces, altfel un worker ar vedea starea veche a altuia), iar
+# scrierile pleacă imediat, în lot, din thread-ul de scriere al sesiunilor.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+if WEB_CONCURRENCY > 1:
+    if SESSION_BACKEND == "memory":
+        print("[WARN] SESSION_BACKEND=memory cu mai mulți workeri: sesiunile nu sunt comune; folosesc sqlite")
+        SESSION_BACKEND = "sqlite"
+    SESSION_CACHE_MAX, SESSION_FLUSH_S = 0, 0.0
+
+# Distance Matrix doar până la atâtea puncte (costul crește cu n²); peste → haversine
+DM_MAX_POINTS = int(os.getenv("DM_MAX_POINTS", "25"))
+
+# Cele mai apropiate magazine
+NEAR_DEFAULT_K = 5
+NEAR_MAX_K = 20
+
 # brand code -> (nume public, json, start, end)
 BRANDS: Dict[str, Tuple[str, str, int, int]] = {
     "l":  ("Linella",     "linella_for_bot.json",     1, 199),
@@ -68,9 +101,16 @@ BRANDS: Dict[str, Tuple[str, str, int, int]] = {
 }
 
 # runtime (memorie volatilă)
-user_location: Dict[int, Tuple[float, float]] = {}
-user_brand: Dict[int, str] = {}      # brand curent pt. input numeric
-user_route_mode: Dict[int, str] = {} # "loc" | "first"
+ROUTE_CACHE = AsyncTTLCache(max_items=ROUTE_CACHE_MAX, ttl_s=ROUTE_CACHE_TTL_S)
+# sesiuni per utilizator (plafonate, persistente cu backend-ul sqlite):
+#   loc = (lat, lon) | brand = brand curent pt. input numeric
+#   route_mode = "loc" | "first" | route_tw = True dacă ține cont de programul magazinelor
+SESSIONS = open_session_store(SESSION_BACKEND, SESSION_DB, ttl_s=SESSION_TTL_DAYS*86400,
+                              cache_items=SESSION_CACHE_MAX, flush_s=SESSION_FLUSH_S)
+
+def session_loc(sess: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    loc = sess.get("loc")          # din sqlite revine ca listă JSON
+    return (float(loc[0]), float(loc[1])) if loc else None
 
 # ─────────────────────────────────────────────────────────
 # Utilitare
@@ -83,58 +123,80 @@ def user_tag(u) -> str:
     if not uname: uname = "<no-username>"
     return f"{uname} (#{u.id})"
 
-def load_dict(fname: str) -> Dict[str, Any]:
-    path = os.path.join(DATA_DIR, fname)
-    if not os.path.exists(path):
-        print(f"[WARN] Lipsește {path}")
-        return {}
-    with open(path, "r", encoding="utf-8") as f:
-        d = json.load(f)
-    return {str(k): v for k, v in d.items()}
-
-DATA_BY_BRAND: Dict[str, Dict[str, Any]] = {}
-MAX_BY_BRAND: Dict[str, int] = {}
-for code, (_, fname, lo, hi) in BRANDS.items():
-    d = load_dict(fname)
-    DATA_BY_BRAND[code] = d
-    nums = [int(k) for k in d.keys() if str(k).isdigit()]
-    MAX_BY_BRAND[code] = min(max(nums) if nums else hi, hi)
-
-# distanță pe sferă
-def haversine_km(a1, b1, a2, b2) -> float:
-    R = 6371.0088
-    p1 = math.radians(a1)
-    p2 = math.radians(a2)
-    dphi = math.radians(a2 - a1)
-    dl   = math.radians(b2 - b1)
-    x = math.sin(dphi/2)**2 + math.cos(p1)*math.cos(p2)*math.sin(dl/2)**2
-    return R * (2 * math.atan2(math.sqrt(x), math.sqrt(1-x)))
-
-# orar
-_TIME_RGX = re.compile(r"(\d{1,2}):(\d{2})\s*[-–]\s*(\d{1,2}):(\d{2})")
-def parse_ranges(text: str) -> List[Tuple[dt.time, dt.time]]:
-    out = []
-    for m in _TIME_RGX.finditer(text or ""):
-        h1, m1, h2, m2 = map(int, m.groups())
-        out.append((dt.time(h1, m1, tzinfo=TZ), dt.time(h2, m2, tzinfo=TZ)))
-    return out
-
-def is_open_now(day_text: str) -> bool:
-    tnow = dt.datetime.now(TZ).timetz()
-    for t1, t2 in parse_ranges(day_text or ""):
-        if t1 <= t2:
-            if t1 <= tnow <= t2: return True
-        else:  # peste miezul nopții
-            if tnow >= t1 or tnow <= t2: return True
-    return False
-
-def today_key() -> str:
-    return ["mon","tue","wed","thu","fri","sat","sun"][dt.datetime.now(TZ).weekday()]
+# catalog unic (toate lanțurile), încărcat leneș: serverul răspunde pe „/” până se încarcă.
+# Sursa e snapshot-ul binar (python catalog.py la build) sau, dacă lipsește/e vechi, JSON-urile.
+# La reîncărcare se construiește un catalog nou complet și doar referința CATALOG se schimbă:
+# un handler care a luat cat = catalog() lucrează până la capăt pe aceeași versiune.
+CATALOG: Optional[Catalog] = None
+STARTUP: Dict[str, Any] = {}       # raport de pornire (ms), afișat și pe „/”
+_catalog_lock = threading.Lock()
+
+def load_catalog() -> Catalog:
+    global CATALOG
+    with _catalog_lock:
+        if CATALOG is None:
+            t0 = time.perf_counter()
+            cat, source = catalog_load(_data_files(), CATALOG_SNAPSHOT or None)
+            STARTUP["catalog_ms"] = round((time.perf_counter() - t0)*1000, 1)
+            STARTUP["catalog_source"] = source
+            STARTUP["stores"] = len(cat)
+            print(f"[{now_hms()}] CATALOG {len(cat)} magazine din {source} în {STARTUP['catalog_ms']} ms")
+            CATALOG = cat
+    return CATALOG
+
+def catalog() -> Catalog:
+    return CATALOG if CATALOG is not None else load_catalog()
+
+async def ensure_catalog() -> Catalog:
+    """Varianta pentru event loop: încărcarea (o singură dată) rulează într-un thread."""
+    return CATALOG if CATALOG is not None else await asyncio.to_thread(load_catalog)
+
+def _data_files() -> Dict[str, str]:
+    return {code: os.path.join(DATA_DIR, fname) for code, (_, fname, _, _) in BRANDS.items()}
+
+def reload_catalog() -> bool:
+    """Reconstruiește catalogul dacă s-au schimbat datele (rulează în thread). True = schimbat."""
+    global CATALOG
+    files = _data_files()
+    old = catalog()
+    if sources_signature(files) == old.signature:
+        return False
+    t0 = time.perf_counter()
+    cat, source = catalog_load(files, CATALOG_SNAPSHOT or None)
+    lost = [c for c in cat.missing if c not in old.missing]
+    if lost:
+        # nici fișierul, nici rezerva: păstrăm versiunea veche decât să golim un lanț
+        print(f"[{now_hms()}] RELOAD anulat: fără date pentru {', '.join(lost)}")
+        return False
+    with _catalog_lock:
+        CATALOG = cat
+    print(f"[{now_hms()}] RELOAD {len(old)} → {len(cat)} magazine din {source} "
+          f"în {(time.perf_counter() - t0)*1000:.1f} ms")
+    return True
+
+async def watch_data(interval_s: float = DATA_WATCH_S):
+    """Verifică mtime/mărime la fiecare interval; reconstruirea se face în afara event loop-ului."""
+    files = _data_files()
+    last = await asyncio.to_thread(files_stamp, files)
+    while True:
+        await asyncio.sleep(interval_s)
+        stamp = await asyncio.to_thread(files_stamp, files)
+        if stamp == last:
+            continue
+        last = stamp
+        try:
+            await asyncio.to_thread(reload_catalog)
+        except Exception as e:
+            print(f"[{now_hms()}] RELOAD eșuat: {e!r}")
+
+# orar (din tabelul compilat)
+def open_now_mask(cat: Catalog) -> np.ndarray:
+    """Bool peste id-urile catalogului: magazinele deschise în acest minut."""
+    return cat.schedules.open_mask(minute_of_week(dt.datetime.now(TZ)))
 
 def format_hours(hours: Dict[str, str]) -> str:
-    order = ["mon","tue","wed","thu","fri","sat","sun"]
     names = ["Luni","Marți","Miercuri","Joi","Vineri","Sâmbătă","Duminică"]
-    return "\n".join(f"{n}: {hours.get(k,'') or '—'}" for k,n in zip(order, names))
+    return "\n".join(f"{n}: {hours.get(k,'') or '—'}" for k,n in zip(DAYS, names))
 
 # parsare brand + număr
 def normalize_brand(s: str) -> Optional[str]:
@@ -187,62 +249,57 @@ def google_maps_url(origin: Optional[Tuple[float,float]],
     q = "&".join(f"{k}={v}" for k,v in params)
     return f"https://www.google.com/maps/dir/?api=1&{q}"
 
-# Directions API cu timeout + fallback
+# Directions API cu timeout + fallback; întoarce (ordine, secunde, solver folosit)
+SOLVER_GOOGLE = "google-directions"
+
+def _route_key_point(p: Tuple[float,float]) -> Tuple[float,float]:
+    return (round(p[0], ROUTE_CACHE_DECIMALS), round(p[1], ROUTE_CACHE_DECIMALS))
+
 async def directions_optimize(origin: Tuple[float,float],
-                              points: List[Tuple[float,float]]) -> Tuple[List[int], int]:
+                              points: List[Tuple[float,float]]) -> Tuple[List[int], int, str]:
+    """Ca _directions_optimize, dar prin cache: aceeași plecare + aceleași opriri (în orice
+    ordine, ultima rămâne destinația) în aceeași fereastră de trafic = un singur calcul."""
     if not points:
-        return [], 0
+        return [], 0, ""
+    # forma canonică: waypoints sortate, destinația la final; indicii se traduc înapoi
+    perm = sorted(range(len(points) - 1), key=lambda i: _route_key_point(points[i])) + [len(points) - 1]
+    canon = [points[i] for i in perm]
+    bucket = int(time.time() // (ROUTE_CACHE_BUCKET_MIN*60))
+    key = (_route_key_point(origin), tuple(_route_key_point(p) for p in canon), bucket)
+    order, total, solver = await ROUTE_CACHE.get_or_compute(
+        key, lambda: _directions_optimize(origin, canon),
+        # rezultatul de rezervă nu se memorează cât timp avem cheie Google (poate fi o pană scurtă)
+        cache_if=lambda r: r[2] == SOLVER_GOOGLE or not GOOGLE_KEY)
+    return [perm[i] for i in order], total, solver
+
+async def _directions_optimize(origin: Tuple[float,float],
+                               points: List[Tuple[float,float]]) -> Tuple[List[int], int, str]:
 
     if GOOGLE_KEY:
-        url = "https://maps.googleapis.com/maps/api/directions/json"
-        params = {
-            "origin": f"{origin[0]},{origin[1]}",
-            "destination": f"{points[-1][0]},{points[-1][1]}",
-            "mode": "driving",
-            "departure_time": "now",
-            "key": GOOGLE_KEY,
-        }
-        if len(points) > 1:
-            params["waypoints"] = "optimize:true|" + "|".join(f"{a},{b}" for a,b in points[:-1])
-
-        ssl_ctx = ssl.create_default_context(cafile=certifi.where())
-        timeout = aiohttp.ClientTimeout(total=12)
-        connector = aiohttp.TCPConnector(ssl=ssl_ctx, limit=16)
-        for _ in range(2):
-            try:
-                async with aiohttp.ClientSession(timeout=timeout, connector=connector) as s:
-                    async with s.get(url, params=params) as r:
-                        data = await r.json()
-                if data.get("status") == "OK":
-                    route = data["routes"][0]
-                    order = route.get("waypoint_order", list(range(len(points)-1))) + [len(points)-1]
-                    total = 0
-                    for leg in route.get("legs", []):
-                        d = leg.get("duration_in_traffic") or leg.get("duration") or {}
-                        total += int(d.get("value", 0))
-                    return order, total
-            except Exception:
-                await asyncio.sleep(0.6)
-
-    # fallback: nearest-neighbor + viteză 35km/h
-    order = list(range(len(points)))
-    cur = origin
-    used = [False]*len(points)
-    out = []
-    for _ in range(len(points)):
-        best = None; best_d = 1e9
-        for i, p in enumerate(points):
-            if used[i]: continue
-            d = haversine_km(cur[0], cur[1], p[0], p[1])
-            if d < best_d: best_d, best = d, i
-        used[best] = True
-        out.append(best)
-        cur = points[best]
-    km = 0.0; cur = origin
-    for i in out:
-        km += haversine_km(cur[0], cur[1], points[i][0], points[i][1])
-        cur = points[i]
-    return out, int(km/35*3600)
+        res = await gmaps.directions_optimize(origin, points, GOOGLE_KEY)
+        if res is not None:
+            order, total = res
+            return order, total, SOLVER_GOOGLE
+    FALLBACKS.inc("directions", "google_error" if GOOGLE_KEY else "no_key")
+
+    # fallback: tsp.py (exact pe rute mici, căutare locală peste) pe haversine + 35km/h
+    secs = travel_seconds_matrix([origin] + points)
+    path, solver = solve_path(secs, start_idx=0)
+    path = path[1:]
+    total = int(sum(secs[a, b] for a, b in zip([0] + path[:-1], path)))
+    return [i - 1 for i in path], total, solver
+
+# timpi de parcurs între toate punctele (secunde): Distance Matrix cu cache, altfel haversine
+async def travel_times(points: List[Tuple[float,float]]) -> List[List[int]]:
+    if GOOGLE_KEY and len(points) <= DM_MAX_POINTS:
+        try:
+            return await gmaps.cached_distance_matrix(points, points, GOOGLE_KEY)
+        except Exception as e:
+            print(f"[{now_hms()}] DistanceMatrix err: {e!r} — folosesc estimarea haversine")
+            FALLBACKS.inc("distance_matrix", "google_error")
+    else:
+        FALLBACKS.inc("distance_matrix", "too_many_points" if GOOGLE_KEY else "no_key")
+    return travel_seconds_matrix(points).tolist()
 
 # ─────────────────────────────────────────────────────────
 # Telefon – normalizare & E.164
@@ -275,37 +332,49 @@ def main_kb() -> ReplyKeyboardMarkup:
             [KeyboardButton(text="Cip"),     KeyboardButton(text="Merci")],
             [KeyboardButton(text="Fourchette"), KeyboardButton(text="TOT")],
             [KeyboardButton(text="📍 Trimite locația mea", request_location=True)],
+            [KeyboardButton(text="📌 Cele mai apropiate")],
             [KeyboardButton(text="🧭 Cale optimă"), KeyboardButton(text="🛠️ Mentenanta")],
         ],
         resize_keyboard=True,
         is_persistent=True
     )
 
-def page_kb(brand_code: str, page: int) -> InlineKeyboardMarkup:
+def brand_pages(brand_code: str) -> Tuple[np.ndarray, int]:
+    """Numerele existente ale brandului (fără goluri) și în câte pagini încap."""
     _, _, lo, hi = BRANDS[brand_code]
-    max_num = MAX_BY_BRAND.get(brand_code, hi)
-    start = lo + (page-1)*PER_PAGE
-    end   = min(max_num, hi, start + PER_PAGE - 1)
-    if start > end:
-        start = max(lo, hi - PER_PAGE + 1)
-        end   = min(max_num, hi)
+    nums = catalog().numbers_in(brand_code, lo, hi)
+    return nums, max(1, -(-len(nums) // PER_PAGE))
+
+def clamp_page(brand_code: str, page: int) -> int:
+    return min(max(1, page), brand_pages(brand_code)[1])
+
+def page_kb(brand_code: str, page: int) -> InlineKeyboardMarkup:
+    """Pagina `page` (adusă în intervalul valid) din numerele brandului; gata randată, din cache."""
+    cat = catalog()
+    nums, pages = brand_pages(brand_code)
+    page = min(max(1, page), pages)
+    key = ("page", brand_code, page)
+    kb_cached = cat.derived.get(key)
+    if kb_cached is not None:
+        return kb_cached
 
     kb = InlineKeyboardBuilder()
     row: List[InlineKeyboardButton] = []
-    for n in range(start, end+1):
+    for n in nums[(page-1)*PER_PAGE : page*PER_PAGE].tolist():
         row.append(InlineKeyboardButton(text=str(n), callback_data=f"i:{brand_code}:{n}"))
         if len(row) == BUTTONS_PER_ROW:
             kb.row(*row); row = []
     if row: kb.row(*row)
 
     nav = []
-    if start > lo:
+    if page > 1:
         nav.append(InlineKeyboardButton(text="◀️ Înapoi",  callback_data=f"p:{brand_code}:{page-1}"))
-    if end < min(max_num, hi):
+    if page < pages:
         nav.append(InlineKeyboardButton(text="▶️ Înainte", callback_data=f"p:{brand_code}:{page+1}"))
     if nav: kb.row(*nav)
     kb.row(InlineKeyboardButton(text="🏠 Revino la meniu", callback_data="home"))
-    return kb.as_markup()
+    cat.derived[key] = kb.as_markup()
+    return cat.derived[key]
 
 def links_kb_single(lat: float, lon: float, call_cb: Optional[str] = None) -> InlineKeyboardMarkup:
     rows = [
@@ -356,53 +425,63 @@ async def show_item(message: Message, brand_code: str, n: int):
         await message.answer(f"{name} are intervalul {lo}..{hi}. Ai cerut {n}.", reply_markup=main_kb())
         return
 
-    data = DATA_BY_BRAND.get(brand_code, {})
-    item = data.get(str(n))
-    if not item:
+    cat = catalog()
+    i = cat.id_of(brand_code, n)
+    if i is None:
         await message.answer(f"Nu am găsit {name} {n} în baza de date.", reply_markup=main_kb())
         return
 
-    address = item.get("address", "—")
-    lat = float(item.get("lat") or 0)
-    lon = float(item.get("lon") or 0)
-    hours = item.get("hours", {}) or {}
-    tkey = today_key()
-    today_txt = hours.get(tkey, "")
-    opened = "🟢 Deschis acum" if (today_txt and is_open_now(today_txt)) else "🔴 Închis acum"
+    text, markup = item_text(cat, i, dt.datetime.now(TZ), session_loc(await SESSIONS.get(message.from_user.id)))
+    await message.answer(text, reply_markup=markup)
+    lat, lon = cat.point(i)
+    if lat and lon:
+        await message.answer_location(latitude=lat, longitude=lon, reply_markup=main_kb())
+
+def item_text(cat: Catalog, i: int, now: dt.datetime,
+              loc: Optional[Tuple[float, float]]) -> Tuple[str, InlineKeyboardMarkup]:
+    """Fișa completă: partea statică din store_card + statusul la `now` și distanța față de `loc`."""
+    head, tail, markup = store_card(cat, i)
+    lat, lon = cat.point(i)
+    today_txt = cat.hours_table[cat.hours_id[i]][now.weekday()]
+    opened = "🟢 Deschis acum" if cat.schedules.is_open(i, minute_of_week(now)) else "🔴 Închis acum"
 
     dist_line = "📏 Distanță: — (apasă „📍 Trimite locația mea”)"
-    if message.from_user.id in user_location and lat and lon:
-        u_lat, u_lon = user_location[message.from_user.id]
+    if loc and lat and lon:
+        u_lat, u_lon = loc
         km = haversine_km(u_lat, u_lon, lat, lon)
         dist_line = f"📏 Distanță: ~{km:.2f} km"
 
+    return f"{head}{dist_line}\n\n{opened}\n🕒 Program (azi: {today_txt or '—'})\n\n{tail}", markup
+
+def store_card(cat: Catalog, i: int) -> Tuple[str, str, InlineKeyboardMarkup]:
+    """Părțile statice ale fișei (antet, program + manager, tastatură), din cache.
+    Statusul „deschis acum”, linia de azi și distanța se completează la fiecare afișare."""
+    code, n = cat.brand_of(i), int(cat.number[i])
+    key = ("card", code, n)
+    card = cat.derived.get(key)
+    if card is not None:
+        return card
+    item = cat.store(i)
     # --- Manager info (nume + telefon) ---
-    m_name = item.get("manager_name") or item.get("manager") or ""
-    m_phone_raw = item.get("manager_phone") or ""
-    m_phone_disp = phone_digits(m_phone_raw)  # pentru afișare
-    m_phone_e164 = phone_e164_md(m_phone_raw) # pentru contact
+    m_phone_disp = phone_digits(item.manager_phone)  # pentru afișare
+    m_phone_e164 = phone_e164_md(item.manager_phone) # pentru contact
 
     manager_block = ""
     call_cb = None
-    if m_name or m_phone_disp:
-        manager_block = "\n\n👤 Manager: " + (m_name or "—")
+    if item.manager_name or m_phone_disp:
+        manager_block = "\n\n👤 Manager: " + (item.manager_name or "—")
         manager_block += "\n📞 Telefon: " + (m_phone_disp or "—")
         if m_phone_e164:
-            call_cb = f"call:{brand_code}:{n}"
-
-    text = (
-        f"🏪 {name} {n}\n"
-        f"📍 {address}\n"
-        f"📌 Coordonate: {lat:.6f}, {lon:.6f}\n"
-        f"{dist_line}\n\n"
-        f"{opened}\n"
-        f"🕒 Program (azi: {today_txt or '—'})\n\n"
-        f"{format_hours(hours)}"
-        f"{manager_block}"
+            call_cb = f"call:{code}:{n}"
+
+    head = (
+        f"🏪 {BRANDS[code][0]} {n}\n"
+        f"📍 {item.address or '—'}\n"
+        f"📌 Coordonate: {item.lat:.6f}, {item.lon:.6f}\n"
     )
-    await message.answer(text, reply_markup=links_kb_single(lat, lon, call_cb=call_cb))
-    if lat and lon:
-        await message.answer_location(latitude=lat, longitude=lon, reply_markup=main_kb())
+    tail = f"{format_hours(item.hours)}{manager_block}"
+    card = cat.derived[key] = (head, tail, links_kb_single(item.lat, item.lon, call_cb=call_cb))
+    return card
 
 @router.message(CommandStart())
 async def start(message: Message):
@@ -410,6 +489,8 @@ async def start(message: Message):
     await message.answer(
         "Salut! Alege un lanț sau scrie coduri (ex: l5, f120, fo70).\n"
         "Poți trimite locația pentru distanțe și rute.\n"
+        "„📌 Cele mai apropiate” sau /aproape [lanț] [k] [deschise] arată magazinele din jur.\n"
+        "/echipe takeit fructe l5 c30 … împarte opririle între tehnicieni.\n"
         "Butonul „🛠️ Mentenanta” deschide locațiile speciale (Acasă / Depozite).",
         reply_markup=main_kb()
     )
@@ -423,7 +504,7 @@ async def cb_home(cb: CallbackQuery):
 # Salvează locația
 @router.message(F.location)
 async def set_location(message: Message):
-    user_location[message.from_user.id] = (message.location.latitude, message.location.longitude)
+    SESSIONS.set(message.from_user.id, loc=(message.location.latitude, message.location.longitude))
     await message.answer("✅ Locație salvată!", reply_markup=main_kb())
 
 # Alegere brand din butoane
@@ -432,48 +513,150 @@ def _is_brand_text(text: str, target: str) -> bool:
 
 @router.message(F.text.func(lambda t: _is_brand_text(t, "linella")))
 async def pick_linella(message: Message):
-    user_brand[message.from_user.id] = "l"
+    SESSIONS.set(message.from_user.id, brand="l")
     await message.answer("Lista Linella – pagina 1:", reply_markup=ReplyKeyboardRemove())
     await message.answer("Alege un număr:", reply_markup=page_kb("l", 1))
 
 @router.message(F.text.func(lambda t: _is_brand_text(t, "fidesco")))
 async def pick_fidesco(message: Message):
-    user_brand[message.from_user.id] = "f"
+    SESSIONS.set(message.from_user.id, brand="f")
     await message.answer("Lista Fidesco – pagina 1:", reply_markup=ReplyKeyboardRemove())
     await message.answer("Alege un număr:", reply_markup=page_kb("f", 1))
 
 @router.message(F.text.func(lambda t: _is_brand_text(t, "cip")))
 async def pick_cip(message: Message):
-    user_brand[message.from_user.id] = "c"
+    SESSIONS.set(message.from_user.id, brand="c")
     await message.answer("Lista Cip – pagina 1:", reply_markup=ReplyKeyboardRemove())
     await message.answer("Alege un număr:", reply_markup=page_kb("c", 1))
 
 @router.message(F.text.func(lambda t: _is_brand_text(t, "merci")))
 async def pick_merci(message: Message):
-    user_brand[message.from_user.id] = "m"
+    SESSIONS.set(message.from_user.id, brand="m")
     await message.answer("Lista Merci – pagina 1:", reply_markup=ReplyKeyboardRemove())
     await message.answer("Alege un număr:", reply_markup=page_kb("m", 1))
 
 @router.message(F.text.func(lambda t: _is_brand_text(t, "fourchette")))
 async def pick_fourchette(message: Message):
-    user_brand[message.from_user.id] = "fo"
+    SESSIONS.set(message.from_user.id, brand="fo")
     await message.answer("Lista Fourchette – pagina 1:", reply_markup=ReplyKeyboardRemove())
     await message.answer("Alege un număr:", reply_markup=page_kb("fo", 1))
 
 @router.message(F.text.func(lambda t: _is_brand_text(t, "tot")))
 async def pick_tot(message: Message):
-    user_brand[message.from_user.id] = "t"
+    SESSIONS.set(message.from_user.id, brand="t")
     await message.answer("Lista TOT – pagina 1:", reply_markup=ReplyKeyboardRemove())
     await message.answer("Alege un număr:", reply_markup=page_kb("t", 1))
 
+# Cele mai apropiate magazine (toate lanțurile sau doar unul)
+def nearest_kb(stores: List[Tuple[str, int]]) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    row: List[InlineKeyboardButton] = []
+    for code, n in stores:
+        row.append(InlineKeyboardButton(text=f"{code}{n}", callback_data=f"i:{code}:{n}"))
+        if len(row) == BUTTONS_PER_ROW:
+            kb.row(*row); row = []
+    if row: kb.row(*row)
+    kb.row(InlineKeyboardButton(text="🏠 Revino la meniu", callback_data="home"))
+    return kb.as_markup()
+
+async def send_nearest(message: Message, user_id: int, brand_code: Optional[str], k: int,
+                       only_open: bool = False):
+    loc = session_loc(await SESSIONS.get(user_id))
+    if not loc:
+        await message.answer("Trimite mai întâi locația (butonul „📍 Trimite locația mea”).", reply_markup=main_kb())
+        return
+    cat = catalog()
+    hits = cat.index.nearest(loc[0], loc[1], k=k, brands=[brand_code] if brand_code else None,
+                             allow=open_now_mask(cat) if only_open else None)
+    if not hits:
+        await message.answer("Nu am găsit magazine deschise acum." if only_open
+                             else "Nu am găsit magazine cu coordonate.", reply_markup=main_kb())
+        return
+    scope = BRANDS[brand_code][0] if brand_code else "toate lanțurile"
+    if only_open:
+        scope += ", deschise acum"
+    lines, stores = [], []
+    for j, (km, i) in enumerate(hits, 1):
+        code, n = cat.brand_of(i), int(cat.number[i])
+        stores.append((code, n))
+        lines.append(f"{j}. {BRANDS[code][0]} {n} – ~{km:.2f} km\n    {cat.address[i] or '—'}")
+    await message.answer(f"📌 Cele mai apropiate ({scope}):\n\n" + "\n".join(lines),
+                         reply_markup=nearest_kb(stores))
+
+@router.message(F.text == "📌 Cele mai apropiate")
+async def nearest_button(message: Message):
+    await send_nearest(message, message.from_user.id, None, NEAR_DEFAULT_K)
+
+# /aproape [lanț] [k] [deschise]  (ex: /aproape, /aproape l, /aproape fo 3 deschise)
+@router.message(Command("aproape"))
+async def nearest_cmd(message: Message, command: CommandObject):
+    brand_code: Optional[str] = None
+    k = NEAR_DEFAULT_K
+    only_open = False
+    for tok in (command.args or "").split():
+        if tok.isdigit():
+            k = max(1, min(int(tok), NEAR_MAX_K))
+            continue
+        if tok.lower() in ("deschise", "deschis", "open"):
+            only_open = True
+            continue
+        brand_code = normalize_brand(tok)
+        if not brand_code:
+            await message.answer("Exemple: /aproape, /aproape l, /aproape fo 3, /aproape deschise.",
+                                 reply_markup=main_kb())
+            return
+    await send_nearest(message, message.from_user.id, brand_code, k, only_open)
+
+# Rute pe echipe: /echipe takeit fructe l5 l7 c30 ... (un depou per tehnician, se pot repeta)
+@router.message(Command("echipe"))
+async def split_team_routes(message: Message, command: CommandObject):
+    techs: List[str] = []
+    rest: List[str] = []
+    for tok in re.split(r"[,\s;|]+", (command.args or "").strip()):
+        if not tok: continue
+        k = depot_key(tok)
+        if k: techs.append(k)
+        else: rest.append(tok)
+    pairs = parse_codes_line(" ".join(rest))
+    if not techs or not pairs:
+        depots = ", ".join(DEPOTS)
+        await message.answer(f"Exemplu: /echipe takeit fructe l5 l7 c30 fo70\nDepouri: {depots}", reply_markup=main_kb())
+        return
+
+    pts: List[Tuple[float,float]] = [(DEPOTS[k][1], DEPOTS[k][2]) for k in techs]
+    titles: List[str] = [DEPOTS[k][0] for k in techs]
+    cat = catalog()
+    for i in cat.lookup(dict.fromkeys(pairs)):
+        pts.append(cat.point(i))
+        titles.append(f"{BRANDS[cat.brand_of(i)][0]} {cat.number[i]} – {cat.address[i]}")
+    if len(pts) == len(techs):
+        await message.answer("Nu am putut găsi punctele. Verifică codurile (ex: l5 c30 fo70).", reply_markup=main_kb())
+        return
+
+    mat = await travel_times(pts)
+    service_s = ROUTE_SERVICE_MIN*60
+    routes = split_routes(mat, list(range(len(techs))), list(range(len(techs), len(pts))), service_s=service_s)
+    print(f"[{now_hms()}] ECHIPE {user_tag(message.from_user)} -> {len(pts)-len(techs)} puncte, {len(techs)} tehnicieni")
+    for r, path in enumerate(routes, 1):
+        mins = round(route_cost(mat, path, service_s)/60)
+        if len(path) == 1:
+            await message.answer(f"👷 Tehnician {r} ({titles[path[0]]}): fără opriri.")
+            continue
+        body = "\n".join(f"{i}. {titles[x]}" for i, x in enumerate(path[1:], 1))
+        await message.answer(
+            f"👷 Tehnician {r} — start {titles[path[0]]}\nDurată estimată: ~{mins}m (cu {ROUTE_SERVICE_MIN} min/oprire)\n\n{body}",
+            reply_markup=links_kb_route(pts[path[0]], [pts[x] for x in path[1:]]))
+    await message.answer("✅ Rute împărțite.", reply_markup=main_kb())
+
 # Paginare & element
 @router.callback_query(F.data.startswith("p:"))
 async def cb_page(cb: CallbackQuery):
     _, code, p = cb.data.split(":")
     await cb.answer()
     name = BRANDS[code][0]
-    await cb.message.edit_text(f"Lista {name} – pagina {p}:")
-    await cb.message.edit_reply_markup(reply_markup=page_kb(code, int(p)))
+    page = clamp_page(code, int(p))
+    await cb.message.edit_text(f"Lista {name} – pagina {page}:")
+    await cb.message.edit_reply_markup(reply_markup=page_kb(code, page))
 
 @router.callback_query(F.data.startswith("i:"))
 async def cb_item(cb: CallbackQuery):
@@ -488,13 +671,13 @@ async def prefixed(message: Message):
     if not p:
         await message.answer("Exemple: l10, f105, c7, m3, fo70, t75."); return
     code, num = p
-    user_brand[message.from_user.id] = code
+    SESSIONS.set(message.from_user.id, brand=code)
     await show_item(message, code, num)
 
 # Număr simplu => folosește brandul curent (default Linella)
 @router.message(F.text.regexp(r"^\s*\d{1,3}\s*$"))
 async def only_number(message: Message):
-    code = user_brand.get(message.from_user.id, "l")
+    code = (await SESSIONS.get(message.from_user.id)).get("brand", "l")
     await show_item(message, code, int(message.text.strip()))
 
 # Cale optimă
@@ -504,6 +687,10 @@ async def ask_route_mode(message: Message):
         InlineKeyboardButton(text="📍 De la locația mea", callback_data="route:loc"),
     ],[
         InlineKeyboardButton(text="🚩 De la primul magazin", callback_data="route:first"),
+    ],[
+        InlineKeyboardButton(text="🕒 De la locația mea, cu program", callback_data="route:loc:tw"),
+    ],[
+        InlineKeyboardButton(text="🕒 De la primul magazin, cu program", callback_data="route:first:tw"),
     ],[
         InlineKeyboardButton(text="🏠 Revino la meniu", callback_data="home")
     ]])
@@ -511,9 +698,9 @@ async def ask_route_mode(message: Message):
 
 @router.callback_query(F.data == "route:loc")
 async def route_from_location(cb: CallbackQuery):
-    user_route_mode[cb.from_user.id] = "loc"
+    SESSIONS.set(cb.from_user.id, route_mode="loc", route_tw=False)
     await cb.answer()
-    loc = user_location.get(cb.from_user.id)
+    loc = session_loc(await SESSIONS.get(cb.from_user.id))
     if loc:
         await cb.message.answer(f"📍 Origine: {loc[0]:.6f}, {loc[1]:.6f}\nTrimite lista (ex: l5 c30 fo70).", reply_markup=ReplyKeyboardRemove())
     else:
@@ -521,28 +708,38 @@ async def route_from_location(cb: CallbackQuery):
 
 @router.callback_query(F.data == "route:first")
 async def route_from_first(cb: CallbackQuery):
-    user_route_mode[cb.from_user.id] = "first"
+    SESSIONS.set(cb.from_user.id, route_mode="first", route_tw=False)
     await cb.answer()
     await cb.message.answer("Trimite lista de magazine (ex: l5 c30 fo70). Originea va fi **primul magazin** din listă.", reply_markup=ReplyKeyboardRemove())
 
+@router.callback_query(F.data.in_({"route:loc:tw", "route:first:tw"}))
+async def route_with_hours_mode(cb: CallbackQuery):
+    mode = cb.data.split(":")[1]
+    SESSIONS.set(cb.from_user.id, route_mode=mode, route_tw=True)
+    await cb.answer()
+    origin_txt = "locația ta" if mode == "loc" else "primul magazin din listă"
+    await cb.message.answer(
+        f"Trimite lista de magazine (ex: l5 c30 fo70). Originea va fi {origin_txt}.\n"
+        f"Plecare acum; magazinele închise la sosire sunt reordonate sau scoase "
+        f"(~{ROUTE_SERVICE_MIN} min la fiecare, aștept maxim {ROUTE_MAX_WAIT_MIN} min la deschidere).",
+        reply_markup=ReplyKeyboardRemove())
+
 @router.message(F.text.regexp(r"(?i)(?:^| )([a-z]{1,10}\s*\d{1,3})(?:[ ,;|]+[a-z]{1,10}\s*\d{1,3})+"))
 async def route_codes(message: Message):
     print(f"[{now_hms()}] MSG {user_tag(message.from_user)} -> {message.text!r}")
-    pairs = parse_codes_line(message.text)
+    with span("parse_codes_line"):
+        pairs = parse_codes_line(message.text)
     if not pairs:
         await message.answer("Format invalid. Exemplu: l5 c30 fo70", reply_markup=main_kb()); return
 
     pts: List[Tuple[float,float]] = []
     titles: List[str] = []
-    for code, num in pairs:
-        d = DATA_BY_BRAND.get(code, {}).get(str(num))
-        if not d: continue
-        lat, lon = float(d.get("lat") or 0), float(d.get("lon") or 0)
-        if not lat or not lon: continue
-        name = BRANDS[code][0]
-        address = d.get("address") or ""
-        titles.append(f"{name} {num} – {address}")
-        pts.append((lat, lon))
+    cat = catalog()
+    with span("lookup", f"{len(pairs)} coduri"):
+        ids = cat.lookup(pairs)
+        for i in ids:
+            titles.append(f"{BRANDS[cat.brand_of(i)][0]} {cat.number[i]} – {cat.address[i]}")
+            pts.append(cat.point(i))
 
     if len(pts) < 2:
         if pts:
@@ -553,9 +750,10 @@ async def route_codes(message: Message):
             await message.answer("Nu am putut găsi punctele. Verifică codurile (ex: l5 c30 fo70).", reply_markup=main_kb())
         return
 
-    mode = user_route_mode.get(message.from_user.id, "first")
+    sess = await SESSIONS.get(message.from_user.id)
+    mode = sess.get("route_mode", "first")
     if mode == "loc":
-        origin = user_location.get(message.from_user.id)
+        origin = session_loc(sess)
         if not origin:
             await message.answer("Trimite mai întâi locația (butonul „📍 Trimite locația mea”).", reply_markup=main_kb()); return
         points = pts[:]
@@ -563,7 +761,16 @@ async def route_codes(message: Message):
         origin = pts[0]
         points = pts[1:]
 
-    order, total_sec = await directions_optimize(origin, points)
+    if sess.get("route_tw"):
+        off = 0 if mode == "loc" else 1
+        await route_with_hours(message, origin, points, titles[off:],
+                               [cat.schedules.intervals(i) for i in ids[off:]],
+                               first_title=None if mode == "loc" else titles[0])
+        return
+
+    with span("directions_optimize", f"{len(points)} puncte"):
+        order, total_sec, solver = await directions_optimize(origin, points)
+    print(f"[{now_hms()}] ROUTE {user_tag(message.from_user)} -> {len(points)} puncte, solver={solver}")
 
     ordered_pts: List[Tuple[float,float]] = []
     ordered_titles: List[str] = []
@@ -585,6 +792,42 @@ async def route_codes(message: Message):
     lat, lon = ordered_pts[-1]
     await message.answer_location(latitude=lat, longitude=lon, reply_markup=main_kb())
 
+# Rută cu program: plecare acum, opririle închise la sosire sunt reordonate/scoase
+async def route_with_hours(message: Message, origin: Tuple[float,float],
+                           points: List[Tuple[float,float]], titles: List[str],
+                           intervals: List[Optional[List[Tuple[int, int]]]], first_title: Optional[str]):
+    depart = dt.datetime.now(TZ)
+    with span("travel_times", f"{len(points) + 1} puncte"):
+        mat = await travel_times([origin] + points)
+    with span("plan_time_windows"):
+        hint, solver = solve_path(mat, start_idx=0)
+        wins = [None] + [relative_windows(iv, depart) for iv in intervals]
+        order, starts, dropped = plan_time_windows(mat, wins, hint,
+                                                   service_s=ROUTE_SERVICE_MIN*60,
+                                                   max_wait_s=ROUTE_MAX_WAIT_MIN*60)
+    print(f"[{now_hms()}] ROUTE+PROGRAM {user_tag(message.from_user)} -> {len(points)} puncte, "
+          f"solver={solver}, scoase={len(dropped)}")
+
+    if not order:
+        await message.answer("⛔ Niciun magazin din listă nu e deschis la ora la care ai ajunge.", reply_markup=main_kb())
+        return
+    lines: List[str] = []
+    ordered_pts: List[Tuple[float,float]] = []
+    if first_title:
+        lines.append(f"🚩 {depart:%H:%M} {first_title}")
+        ordered_pts.append(origin)
+    for x, s in zip(order, starts):
+        lines.append(f"🕒 {depart + dt.timedelta(seconds=s):%H:%M} {titles[x-1]}")
+        ordered_pts.append(points[x-1])
+    finish = depart + dt.timedelta(seconds=starts[-1] + ROUTE_SERVICE_MIN*60)
+    head = f"🚦 Rută cu program (plecare {depart:%H:%M}):\nFinal estimat: ~{finish:%H:%M}\n\n"
+    body = "\n".join(f"{i}. {t}" for i, t in enumerate(lines, 1))
+    if dropped:
+        body += "\n\n⛔ Închise la sosire (scoase din rută):\n" + "\n".join(f"• {titles[x-1]}" for x in dropped)
+    await message.answer(head + body, reply_markup=links_kb_route(None if first_title else origin, ordered_pts))
+    lat, lon = ordered_pts[-1]
+    await message.answer_location(latitude=lat, longitude=lon, reply_markup=main_kb())
+
 # ───── Mentenanță: meniu + acțiuni ───────────────────────
 @router.message(F.text == "🛠️ Mentenanta")
 async def open_maintenance(message: Message):
@@ -595,12 +838,11 @@ async def open_maintenance(message: Message):
     )
 
 async def _send_loc_with_links(msg_target, title: str, lat: float, lon: float):
-    text = (
-        f"📍 {title}\n"
-        f"📌 Coordonate: {lat:.6f}, {lon:.6f}"
-    )
-    await msg_target.answer(text, reply_markup=links_kb_single(lat, lon))
-    await msg_target.answer_location(latitude=lat, longitude=lon, reply_markup=main_kb())
+    # un singur mesaj „venue” (pin + titlu + coordonate + linkuri) în loc de text + locație;
+    # meniul principal e deja afișat (Mentenanța se deschide din el)
+    await msg_target.answer_venue(latitude=lat, longitude=lon, title=f"📍 {title}",
+                                  address=f"📌 Coordonate: {lat:.6f}, {lon:.6f}",
+                                  reply_markup=links_kb_single(lat, lon))
 
 @router.callback_query(F.data.startswith("maint:"))
 async def maintenance_actions(cb: CallbackQuery):
@@ -627,9 +869,9 @@ async def cb_call_manager(cb: CallbackQuery):
         await cb.answer("Eroare format.", show_alert=True)
         return
 
-    d = DATA_BY_BRAND.get(code, {}).get(str(n)) or {}
-    m_name = (d.get("manager_name") or d.get("manager") or "Manager")
-    m_phone_e164 = phone_e164_md(d.get("manager_phone"))
+    item = catalog().get(code, n)
+    m_name = (item.manager_name if item else "") or "Manager"
+    m_phone_e164 = phone_e164_md(item.manager_phone if item else "")
     if not m_phone_e164:
         await cb.answer("Nu există număr de telefon.", show_alert=True)
         return
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+catalog.py — toate magazinele (toate lanțurile) într-un singur catalog compact.
+
+În loc de câte un dict per magazin: un id întreg dens per magazin și
+coloane (array-uri NumPy pentru numere/coordonate, liste de șiruri
+internate pentru texte). Programul e deduplicat: majoritatea magazinelor
+au exact aceeași săptămână, deci se păstrează o singură dată. Tot aici
+se construiesc, pe aceleași id-uri, indexul spațial și tabelul de program.
+
+Snapshot binar (build): `python catalog.py` compilează toate JSON-urile
+într-un singur .npz (coloanele + un tabel de șiruri UTF-8 + programul deja
+compilat). La pornire load() folosește snapshot-ul dacă semnătura
+JSON-urilor coincide, altfel cade pe JSON și rescrie snapshot-ul.
+Un JSON lipsă sau corupt e înlocuit de perechea lui *_reserve.json.
+"""
+import os, sys, json, time, hashlib, argparse, tempfile
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from geo import StoreIndex
+from schedule import DAYS, ScheduleTable
+
+Key = Tuple[str, int]
+
+DATA_DIR = "data"
+# cod brand -> fișier (aceleași ca în bot.BRANDS)
+BRAND_FILES: Dict[str, str] = {
+    "l":  "linella_for_bot.json",
+    "f":  "fidesco_for_bot.json",
+    "c":  "cip_for_bot.json",
+    "m":  "merci_for_bot.json",
+    "fo": "fourchette_for_bot.json",
+    "t":  "tot_for_bot.json",
+}
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "catalog.npz")
+SNAPSHOT_VERSION = 2
+
+class Store(NamedTuple):
+    """Vedere asupra unui rând din catalog (ce folosesc handler-ele botului)."""
+    id: int
+    brand: str
+    number: int
+    address: str
+    lat: float
+    lon: float
+    hours: Dict[str, str]
+    manager_name: str
+    manager_phone: str
+    manager_email: str
+
+def _s(v: Any) -> str:
+    return sys.intern(str(v)) if v not in (None, "") else ""
+
+class Catalog:
+    def __init__(self):
+        self.brand_codes: List[str] = []            # index brand -> cod
+        self._brand_ix: Dict[str, int] = {}
+        self.ids: Dict[Key, int] = {}               # (brand, număr) -> id
+        # coloane (liste cât se încarcă, array-uri după freeze)
+        self.brand: Any = []; self.number: Any = []
+        self.lat: Any = []; self.lon: Any = []
+        self.hours_id: Any = []
+        self.address: List[str] = []
+        self.manager_name: List[str] = []
+        self.manager_phone: List[str] = []
+        self.manager_email: List[str] = []
+        self.hours_table: List[Tuple[str, ...]] = []   # săptămâni distincte (mon..sun)
+        self._hours_ix: Dict[Tuple[str, ...], int] = {}
+        self.numbers_by_brand: Dict[str, np.ndarray] = {}
+        self.index: Optional[StoreIndex] = None
+        self.schedules: Optional[ScheduleTable] = None
+        self.signature = ""                             # semnătura JSON-urilor sursă
+        self.sources: Dict[str, str] = {}               # cod -> fișierul citit ("" = niciunul)
+        # date derivate ale consumatorilor (ex.: tastaturi gata randate); mor odată cu catalogul,
+        # deci o reîncărcare (catalog nou) le invalidează automat
+        self.derived: Dict[Any, Any] = {}
+
+    # ───────── Construire ─────────
+    @classmethod
+    def from_brands(cls, data_by_brand: Dict[str, Dict[str, Any]]) -> "Catalog":
+        cat = cls()
+        for code, items in data_by_brand.items():
+            cat.add_brand(code, items)
+        cat.freeze()
+        return cat
+
+    @classmethod
+    def from_json_files(cls, files: Dict[str, str]) -> "Catalog":
+        """{cod: cale json}; câte un fișier pe rând, fără să ținem dict-urile în memorie."""
+        cat = cls()
+        for code, path in files.items():
+            items, used = read_brand_file(path)
+            cat.sources[code] = used or ""
+            cat.add_brand(code, items or {})
+        cat.freeze()
+        return cat
+
+    @property
+    def missing(self) -> List[str]:
+        """Brandurile pentru care n-a putut fi citit nici fișierul, nici rezerva."""
+        return [c for c, p in self.sources.items() if not p]
+
+    def add_brand(self, code: str, items: Dict[str, Any]) -> None:
+        if code not in self._brand_ix:
+            self._brand_ix[code] = len(self.brand_codes)
+            self.brand_codes.append(code)
+        b = self._brand_ix[code]
+        for k, it in items.items():
+            if not str(k).isdigit():
+                continue
+            key = (code, int(k))
+            if key in self.ids:
+                continue
+            self.ids[key] = len(self.number)
+            self.brand.append(b); self.number.append(int(k))
+            self.lat.append(float(it.get("lat") or 0)); self.lon.append(float(it.get("lon") or 0))
+            self.address.append(_s(it.get("address")))
+            self.manager_name.append(_s(it.get("manager_name") or it.get("manager")))
+            self.manager_phone.append(_s(it.get("manager_phone")))
+            self.manager_email.append(_s(it.get("manager_email")))
+            h = it.get("hours") or {}
+            week = tuple(_s(h.get(d, "")) for d in DAYS)
+            if week not in self._hours_ix:
+                self._hours_ix[week] = len(self.hours_table)
+                self.hours_table.append(week)
+            self.hours_id.append(self._hours_ix[week])
+
+    def freeze(self, schedules: Optional[ScheduleTable] = None) -> None:
+        """Coloanele devin array-uri tipizate; se construiesc indexul și programul."""
+        self.brand = np.asarray(self.brand, dtype=np.uint8)
+        self.number = np.asarray(self.number, dtype=np.int32)
+        self.lat = np.asarray(self.lat, dtype=np.float64)
+        self.lon = np.asarray(self.lon, dtype=np.float64)
+        self.hours_id = np.asarray(self.hours_id, dtype=np.int32)
+        self.numbers_by_brand = {code: np.sort(self.number[self.brand == b])
+                                 for b, code in enumerate(self.brand_codes)}
+        sel = np.flatnonzero((self.lat != 0) & (self.lon != 0))
+        self.index = StoreIndex(self.lat[sel], self.lon[sel], self.brand[sel], self.brand_codes, ids=sel)
+        self.schedules = schedules or ScheduleTable(self.keys(), [self.hours(i) for i in range(len(self))])
+
+    # ───────── Interogări ─────────
+    def __len__(self) -> int:
+        return len(self.number)
+
+    def keys(self) -> List[Key]:
+        return list(self.ids)
+
+    def id_of(self, code: str, n: int) -> Optional[int]:
+        return self.ids.get((code, int(n)))
+
+    def brand_of(self, i: int) -> str:
+        return self.brand_codes[self.brand[i]]
+
+    def hours(self, i: int) -> Dict[str, str]:
+        return dict(zip(DAYS, self.hours_table[self.hours_id[i]]))
+
+    def point(self, i: int) -> Tuple[float, float]:
+        return float(self.lat[i]), float(self.lon[i])
+
+    def has_coords(self, i: int) -> bool:
+        return bool(self.lat[i]) and bool(self.lon[i])
+
+    def store(self, i: int) -> Store:
+        return Store(i, self.brand_of(i), int(self.number[i]), self.address[i],
+                     float(self.lat[i]), float(self.lon[i]), self.hours(i),
+                     self.manager_name[i], self.manager_phone[i], self.manager_email[i])
+
+    def get(self, code: str, n: int) -> Optional[Store]:
+        i = self.id_of(code, n)
+        return None if i is None else self.store(i)
+
+    def numbers_in(self, code: str, lo: int, hi: int) -> np.ndarray:
+        """Numerele existente ale brandului în [lo, hi], sortate."""
+        nums = self.numbers_by_brand.get(code, np.empty(0, dtype=np.int32))
+        return nums[np.searchsorted(nums, lo):np.searchsorted(nums, hi, side="right")]
+
+    def max_number(self, code: str) -> Optional[int]:
+        nums = self.numbers_by_brand.get(code)
+        return int(nums[-1]) if nums is not None and len(nums) else None
+
+    def lookup(self, pairs: Iterable[Key], with_coords: bool = True) -> List[int]:
+        """Id-urile perechilor (brand, număr) găsite, în ordinea cererii."""
+        out = []
+        for code, n in pairs:
+            i = self.id_of(code, n)
+            if i is not None and (not with_coords or self.has_coords(i)):
+                out.append(i)
+        return out
+
+    # ───────── Snapshot binar ─────────
+    @classmethod
+    def from_snapshot(cls, path: str) -> "Catalog":
+        with np.load(path, allow_pickle=False) as z:
+            if int(z["version"]) != SNAPSHOT_VERSION:
+                raise ValueError(f"snapshot v{int(z['version'])}, aștept v{SNAPSHOT_VERSION}")
+            blob = z["str_blob"].tobytes(); offs = z["str_offs"].tolist()
+            strings = [sys.intern(blob[a:b].decode("utf-8")) for a, b in zip(offs[:-1], offs[1:])]
+            cols = {k: z[k] for k in z.files}
+        cat = cls()
+        cat.brand_codes = [strings[i] for i in cols["brand_codes"].tolist()]
+        cat._brand_ix = {c: b for b, c in enumerate(cat.brand_codes)}
+        cat.brand, cat.number = cols["brand"], cols["number"]
+        cat.lat, cat.lon, cat.hours_id = cols["lat"], cols["lon"], cols["hours_id"]
+        for name in ("address", "manager_name", "manager_phone", "manager_email"):
+            setattr(cat, name, [strings[i] for i in cols[name].tolist()])
+        cat.hours_table = [tuple(strings[i] for i in row) for row in cols["hours_table"].tolist()]
+        cat._hours_ix = {w: i for i, w in enumerate(cat.hours_table)}
+        codes = cat.brand_codes
+        cat.ids = {(codes[b], n): i for i, (b, n) in enumerate(zip(cat.brand.tolist(), cat.number.tolist()))}
+        cat.signature = bytes(cols["signature"]).decode("ascii")
+        cat.sources = dict(zip(cat.brand_codes, (strings[i] for i in cols["sources"].tolist())))
+        cat.freeze(ScheduleTable.from_arrays(cat.keys(), cols["sched_starts"], cols["sched_ends"],
+                                             cols["sched_offs"], cols["sched_unknown"]))
+        return cat
+
+    def save_snapshot(self, path: str) -> None:
+        """Scrie atomic (fișier temporar + rename): cititorii nu văd niciodată un snapshot pe jumătate."""
+        table: Dict[str, int] = {}
+        def ix(items: Iterable[str]) -> np.ndarray:
+            return np.array([table.setdefault(x, len(table)) for x in items], dtype=np.int32)
+        cols = {
+            "brand_codes": ix(self.brand_codes),
+            "sources": ix(self.sources.get(c, "") for c in self.brand_codes),
+            "address": ix(self.address),
+            "manager_name": ix(self.manager_name),
+            "manager_phone": ix(self.manager_phone),
+            "manager_email": ix(self.manager_email),
+            "hours_table": ix(x for w in self.hours_table for x in w).reshape(-1, len(DAYS)),
+        }
+        enc = [x.encode("utf-8") for x in table]
+        offs = np.zeros(len(enc) + 1, dtype=np.int64)
+        offs[1:] = np.cumsum([len(b) for b in enc])
+        sch = self.schedules
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        # nume temporar unic: doi scriitori (workeri, watcher-ul de reload) nu-și amestecă fișierele
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=d or ".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, version=np.int32(SNAPSHOT_VERSION),
+                         signature=np.frombuffer(self.signature.encode("ascii"), dtype=np.uint8),
+                         str_blob=np.frombuffer(b"".join(enc), dtype=np.uint8), str_offs=offs,
+                         brand=self.brand, number=self.number, lat=self.lat, lon=self.lon, hours_id=self.hours_id,
+                         sched_starts=sch.starts, sched_ends=sch.ends, sched_offs=sch.offs, sched_unknown=sch.unknown,
+                         **cols)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+def reserve_path(path: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}_reserve{ext}"
+
+def read_brand_file(path: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """(date, fișierul folosit): întâi path, apoi *_reserve.json; (None, None) dacă niciunul nu merge."""
+    for p in (path, reserve_path(path)):
+        if not os.path.exists(p):
+            continue
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                d = json.load(f)
+            if not isinstance(d, dict):
+                raise ValueError("nu e un obiect JSON")
+        except (OSError, ValueError) as e:
+            print(f"[WARN] {p} ilizibil: {e!r}")
+            continue
+        if p != path:
+            print(f"[WARN] {path} lipsă/corupt — folosesc {p}")
+        return d, p
+    print(f"[WARN] Lipsește {path} (și rezerva)")
+    return None, None
+
+def files_stamp(files: Dict[str, str]) -> Tuple[Tuple[str, int, int], ...]:
+    """(cale, mtime_ns, mărime) pentru fișiere + rezerve — verificare ieftină de schimbare."""
+    out = []
+    for path in sorted(files.values()):
+        for p in (path, reserve_path(path)):
+            try:
+                st = os.stat(p)
+                out.append((p, st.st_mtime_ns, st.st_size))
+            except OSError:
+                out.append((p, -1, -1))
+    return tuple(out)
+
+def default_files(data_dir: str = DATA_DIR) -> Dict[str, str]:
+    return {code: os.path.join(data_dir, fname) for code, fname in BRAND_FILES.items()}
+
+def sources_signature(files: Dict[str, str]) -> str:
+    """Hash peste conținutul JSON-urilor și al rezervelor (un fișier lipsă contează și el)."""
+    h = hashlib.blake2b(digest_size=16)
+    for code, path in sorted(files.items()):
+        for p in (path, reserve_path(path)):
+            h.update(f"{code}\0{os.path.basename(p)}\0".encode())
+            try:
+                with open(p, "rb") as f:
+                    h.update(f.read())
+            except OSError:
+                h.update(b"<missing>")
+    return h.hexdigest()
+
+def load(files: Dict[str, str], snapshot_path: Optional[str] = SNAPSHOT_PATH) -> Tuple[Catalog, str]:
+    """(catalog, sursa): „snapshot” dacă e la zi, altfel „json” (și snapshot-ul se rescrie)."""
+    sig = sources_signature(files)
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            cat = Catalog.from_snapshot(snapshot_path)
+            if cat.signature == sig:
+                return cat, "snapshot"
+            print(f"[catalog] {snapshot_path} e vechi față de JSON — reconstruiesc")
+        except Exception as e:          # trunchiat/corupt (BadZipFile, EOFError, ...) → reconstruim din JSON
+            print(f"[WARN] snapshot {snapshot_path} ilizibil: {e!r}")
+    cat = Catalog.from_json_files(files)
+    cat.signature = sig
+    if snapshot_path:
+        try:
+            cat.save_snapshot(snapshot_path)
+        except OSError as e:
+            print(f"[WARN] nu pot scrie {snapshot_path}: {e!r}")
+    return cat, "json"
+
+# ───────── CLI (pasul de build) ─────────
+def main():
+    ap = argparse.ArgumentParser(description="Compilează *_for_bot.json într-un snapshot binar pentru bot.")
+    ap.add_argument("--data-dir", default=DATA_DIR)
+    ap.add_argument("--out", default=None, help=f"implicit: <data-dir>/{os.path.basename(SNAPSHOT_PATH)}")
+    ap.add_argument("--bench", action="store_true", help="compară timpul de încărcare JSON vs snapshot")
+    args = ap.parse_args()
+    files = default_files(args.data_dir)
+    out = args.out or os.path.join(args.data_dir, os.path.basename(SNAPSHOT_PATH))
+
+    t0 = time.perf_counter()
+    cat = Catalog.from_json_files(files)
+    cat.signature = sources_signature(files)
+    t_json = time.perf_counter() - t0
+    cat.save_snapshot(out)
+    print(f"✅ {out}: {len(cat)} magazine, {len(cat.hours_table)} programe distincte, "
+          f"{os.path.getsize(out)/1024:.0f} KB")
+    if args.bench:
+        reps = 20
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            Catalog.from_json_files(files)
+        t_json = (time.perf_counter() - t0) / reps
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            Catalog.from_snapshot(out)
+        t_snap = (time.perf_counter() - t0) / reps
+        print(f"⏱  JSON: {t_json*1000:.1f} ms | snapshot: {t_snap*1000:.1f} ms | ×{t_json/max(t_snap, 1e-9):.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,36 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, sys, time, re, pandas as pd, requests
+import os, sys, time, re, asyncio, pandas as pd, requests
+from typing import Optional
+import aiohttp
 from dotenv import load_dotenv
 
+from gmaps import GOOGLE_API_BASE, new_session
+from ratelimit import TokenBucket
+from sqlite_cache import SQLiteCache, open_cache
+
 # ───────────────────── Config ─────────────────────
 load_dotenv()
 API_KEY   = os.getenv("GOOGLE_API_KEY")
-SEARCH_URL  = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+SEARCH_URL  = GOOGLE_API_BASE + "/maps/api/place/textsearch/json"
+DETAILS_URL = GOOGLE_API_BASE + "/maps/api/place/details/json"
 
 LANG = "ro"
 REGION = "md"
 SLEEP = 1.0                 # crește la 1.2 dacă vezi OVER_QUERY_LIMIT
 BATCH_SAVE_EVERY = 10       # salvează la fiecare N rânduri
 
+# --async: rânduri în paralel, ritm comun în loc de SLEEP
+PLACES_QPS = float(os.getenv("PLACES_QPS", "8"))                 # sub cota Places per proiect
+PLACES_CONCURRENCY = int(os.getenv("PLACES_CONCURRENCY", "8"))   # rânduri în lucru simultan
+PLACES_MAX_RETRIES = 5
+
+# Răspunsuri Places pe disc (interogare normalizată / place_id): PLACES_CACHE="" îl dezactivează
+PLACES_CACHE = os.getenv("PLACES_CACHE", os.path.join("data", "places_cache.sqlite3"))
+PLACES_CACHE_TTL_DAYS = float(os.getenv("PLACES_CACHE_TTL_DAYS", "30"))
+CACHEABLE = {"OK", "ZERO_RESULTS"}      # OVER_QUERY_LIMIT, REQUEST_DENIED etc. nu se păstrează
+
 CITY_CENTER = {
     "Chișinău": (47.0105, 28.8638),
     "Bălți": (47.753, 27.919), "Cahul": (45.904, 28.194),
@@ -93,25 +109,63 @@ def normalize_address(address: str):
     base = f"{street} {nr}".strip()
     return city, base
 
+# ──────────────── Cache Places ────────────────
+CACHE: Optional[SQLiteCache] = None       # deschis în main()
+CACHE_STATS = {"hit": 0, "miss": 0}
+
+def search_key(query: str, bias=None) -> str:
+    b = f"{bias[0]:.4f},{bias[1]:.4f}" if bias else ""
+    return f"ts|{LANG}|{REGION}|{b}|{tnorm(query).lower()}"
+
+def details_key(place_id: str) -> str:
+    return f"det|{LANG}|{place_id}"
+
+def cache_get(key: str):
+    j = CACHE.get(key) if CACHE is not None else None
+    CACHE_STATS["hit" if j is not None else "miss"] += 1
+    return j
+
+def cache_put(key: str, j) -> None:
+    if CACHE is not None and j.get("status") in CACHEABLE:
+        CACHE.put(key, j)
+
 # ───────────────── Google Places ────────────────
-def textsearch(query: str, bias=None):
+def search_params(query: str, bias=None):
     params = {"query": query, "key": API_KEY, "language": LANG, "region": REGION}
     if bias:
         lat, lon = bias
         params.update({"location": f"{lat},{lon}", "radius": 20000})
-    j = requests.get(SEARCH_URL, params=params, timeout=30).json()
+    return params
+
+def details_params(place_id: str):
+    return {
+        "place_id": place_id,
+        "fields": "opening_hours,geometry,name,formatted_address",
+        "key": API_KEY, "language": LANG, "region": REGION
+    }
+
+def search_results(j):
     status = j.get("status")
     if status != "OK":
         print(f"   • Google status: {status} {j.get('error_message','')}")
     return j.get("results", [])
 
+def textsearch(query: str, bias=None, fresh=False):
+    """fresh=True: rând reîncercat după MISS — nu citim căutările din cache (doar le rescriem)."""
+    key = search_key(query, bias)
+    j = None if fresh else cache_get(key)
+    if j is None:
+        j = requests.get(SEARCH_URL, params=search_params(query, bias), timeout=30).json()
+        cache_put(key, j); time.sleep(SLEEP)
+    return search_results(j)
+
 def details(place_id: str):
-    params = {
-        "place_id": place_id,
-        "fields": "opening_hours,geometry,name,formatted_address",
-        "key": API_KEY, "language": LANG, "region": REGION
-    }
-    return requests.get(DETAILS_URL, params=params, timeout=30).json().get("result", {})
+    key = details_key(place_id)
+    j = cache_get(key)
+    if j is None:
+        j = requests.get(DETAILS_URL, params=details_params(place_id), timeout=30).json()
+        cache_put(key, j); time.sleep(SLEEP)
+    return j.get("result", {})
 
 def pick_best(results, want_city, want_street):
     want_city_l = (want_city or "").lower()
@@ -131,10 +185,10 @@ def pick_best(results, want_city, want_street):
     scored.sort(key=lambda x: x[0], reverse=True)
     return scored[0][1] if scored[0][0] > 0 else None
 
-def fetch_for_address(address: str):
+def address_queries(address: str):
+    """(oraș, stradă, bias, interogări în ordinea încercării) sau None dacă adresa e goală."""
     city, street = normalize_address(address)
     if not city and not street: return None
-    bias = CITY_CENTER.get(city)
     queries = []
     if street:
         queries += [
@@ -143,8 +197,86 @@ def fetch_for_address(address: str):
             f"Linella {city} {street}",
         ]
     queries += [f"Linella {city}, Moldova", f"Linella {city}"]
+    return city, street, CITY_CENTER.get(city), queries
+
+def fetch_for_address(address: str, fresh=False):
+    aq = address_queries(address)
+    if not aq: return None
+    city, street, bias, queries = aq
+    for q in queries:
+        res = textsearch(q, bias=bias, fresh=fresh)
+        if not res: continue
+        cand = pick_best(res, city, street)
+        if cand: return cand
+    return None
+
+# ───────────── Google Places (asincron) ─────────────
+class PlacesClient:
+    """Text Search / Details pe o sesiune aiohttp partajată, cu un TokenBucket comun
+    tuturor rândurilor. La OVER_QUERY_LIMIT ritmul se înjumătățește și găleata stă
+    goală 1, 2, 4… s, apoi ritmul revine treptat spre PLACES_QPS cu fiecare răspuns bun.
+    Cererile aflate deja în zbor primesc și ele OVER_QUERY_LIMIT din aceeași rafală:
+    cât găleata e blocată, ele doar reîncearcă, fără să mai înjumătățească ritmul."""
+
+    def __init__(self, session: aiohttp.ClientSession, qps: float = PLACES_QPS,
+                 max_retries: int = PLACES_MAX_RETRIES):
+        self.session = session
+        self.qps = qps
+        self.bucket = TokenBucket(qps, max(1.0, qps))
+        self.max_retries = max_retries
+        self._blocked_until = 0.0           # time.monotonic() până la care ține pauza curentă
+        self.calls = 0
+        self.over_limit = 0
+
+    async def _get(self, url: str, params):
+        j = {}
+        for attempt in range(self.max_retries + 1):
+            wait = self.bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.calls += 1
+            try:
+                async with self.session.get(url, params=params) as r:
+                    j = await r.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"   • Eroare rețea ({attempt+1}/{self.max_retries+1}): {e!r}")
+                await asyncio.sleep(min(30.0, 2 ** attempt))
+                continue
+            if j.get("status") != "OVER_QUERY_LIMIT":
+                self.bucket.rate = min(self.qps, self.bucket.rate + self.qps / 20)
+                return j
+            self.over_limit += 1
+            now = time.monotonic()
+            if now >= self._blocked_until:      # o singură înjumătățire per rafală
+                pause = min(30.0, 2 ** attempt)
+                self.bucket.rate = max(self.qps / 16, self.bucket.rate / 2)
+                self.bucket.block(pause)
+                self._blocked_until = now + pause
+                print(f"   • OVER_QUERY_LIMIT → ritm {self.bucket.rate:.2f} cereri/s, pauză {pause:g}s")
+        return j
+
+    async def textsearch(self, query: str, bias=None, fresh=False):
+        key = search_key(query, bias)
+        j = None if fresh else cache_get(key)
+        if j is None:
+            j = await self._get(SEARCH_URL, search_params(query, bias))
+            cache_put(key, j)
+        return search_results(j)
+
+    async def details(self, place_id: str):
+        key = details_key(place_id)
+        j = cache_get(key)
+        if j is None:
+            j = await self._get(DETAILS_URL, details_params(place_id))
+            cache_put(key, j)
+        return j.get("result", {})
+
+async def fetch_for_address_async(api: PlacesClient, address: str, fresh=False):
+    aq = address_queries(address)
+    if not aq: return None
+    city, street, bias, queries = aq
     for q in queries:
-        res = textsearch(q, bias=bias); time.sleep(SLEEP)
+        res = await api.textsearch(q, bias=bias, fresh=fresh)
         if not res: continue
         cand = pick_best(res, city, street)
         if cand: return cand
@@ -159,30 +291,81 @@ def google_hours_to_dict(weekday_text):
     return hours
 
 # ───────────────────── Main ─────────────────────
-def main():
-    if not API_KEY:
-        raise SystemExit("Lipsește GOOGLE_API_KEY în .env")
-
-    in_path  = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else "linella_master.xlsx")
-    out_path = os.path.abspath(sys.argv[2] if len(sys.argv) > 2 else "linella_google_full.xlsx")
-
-    print(f"CWD:  {os.getcwd()}")
-    print(f"IN :  {in_path}")
-    print(f"OUT:  {out_path}")
+DAYS = ["mon","tue","wed","thu","fri","sat","sun"]
 
+def load_sheet(in_path: str):
     df = pd.read_excel(in_path)
-
     # asigură coloanele și normalizează NaN → ""
-    days = ["mon","tue","wed","thu","fri","sat","sun"]
-    for col in ["lat","lon","status", *days]:
+    for col in ["lat","lon","status", *DAYS]:
         if col not in df.columns: df[col] = ""
-    df[["lat","lon","status", *days]] = df[["lat","lon","status", *days]].applymap(
-        lambda v: "" if (pd.isna(v) or str(v).strip().lower()=="nan") else v
-    )
+        df[col] = df[col].map(
+            lambda v: "" if (pd.isna(v) or str(v).strip().lower()=="nan") else v
+        ).astype(object)
+    return df
+
+def apply_place(df, i, place, det):
+    """Scrie coordonatele (Details are prioritate) și programul în rândul i."""
+    lat0 = place["geometry"]["location"]["lat"]
+    lng0 = place["geometry"]["location"]["lng"]
+    loc2 = (det.get("geometry") or {}).get("location") or {}
+
+    lat_final = float(loc2.get("lat", lat0))
+    lon_final = float(loc2.get("lng", lng0))
+
+    df.at[i, "lat"] = lat_final
+    df.at[i, "lon"] = lon_final
+
+    weekday_text = (det.get("opening_hours") or {}).get("weekday_text", [])
+    for d, v in google_hours_to_dict(weekday_text).items():
+        df.at[i, d] = v
+
+    df.at[i, "status"] = "OK"
+    return lat_final, lon_final
+
+def row_key(row, i):
+    """(număr, adresă normalizată): alt număr sau altă adresă = rând nou/schimbat."""
+    nr = row.get("number", i+1)
+    try: nr = str(int(float(nr)))
+    except (TypeError, ValueError): nr = tnorm(str(nr))
+    return nr, tnorm(str(row.get("address", ""))).upper()
+
+def missed_rows(df):
+    """Rândurile marcate MISS în foaia de intrare (ex.: o ieșire anterioară dată ca intrare)."""
+    return {i for i, v in df["status"].items() if str(v).strip() == "MISS"}
+
+def reuse_previous(df, prev_path):
+    """--incremental: rândurile OK (cu lat/lon) din ieșirea anterioară, cu același
+    număr și aceeași adresă, se copiază și nu mai merg la Google.
+    Întoarce (indicii refolosiți, indicii care au fost MISS acolo)."""
+    if not os.path.exists(prev_path):
+        print("   (nu există ieșire anterioară → rulare completă)")
+        return set(), set()
+    prev = load_sheet(prev_path)
+    good = {row_key(r, j): r for j, r in prev.iterrows()
+            if str(r["status"]).strip() == "OK" and filled(r["lat"]) and filled(r["lon"])}
+    missed = {row_key(r, j) for j, r in prev.iterrows() if str(r["status"]).strip() == "MISS"}
+    done, retry = set(), set()
+    for i, row in df.iterrows():
+        k = row_key(row, i)
+        if k in missed: retry.add(i)
+        r = good.get(k)
+        if r is None: continue
+        for col in ["lat","lon","status", *DAYS]:
+            df.at[i, col] = r[col]
+        done.add(i)
+    return done, retry
+
+def save_sheet(df, out_path):
+    # conversie sigură în numerice
+    df["lat"] = pd.to_numeric(df["lat"], errors="coerce")
+    df["lon"] = pd.to_numeric(df["lon"], errors="coerce")
+    df.to_excel(out_path, index=False)
 
+def run_sync(df, out_path, skip=frozenset(), retry=frozenset()):
     total = len(df); ok = miss = 0
 
     for i, row in df.iterrows():
+        if i in skip: continue
         nr   = row.get("number", i+1)
         addr = str(row.get("address", "")).strip()
         print(f"🔎 [{i+1}/{total}] Linella {nr} → {addr}")
@@ -193,29 +376,14 @@ def main():
             continue
 
         try:
-            place = fetch_for_address(addr)
+            place = fetch_for_address(addr, fresh=i in retry)
             if not place:
                 df.at[i, "status"] = "MISS"; miss += 1
                 print("   ❌ MISS (nu am găsit)")
                 continue
 
-            lat0 = place["geometry"]["location"]["lat"]
-            lng0 = place["geometry"]["location"]["lng"]
-
-            det = details(place["place_id"]); time.sleep(SLEEP)
-            loc2 = (det.get("geometry") or {}).get("location") or {}
-
-            lat_final = float(loc2.get("lat", lat0))
-            lon_final = float(loc2.get("lng", lng0))
-
-            df.at[i, "lat"] = lat_final
-            df.at[i, "lon"] = lon_final
-
-            weekday_text = (det.get("opening_hours") or {}).get("weekday_text", [])
-            for d, v in google_hours_to_dict(weekday_text).items():
-                df.at[i, d] = v
-
-            df.at[i, "status"] = "OK"; ok += 1
+            det = details(place["place_id"])
+            lat_final, lon_final = apply_place(df, i, place, det); ok += 1
             print(f"   ✅ OK → {lat_final}, {lon_final}")
 
             if (i+1) % BATCH_SAVE_EVERY == 0:
@@ -225,14 +393,95 @@ def main():
         except Exception as e:
             df.at[i, "status"] = "MISS"; miss += 1
             print(f"   ❗ Eroare: {e}")
+    return ok, miss
+
+async def run_async(df, out_path, skip=frozenset(), retry=frozenset()):
+    """Rândurile merg în paralel (PLACES_CONCURRENCY), ritmul e cel al PlacesClient.
+    Rezultatele se scriu în rândul lor din df, deci ordinea ieșirii rămâne cea a intrării."""
+    total = len(df) - len(skip); ok = miss = done = 0
+    sem = asyncio.Semaphore(PLACES_CONCURRENCY)
+
+    async def one(i, addr):
+        async with sem:
+            try:
+                place = await fetch_for_address_async(api, addr, fresh=i in retry)
+                det = await api.details(place["place_id"]) if place else None
+                return i, place, det, None
+            except Exception as e:
+                return i, None, None, e
+
+    async with new_session(limit=PLACES_CONCURRENCY) as session:
+        api = PlacesClient(session)
+        tasks = []
+        for i, row in df.iterrows():
+            if i in skip: continue
+            addr = str(row.get("address", "")).strip()
+            if not addr:
+                df.at[i, "status"] = "MISS"; miss += 1; done += 1
+                print(f"🔎 [{i+1}/{total}] Linella {row.get('number', i+1)} ⚠️  lipsă adresă → MISS")
+                continue
+            tasks.append(asyncio.create_task(one(i, addr)))
 
-    # conversie sigură în numerice
-    df["lat"] = pd.to_numeric(df["lat"], errors="coerce")
-    df["lon"] = pd.to_numeric(df["lon"], errors="coerce")
+        for fut in asyncio.as_completed(tasks):
+            i, place, det, err = await fut
+            done += 1
+            head = f"🔎 [{done}/{total}] Linella {df.at[i, 'number'] if 'number' in df.columns else i+1} →"
+            if err is not None:
+                df.at[i, "status"] = "MISS"; miss += 1
+                print(f"{head} ❗ Eroare: {err}")
+            elif not place:
+                df.at[i, "status"] = "MISS"; miss += 1
+                print(f"{head} ❌ MISS (nu am găsit)")
+            else:
+                lat_final, lon_final = apply_place(df, i, place, det); ok += 1
+                print(f"{head} ✅ OK → {lat_final}, {lon_final}")
+            if done % BATCH_SAVE_EVERY == 0:
+                df.to_excel(out_path, index=False)
+                print("   💾 progres salvat…")
 
-    df.to_excel(out_path, index=False)
+    print(f"Places: {api.calls} cereri, OVER_QUERY_LIMIT={api.over_limit}, ritm final {api.bucket.rate:.2f}/s")
+    return ok, miss
+
+def main():
+    if not API_KEY:
+        raise SystemExit("Lipsește GOOGLE_API_KEY în .env")
+
+    use_async = "--async" in sys.argv[1:]
+    incremental = "--incremental" in sys.argv[1:]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    in_path  = os.path.abspath(args[0] if len(args) > 0 else "linella_master.xlsx")
+    out_path = os.path.abspath(args[1] if len(args) > 1 else "linella_google_full.xlsx")
+
+    print(f"CWD:  {os.getcwd()}")
+    print(f"IN :  {in_path}")
+    print(f"OUT:  {out_path}")
+    if use_async:
+        print(f"MOD:  async ({PLACES_CONCURRENCY} rânduri, {PLACES_QPS:g} cereri/s)")
+
+    global CACHE
+    CACHE = open_cache(PLACES_CACHE, table="places", ttl_s=PLACES_CACHE_TTL_DAYS*24*3600)
+
+    df = load_sheet(in_path)
+    total = len(df)
+    # rândurile MISS (în intrare sau în ieșirea anterioară) se caută din nou la Google, nu în cache
+    retry = missed_rows(df)
+    skip = set()
+    if incremental:
+        skip, prev_missed = reuse_previous(df, out_path)
+        retry |= prev_missed
+        print(f"INCR: {len(skip)} rânduri refolosite din {out_path}, {total - len(skip)} de căutat "
+              f"({len(retry - skip)} reîncercate după MISS)")
+    retry -= skip
+    try:
+        ok, miss = (asyncio.run(run_async(df, out_path, skip, retry)) if use_async
+                    else run_sync(df, out_path, skip, retry))
+    finally:
+        if CACHE is not None: CACHE.close()
+
+    save_sheet(df, out_path)
     print(f"✅ Gata. Scris în {out_path}")
-    print(f"Rezumat: OK={ok}  MISS={miss}  TOTAL={total}")
+    print(f"Cache Places: hit={CACHE_STATS['hit']}  miss={CACHE_STATS['miss']}")
+    print(f"Rezumat: OK={ok}  MISS={miss}  REFOLOSITE={len(skip)}  TOTAL={total}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+fleet.py — împarte o listă de opriri între mai mulți tehnicieni (câte un depou de start).
+
+Obiectivul e echilibrul: cea mai lungă rută (secunde de condus + timp la
+magazine) cât mai scurtă, apoi totalul. Pașii:
+1. semințe depărtate între ele, potrivite cu depourile;
+2. alocare în ordinea „regretului”, cu plafon de opriri per tehnician;
+3. fiecare rută ordonată cu tsp.solve_path;
+4. mutări de opriri de pe ruta cea mai lungă pe altele, cât timp scade maximul.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from tsp import solve_path, local_search
+
+# cheie -> (nume, lat, lon); aceleași locații ca în meniul de mentenanță
+DEPOTS: Dict[str, Tuple[str, float, float]] = {
+    "home":      ("Acasă",              46.995953742189705, 28.903641724548),
+    "takeit":    ("Take IT depo",       46.995234693707985, 28.903614191014114),
+    "fructe":    ("Fructe Legume Depo", 46.99205105508518,  28.88559278022606),
+    "renovatie": ("Renovatie IT",       47.0426519229461,   28.862523753686208),
+    "rezomedia": ("Rezomedia",          47.01492352451698,  28.85564912784494),
+}
+DEPOT_ALIASES = {"acasa": "home", "take": "takeit", "takeit": "takeit", "fructe": "fructe",
+                 "reno": "renovatie", "renovatie": "renovatie", "rezo": "rezomedia", "rezomedia": "rezomedia"}
+
+def depot_key(tok: str) -> Optional[str]:
+    t = (tok or "").strip().lower().replace("ă", "a").replace("â", "a")
+    return t if t in DEPOTS else DEPOT_ALIASES.get(t)
+
+def _route_cost(d: np.ndarray, path: Sequence[int], service_s: float) -> float:
+    return float(sum(d[a, b] for a, b in zip(path[:-1], path[1:]))) + service_s*(len(path) - 1)
+
+def _best_insertion(d: np.ndarray, path: List[int], s: int) -> Tuple[float, int]:
+    """(cost suplimentar, poziție) pentru inserarea lui s în drumul deschis `path`."""
+    p = np.asarray(path)
+    if len(p) > 1:
+        a, b = p[:-1], p[1:]
+        mid = d[a, s] + d[s, b] - d[a, b]
+        k = int(mid.argmin())
+        if mid[k] < d[p[-1], s]:
+            return float(mid[k]), k + 1
+    return float(d[p[-1], s]), len(p)
+
+def _reoptimize(d: np.ndarray, path: List[int]) -> List[int]:
+    """Căutare locală pe submatricea rutei (startul rămâne fix)."""
+    if len(path) <= 3:
+        return path
+    sub = d[np.ix_(path, path)]
+    return [path[i] for i in local_search(sub, list(range(len(path))))]
+
+def split_routes(dmat, depots: Sequence[int], stops: Sequence[int],
+                 capacity: Optional[int] = None, service_s: float = 0.0,
+                 max_moves: int = 1000) -> List[List[int]]:
+    """Câte o rută per tehnician: [depou, opriri...] (noduri din dmat).
+
+    depots[r] e nodul de start al tehnicianului r (pot coincide). capacity =
+    numărul maxim de opriri per tehnician (None = fără plafon strict).
+    """
+    d = np.asarray(dmat, dtype=np.float64)
+    m = len(depots)
+    stops = list(stops)
+    if m == 0:
+        raise ValueError("cel puțin un tehnician")
+    if capacity is not None and capacity * m < len(stops):
+        raise ValueError(f"{len(stops)} opriri nu încap în {m}×{capacity}")
+    if not stops:
+        return [[dep] for dep in depots]
+    cap = capacity if capacity is not None else math.ceil(len(stops) / m)
+    hard_cap = capacity if capacity is not None else len(stops)
+
+    # 1) semințe: cele mai depărtate opriri între ele, apoi potrivite cu depourile
+    sym = d + d.T
+    seeds = [max(stops, key=lambda s: min(sym[dep, s] for dep in depots))]
+    while len(seeds) < min(m, len(stops)):
+        seeds.append(max((s for s in stops if s not in seeds), key=lambda s: min(sym[x, s] for x in seeds)))
+    anchor: List[Optional[int]] = [None]*m
+    free = set(range(m))
+    for s in sorted(seeds, key=lambda s: min(sym[depots[r], s] for r in range(m))):
+        r = min(free, key=lambda r: sym[depots[r], s])
+        anchor[r] = s; free.discard(r)
+
+    # 2) alocare după regret (diferența dintre cea mai bună și a doua opțiune)
+    def aff(r: int, s: int) -> float:
+        return sym[depots[r], s] + (sym[anchor[r], s] if anchor[r] is not None else 0.0)
+    prefs = {s: sorted(range(m), key=lambda r: aff(r, s)) for s in stops}
+    regret = {s: (aff(prefs[s][1], s) - aff(prefs[s][0], s)) if m > 1 else 0.0 for s in stops}
+    groups: List[List[int]] = [[] for _ in range(m)]
+    for s in sorted(stops, key=lambda s: -regret[s]):
+        r = next((r for r in prefs[s] if len(groups[r]) < cap), prefs[s][0])
+        groups[r].append(s)
+
+    # 3) ordonare per tehnician
+    def solve(r: int, members: List[int]) -> List[int]:
+        nodes = [depots[r]] + members
+        order, _ = solve_path(d[np.ix_(nodes, nodes)], start_idx=0)
+        return [nodes[i] for i in order]
+    routes = [solve(r, groups[r]) for r in range(m)]
+    costs = [_route_cost(d, p, service_s) for p in routes]
+
+    # 4) echilibrare: mută opriri de pe ruta cea mai lungă cât timp scade maximul
+    for _ in range(max_moves):
+        L = int(np.argmax(costs))
+        path = routes[L]
+        best = None
+        for k in range(1, len(path)):
+            s = path[k]
+            nxt = path[k+1] if k + 1 < len(path) else None
+            save = d[path[k-1], s] + (d[s, nxt] - d[path[k-1], nxt] if nxt is not None else 0.0) + service_s
+            for r in range(m):
+                if r == L or len(routes[r]) - 1 >= hard_cap:
+                    continue
+                add, pos = _best_insertion(d, routes[r], s)
+                new_max = max(costs[L] - save, costs[r] + add + service_s)
+                others = max((costs[q] for q in range(m) if q not in (L, r)), default=0.0)
+                score = (max(new_max, others), add - save)
+                if score[0] < costs[L] - 1e-6 and (best is None or score < best[0]):
+                    best = (score, k, r, pos, save, add)
+        if best is None:
+            break
+        _, k, r, pos, save, add = best
+        s = path[k]
+        routes[L] = path[:k] + path[k+1:]
+        routes[r] = routes[r][:pos] + [s] + routes[r][pos:]
+        routes[L] = _reoptimize(d, routes[L])
+        routes[r] = _reoptimize(d, routes[r])
+        costs[L] = _route_cost(d, routes[L], service_s)
+        costs[r] = _route_cost(d, routes[r], service_s)
+    # ordinea finală: exact pe rutele mici, euristic pe cele mari
+    return [solve(r, routes[r][1:]) for r in range(m)]
+
+def route_cost(dmat, path: Sequence[int], service_s: float = 0.0) -> float:
+    return _route_cost(np.asarray(dmat, dtype=np.float64), path, service_s)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+geo.py — distanțe pe sferă (scalar + NumPy) și index spațial peste magazine.
+
+Folosit de bot.py și route_optimizer.py:
+- haversine_km: o singură pereche (afișare distanță)
+- haversine_many / haversine_matrix: vectori și matrici float64 (rutare, căutare)
+- StoreIndex: „care sunt cele mai apropiate k magazine” fără să parcurgă tot
+"""
+import math
+from typing import Dict, List, Tuple, Optional, Iterable, Sequence
+
+import numpy as np
+
+EARTH_R_KM = 6371.0088
+FALLBACK_KMH = 35.0      # viteză medie când nu avem timpi reali de la Google
+
+# distanță pe sferă
+def haversine_km(a1, b1, a2, b2) -> float:
+    p1 = math.radians(a1)
+    p2 = math.radians(a2)
+    dphi = math.radians(a2 - a1)
+    dl   = math.radians(b2 - b1)
+    x = math.sin(dphi/2)**2 + math.cos(p1)*math.cos(p2)*math.sin(dl/2)**2
+    return EARTH_R_KM * (2 * math.atan2(math.sqrt(x), math.sqrt(1-x)))
+
+# ───────── Vectorizat (NumPy) ─────────
+def as_coords(points: Sequence[Tuple[float,float]]) -> np.ndarray:
+    """Listă de (lat, lon) → array float64 de formă (n, 2)."""
+    return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+def haversine_many(lat: float, lon: float, lats, lons) -> np.ndarray:
+    """Distanțe (km) de la un punct la mai multe: un vector de lungime len(lats)."""
+    p1 = math.radians(lat)
+    p2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dphi = p2 - p1
+    dl = np.radians(np.asarray(lons, dtype=np.float64)) - math.radians(lon)
+    x = np.sin(dphi/2)**2 + math.cos(p1)*np.cos(p2)*np.sin(dl/2)**2
+    return 2 * EARTH_R_KM * np.arcsin(np.sqrt(np.clip(x, 0.0, 1.0)))
+
+def haversine_matrix(a, b=None) -> np.ndarray:
+    """Matrice de distanțe (km) len(a) × len(b); b implicit = a."""
+    a = as_coords(a)
+    b = a if b is None else as_coords(b)
+    la1 = np.radians(a[:, 0])[:, None]; lo1 = np.radians(a[:, 1])[:, None]
+    la2 = np.radians(b[:, 0])[None, :]; lo2 = np.radians(b[:, 1])[None, :]
+    x = np.sin((la2 - la1)/2)**2 + np.cos(la1)*np.cos(la2)*np.sin((lo2 - lo1)/2)**2
+    return 2 * EARTH_R_KM * np.arcsin(np.sqrt(np.clip(x, 0.0, 1.0)))
+
+def travel_seconds_matrix(points, kmh: float = FALLBACK_KMH) -> np.ndarray:
+    """Timpi estimați (secunde, int64) din distanța în linie dreaptă la viteză fixă."""
+    return np.rint(haversine_matrix(points) / kmh * 3600).astype(np.int64)
+
+def nearest_neighbor_order(dmat: np.ndarray, start: int = 0) -> List[int]:
+    """Ordinea vecinului cel mai apropiat pornind din `start` (exclus din rezultat)."""
+    d = np.array(dmat, dtype=np.float64)
+    d[:, start] = np.inf
+    out: List[int] = []
+    cur = start
+    for _ in range(len(d) - 1):
+        nxt = int(np.argmin(d[cur]))
+        out.append(nxt)
+        d[:, nxt] = np.inf
+        cur = nxt
+    return out
+
+# ───────── Index pe grilă ─────────
+BRUTE_MAX = 4096        # până la atâtea puncte o trecere vectorizată bate orice grilă
+CELL_TARGET = 16        # puncte per celulă, în medie; dă mărimea celulei din densitatea datelor
+GRID_MAX_RINGS = 3      # inele încercate pe grilă înainte de trecerea vectorizată (filtre rare)
+
+class StoreIndex:
+    """O singură grilă lat/lon pentru toate magazinele, cu celule dimensionate după densitate.
+
+    Se construiește direct din coloanele catalogului (lat, lon, index brand) și
+    întoarce id-urile catalogului. Sub BRUTE_MAX puncte (sau când filtrul de brand
+    lasă atât de puține) căutarea e o singură trecere haversine vectorizată +
+    argpartition. Peste, pornește din celula utilizatorului și se extinde în inele;
+    brandul și `allow` se aplică pe id-urile candidaților. Căutarea se oprește când
+    distanța minimă posibilă până la inelul următor depășește al k-lea candidat;
+    dacă după GRID_MAX_RINGS inele nu e sigur, se face trecerea vectorizată peste
+    submulțimea filtrată.
+    """
+
+    def __init__(self, lat, lon, brand, brand_codes: Sequence[str], ids=None,
+                 cell_deg: Optional[float] = None, brute_max: int = BRUTE_MAX):
+        """lat/lon/brand: câte o valoare pe punct (brand = poziția în brand_codes);
+        ids: id-ul întors pentru fiecare punct (implicit poziția lui)."""
+        self.cell = cell_deg
+        self.brute_max = brute_max
+        self._lat = np.asarray(lat, dtype=np.float64)
+        self._lon = np.asarray(lon, dtype=np.float64)
+        self._b = np.asarray(brand, dtype=np.int64)
+        self.ids = np.arange(len(self._lat)) if ids is None else np.asarray(ids, dtype=np.int64)
+        self._codes: Dict[str, int] = {c: b for b, c in enumerate(brand_codes)}
+        self._by_brand: Dict[str, np.ndarray] = {c: np.flatnonzero(self._b == b) for c, b in self._codes.items()}
+        self._order = np.empty(0, dtype=np.int64)
+        self._cells: Dict[Tuple[int,int], Tuple[int,int]] = {}
+        self._bbox = (0, -1, 0, -1)
+        self._max_abs_lat = 0.0
+        self._build_grid()
+
+    def __len__(self) -> int:
+        return len(self._lat)
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int,int]:
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
+
+    def _build_grid(self) -> None:
+        n = len(self._lat)
+        if not n:
+            return
+        if self.cell is None:
+            h = float(np.ptp(self._lat)) or 1e-3
+            w = float(np.ptp(self._lon)) or 1e-3
+            self.cell = min(max(math.sqrt(h * w * CELL_TARGET / n), 0.002), 2.0)
+        rows = np.floor(self._lat / self.cell).astype(np.int64)
+        cols = np.floor(self._lon / self.cell).astype(np.int64)
+        self._bbox = (int(rows.min()), int(rows.max()), int(cols.min()), int(cols.max()))
+        key = (rows - self._bbox[0]) * (self._bbox[3] - self._bbox[2] + 1) + (cols - self._bbox[2])
+        self._order = np.argsort(key, kind="stable")
+        uniq, first, counts = np.unique(key[self._order], return_index=True, return_counts=True)
+        width = self._bbox[3] - self._bbox[2] + 1
+        self._cells = {(self._bbox[0] + int(u) // width, self._bbox[2] + int(u) % width): (int(a), int(a + c))
+                       for u, a, c in zip(uniq.tolist(), first.tolist(), counts.tolist())}
+        self._max_abs_lat = float(np.abs(self._lat).max()) + self.cell
+
+    def _ring_width_km(self, lat: float) -> float:
+        # pe longitudine celula se îngustează cu cos(lat); luăm cea mai nordică latitudine
+        phi = min(max(self._max_abs_lat, abs(lat) + self.cell), 89.0)
+        return self.cell * (math.pi * EARTH_R_KM / 180) * math.cos(math.radians(phi))
+
+    def _top_k(self, lat: float, lon: float, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        d = haversine_many(lat, lon, self._lat[ids], self._lon[ids])
+        if len(d) > k:
+            part = np.argpartition(d, k - 1)[:k]
+            keep = part[np.argsort(d[part], kind="stable")]
+        else:
+            keep = np.argsort(d, kind="stable")
+        return ids[keep], d[keep]
+
+    def _scan(self, lat: float, lon: float, k: int, sub: Optional[np.ndarray],
+              allow: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.arange(len(self._lat)) if sub is None else sub
+        if allow is not None:
+            ids = ids[allow[self.ids[ids]]]
+        return self._top_k(lat, lon, ids, k)
+
+    def _grid(self, lat: float, lon: float, k: int, brand_ok: Optional[np.ndarray],
+              allow: Optional[np.ndarray]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Căutarea pe inele; None dacă după GRID_MAX_RINGS rezultatul nu e încă sigur."""
+        r0, c0 = self._cell_of(lat, lon)
+        ring_km = self._ring_width_km(lat)
+        rmin, rmax, cmin, cmax = self._bbox
+        start = max(0, rmin - r0, r0 - rmax, cmin - c0, c0 - cmax)
+        stop = max(r0 - rmin, rmax - r0, c0 - cmin, cmax - c0)
+        best_ids = np.empty(0, dtype=np.int64)
+        best_d = np.empty(0)
+        last = min(stop, start + GRID_MAX_RINGS)
+        for ring in range(start, last + 1):
+            if len(best_d) == k and (ring - 1) * ring_km > best_d[-1]:
+                return best_ids, best_d
+            spans = [self._cells[c] for c in _ring_cells(r0, c0, ring) if c in self._cells]
+            if not spans:
+                continue
+            new = np.concatenate([self._order[a:b] for a, b in spans])
+            if brand_ok is not None:
+                new = new[brand_ok[self._b[new]]]
+            if allow is not None:
+                new = new[allow[self.ids[new]]]
+            if not len(new):
+                continue
+            cand = np.concatenate([best_ids, new]) if len(best_ids) else new
+            best_ids, best_d = self._top_k(lat, lon, cand, k)
+        if last >= stop or (len(best_d) == k and last * ring_km >= best_d[-1]):
+            return best_ids, best_d
+        return None
+
+    def nearest(self, lat: float, lon: float, k: int = 5,
+                brands: Optional[Iterable[str]] = None,
+                allow: Optional[np.ndarray] = None) -> List[Tuple[float, int]]:
+        """Cele mai apropiate k magazine: [(km, id)], crescător după distanță.
+
+        allow: vector bool peste id-uri (ex.: doar cele deschise acum).
+        """
+        if k <= 0 or not len(self._lat):
+            return []
+        sub = brand_ok = None
+        if brands is not None:
+            codes = [c for c in dict.fromkeys(brands) if c in self._codes]
+            if not codes:
+                return []
+            if len(codes) < len(self._codes):
+                parts = [self._by_brand[c] for c in codes]
+                sub = parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+                brand_ok = np.zeros(len(self._codes), dtype=bool)
+                brand_ok[[self._codes[c] for c in codes]] = True
+        n = len(self._lat) if sub is None else len(sub)
+        res = None if n <= self.brute_max else self._grid(lat, lon, k, brand_ok, allow)
+        ids, d = res if res is not None else self._scan(lat, lon, k, sub, allow)
+        return list(zip(d.tolist(), self.ids[ids].tolist()))
+
+def _ring_cells(r0: int, c0: int, ring: int):
+    if ring == 0:
+        yield (r0, c0); return
+    for c in range(c0 - ring, c0 + ring + 1):
+        yield (r0 - ring, c)
+        yield (r0 + ring, c)
+    for r in range(r0 - ring + 1, r0 + ring):
+        yield (r, c0 - ring)
+        yield (r, c0 + ring)
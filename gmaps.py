@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gmaps.py — client async pentru Google (Distance Matrix pe plăci, Directions).
+
+Google acceptă maxim 25 origini, 25 destinații și 100 elemente pe cerere,
+așa că matricea se împarte în plăci conforme, cerute concurent (semafor),
+apoi reasamblată. O placă eșuată se reîncearcă singură, nu toată matricea;
+dacă tot eșuează, celulele ei rămân DM_FAILED, plăcile reușite se păstrează
+(și se memorează), iar doar celulele lipsă primesc estimarea haversine.
+Perechile deja văzute vin din cache-ul pe disc (sqlite_cache.py).
+
+Toate cererile merg printr-o singură sesiune HTTP partajată (keep-alive,
+pool de conexiuni, cache DNS), creată la pornirea serverului (start_session)
+și închisă la oprire. Fără ea (CLI) fiecare apel își face o sesiune proprie.
+GOOGLE_API_BASE mută toate cererile pe alt host (ex.: un stub local în teste).
+"""
+import os, ssl, time, asyncio, datetime as dt
+from typing import Dict, List, Tuple, Optional, Sequence
+from zoneinfo import ZoneInfo
+
+import aiohttp, certifi
+
+from sqlite_cache import SQLiteCache, open_cache
+from metrics import GOOGLE_REQUESTS, GOOGLE_SECONDS, DM_CACHE_CELLS, FALLBACKS
+from geo import haversine_km, FALLBACK_KMH
+import tracing
+
+GOOGLE_API_BASE = os.getenv("GOOGLE_API_BASE", "https://maps.googleapis.com").rstrip("/")
+DM_PATH = "/maps/api/distancematrix/json"
+DIRECTIONS_PATH = "/maps/api/directions/json"
+DM_MAX_SIDE = 25
+DM_MAX_ELEMENTS = 100
+DM_CONCURRENCY = int(os.getenv("DM_CONCURRENCY", "4"))
+DM_TILE_RETRIES = 3
+DM_TIMEOUT_S = 20
+DM_UNREACHABLE = 10**9
+DM_FAILED = -1              # celulă dintr-o placă eșuată (≠ DM_UNREACHABLE, răspuns real al Google)
+DIRECTIONS_TIMEOUT_S = 12
+DIRECTIONS_RETRIES = 2
+
+# Pool HTTP partajat
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))          # conexiuni simultane
+HTTP_DNS_TTL_S = int(os.getenv("HTTP_DNS_TTL_S", "300"))         # cache DNS
+HTTP_KEEPALIVE_S = float(os.getenv("HTTP_KEEPALIVE_S", "30"))    # conexiuni inactive păstrate
+
+TZ = ZoneInfo("Europe/Chisinau")
+
+# Cache timpi de parcurs (magazinele nu se mută): DM_CACHE_PATH="" îl dezactivează
+DM_CACHE_PATH = os.getenv("DM_CACHE_PATH", os.path.join("data", "dm_cache.sqlite3"))
+DM_CACHE_TTL_H = float(os.getenv("DM_CACHE_TTL_H", "336"))    # 14 zile
+DM_CACHE_MAX = int(os.getenv("DM_CACHE_MAX", "200000"))
+DM_COORD_DECIMALS = 4                                         # ~11 m
+
+# statusuri după care nu are rost să reîncercăm
+_FATAL = {"INVALID_REQUEST", "REQUEST_DENIED", "MAX_DIMENSIONS_EXCEEDED", "MAX_ELEMENTS_EXCEEDED"}
+
+Point = Tuple[float, float]
+Matrix = List[List[int]]
+
+class DistanceMatrixError(RuntimeError):
+    pass
+
+def _observe(api: str, t0: float, status: str) -> None:
+    GOOGLE_SECONDS.observe(time.perf_counter() - t0, api)
+    GOOGLE_REQUESTS.inc(api, status)
+    tracing.record(f"google:{api}", t0, status)
+
+def _error_status(e: BaseException) -> str:
+    if isinstance(e, aiohttp.ClientResponseError):
+        return f"http_{e.status}"
+    return "timeout" if isinstance(e, asyncio.TimeoutError) else "network"
+
+def tile_ranges(n_orig: int, n_dest: int,
+                max_side: int = DM_MAX_SIDE, max_elements: int = DM_MAX_ELEMENTS) -> List[Tuple[int,int,int,int]]:
+    """Plăci (o0, o1, d0, d1) care acoperă n_orig × n_dest și respectă limitele."""
+    if not n_orig or not n_dest:
+        return []
+    d_side = min(n_dest, max_side, max_elements)
+    o_side = max(1, min(n_orig, max_side, max_elements // d_side))
+    return [(o0, min(o0 + o_side, n_orig), d0, min(d0 + d_side, n_dest))
+            for o0 in range(0, n_orig, o_side)
+            for d0 in range(0, n_dest, d_side)]
+
+def _fmt(points: Sequence[Point]) -> str:
+    return "|".join("{:.6f},{:.6f}".format(lat, lon) for lat, lon in points)
+
+def parse_elements(js: dict) -> Matrix:
+    mat = []
+    for row in js.get("rows", []):
+        arr = []
+        for el in row.get("elements", []):
+            if el.get("status") != "OK":
+                arr.append(DM_UNREACHABLE)
+            else:
+                sec = el.get("duration_in_traffic", el.get("duration", {})).get("value", DM_UNREACHABLE)
+                arr.append(int(sec))
+        mat.append(arr)
+    return mat
+
+def api_url(path: str) -> str:
+    return GOOGLE_API_BASE + path
+
+def new_session(limit: int = HTTP_POOL_SIZE) -> aiohttp.ClientSession:
+    ssl_ctx = ssl.create_default_context(cafile=certifi.where())
+    connector = aiohttp.TCPConnector(ssl=ssl_ctx, limit=limit, ttl_dns_cache=HTTP_DNS_TTL_S,
+                                     keepalive_timeout=HTTP_KEEPALIVE_S)
+    return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=DM_TIMEOUT_S), connector=connector)
+
+# ───────── Sesiunea partajată ─────────
+_SESSION: Optional[aiohttp.ClientSession] = None
+
+async def start_session(session: Optional[aiohttp.ClientSession] = None) -> aiohttp.ClientSession:
+    """Instalează sesiunea partajată (din startup-ul serverului) și deschide cache-ul DM;
+    testele pot injecta o sesiune proprie."""
+    global _SESSION
+    dm_cache()
+    if _SESSION is not None and not _SESSION.closed and session is None:
+        return _SESSION
+    _SESSION = session or new_session()
+    return _SESSION
+
+async def close_session() -> None:
+    global _SESSION
+    s, _SESSION = _SESSION, None
+    if s is not None and not s.closed:
+        await s.close()
+
+def shared_session() -> Optional[aiohttp.ClientSession]:
+    return _SESSION if _SESSION is not None and not _SESSION.closed else None
+
+async def _fetch_tile(session: aiohttp.ClientSession, sem: asyncio.Semaphore, key: str,
+                      origins: Sequence[Point], destinations: Sequence[Point]) -> Matrix:
+    params = {
+        "origins": _fmt(origins),
+        "destinations": _fmt(destinations),
+        "mode": "driving",
+        "departure_time": "now",
+        "traffic_model": "best_guess",
+        "key": key,
+    }
+    err = "?"
+    for attempt in range(DM_TILE_RETRIES):
+        if attempt:
+            await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                async with session.get(api_url(DM_PATH), params=params) as r:
+                    r.raise_for_status()
+                    js = await r.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                _observe("distancematrix", t0, "bad_json" if isinstance(e, ValueError) else _error_status(e))
+                err = repr(e); continue
+        status = js.get("status")
+        _observe("distancematrix", t0, str(status))
+        if status == "OK":
+            mat = parse_elements(js)
+            if len(mat) == len(origins) and all(len(row) == len(destinations) for row in mat):
+                return mat
+            err = "răspuns incomplet"; continue
+        err = f"{status} {js.get('error_message', '')}".strip()
+        if status in _FATAL:
+            break
+    raise DistanceMatrixError(f"DistanceMatrix {len(origins)}×{len(destinations)}: {err}")
+
+async def distance_matrix_blocks(blocks: Sequence[Tuple[Sequence[Point], Sequence[Point]]], key: str,
+                                 session: Optional[aiohttp.ClientSession] = None,
+                                 concurrency: int = DM_CONCURRENCY) -> List[Matrix]:
+    """Mai multe submatrici (origini, destinații) cerute împreună, sub același semafor.
+    Celulele plăcilor eșuate rămân DM_FAILED; excepție doar dacă au eșuat toate plăcile."""
+    session = session or shared_session()
+    own = session is None
+    session = session or new_session()
+    sem = asyncio.Semaphore(max(1, concurrency))
+    try:
+        jobs, where = [], []
+        out: List[Matrix] = []
+        for b, (origins, destinations) in enumerate(blocks):
+            out.append([[DM_FAILED] * len(destinations) for _ in origins])
+            for o0, o1, d0, d1 in tile_ranges(len(origins), len(destinations)):
+                jobs.append(_fetch_tile(session, sem, key, origins[o0:o1], destinations[d0:d1]))
+                where.append((b, o0, d0))
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        failed = [res for res in results if isinstance(res, BaseException)]
+        if failed and len(failed) == len(results):
+            raise failed[0]
+        if failed:
+            print(f"[WARN] DistanceMatrix: {len(failed)}/{len(results)} plăci eșuate: {failed[0]!r}")
+        for (b, o0, d0), sub in zip(where, results):
+            if isinstance(sub, BaseException):
+                continue
+            for a, row in enumerate(sub):
+                out[b][o0 + a][d0:d0 + len(row)] = row
+        return out
+    finally:
+        if own:
+            await session.close()
+
+async def distance_matrix(origins: Sequence[Point], destinations: Sequence[Point], key: str,
+                          session: Optional[aiohttp.ClientSession] = None,
+                          concurrency: int = DM_CONCURRENCY) -> Matrix:
+    return (await distance_matrix_blocks([(origins, destinations)], key, session, concurrency))[0]
+
+# ───────── Directions (ordinea optimizată de Google) ─────────
+async def directions_optimize(origin: Point, points: Sequence[Point], key: str,
+                              session: Optional[aiohttp.ClientSession] = None) -> Optional[Tuple[List[int], int]]:
+    """(ordinea punctelor, durata totală în secunde) sau None dacă Google nu răspunde OK.
+    Ultimul punct e destinația; celelalte sunt waypoints cu optimize:true."""
+    params = {
+        "origin": f"{origin[0]},{origin[1]}",
+        "destination": f"{points[-1][0]},{points[-1][1]}",
+        "mode": "driving",
+        "departure_time": "now",
+        "key": key,
+    }
+    if len(points) > 1:
+        params["waypoints"] = "optimize:true|" + "|".join(f"{a},{b}" for a, b in points[:-1])
+    session = session or shared_session()
+    own = session is None
+    session = session or new_session()
+    try:
+        for attempt in range(DIRECTIONS_RETRIES):
+            if attempt:
+                await asyncio.sleep(0.6)
+            t0 = time.perf_counter()
+            try:
+                async with session.get(api_url(DIRECTIONS_PATH), params=params,
+                                       timeout=aiohttp.ClientTimeout(total=DIRECTIONS_TIMEOUT_S)) as r:
+                    data = await r.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                _observe("directions", t0, "bad_json" if isinstance(e, ValueError) else _error_status(e))
+                continue
+            _observe("directions", t0, str(data.get("status")))
+            if data.get("status") != "OK":
+                continue
+            route = (data.get("routes") or [None])[0]
+            if not route:                         # OK fără rute: rămâne rezerva tsp
+                return None
+            order = route.get("waypoint_order", list(range(len(points)-1))) + [len(points)-1]
+            total = 0
+            for leg in route.get("legs", []):
+                d = leg.get("duration_in_traffic") or leg.get("duration") or {}
+                total += int(d.get("value", 0))
+            return order, total
+        return None
+    finally:
+        if own:
+            await session.close()
+
+# ───────── Cache pe disc ─────────
+# deschis la prima folosire (sau din start_session), nu la import: bench.py și
+# fetch_google_data_v3.py importă modulul fără să aibă nevoie de fișier
+DM_CACHE: Optional[SQLiteCache] = None
+_DM_CACHE_OPENED = False
+
+def dm_cache() -> Optional[SQLiteCache]:
+    """Cache-ul implicit al matricelor; None dacă DM_CACHE_PATH e gol."""
+    global DM_CACHE, _DM_CACHE_OPENED
+    if not _DM_CACHE_OPENED:
+        _DM_CACHE_OPENED = True
+        DM_CACHE = open_cache(DM_CACHE_PATH, table="distance_matrix",
+                              ttl_s=DM_CACHE_TTL_H*3600, max_items=DM_CACHE_MAX)
+    return DM_CACHE
+
+def hour_of_week(when: Optional[dt.datetime] = None) -> int:
+    """0..167 (luni 00h = 0) în ora Chișinăului — traficul depinde de zi și oră."""
+    t = (when or dt.datetime.now(TZ)).astimezone(TZ)
+    return t.weekday()*24 + t.hour
+
+def dm_cache_key(o: Point, d: Point, bucket: int) -> str:
+    p = DM_COORD_DECIMALS
+    return f"{o[0]:.{p}f},{o[1]:.{p}f}>{d[0]:.{p}f},{d[1]:.{p}f}@{bucket}"
+
+async def cached_distance_matrix(origins: Sequence[Point], destinations: Sequence[Point], key: str,
+                                 cache: Optional[SQLiteCache] = None,
+                                 when: Optional[dt.datetime] = None,
+                                 session: Optional[aiohttp.ClientSession] = None) -> Matrix:
+    """Matrice origini × destinații (secunde). Perechile deja văzute vin din cache;
+    la Google se cer doar celulele lipsă, grupate pe rânduri cu aceleași coloane lipsă.
+    Celulele din plăci eșuate primesc estimarea haversine (nu se memorează)."""
+    cache = dm_cache() if cache is None else cache
+    bucket = hour_of_week(when)
+    keys = [[dm_cache_key(o, d, bucket) for d in destinations] for o in origins]
+    known = await asyncio.to_thread(cache.get_many, [k for row in keys for k in row]) if cache is not None else {}
+
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for i, row in enumerate(keys):
+        cols = tuple(j for j, k in enumerate(row) if k not in known)
+        if cols:
+            groups.setdefault(cols, []).append(i)
+    blocks = [([origins[i] for i in rows], [destinations[j] for j in cols]) for cols, rows in groups.items()]
+    missing = sum(len(cols) * len(rows) for cols, rows in groups.items())
+    DM_CACHE_CELLS.inc("hit", n=len(origins) * len(destinations) - missing)
+    DM_CACHE_CELLS.inc("miss", n=missing)
+    try:
+        subs = await distance_matrix_blocks(blocks, key, session) if blocks else []
+    except DistanceMatrixError:
+        if not known:
+            raise
+        subs = [[[DM_FAILED] * len(cols) for _ in rows] for cols, rows in groups.items()]
+    fresh: Dict[str, int] = {}
+    estimated = 0
+    for (cols, rows), sub in zip(groups.items(), subs):
+        for a, i in enumerate(rows):
+            for b, j in enumerate(cols):
+                v = sub[a][b]
+                if v == DM_FAILED:
+                    (la, lo), (lb, ob) = origins[i], destinations[j]
+                    v = round(haversine_km(la, lo, lb, ob) / FALLBACK_KMH * 3600)
+                    estimated += 1
+                elif v != DM_UNREACHABLE:         # nu memorăm eșecurile
+                    fresh[keys[i][j]] = v
+                known[keys[i][j]] = v
+    if estimated:
+        FALLBACKS.inc("distance_matrix", "partial")
+    if cache is not None and fresh:
+        await asyncio.to_thread(cache.put_many, fresh)
+    return [[int(known[k]) for k in row] for row in keys]
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+loadtest.py — test de încărcare cap-coadă pentru server.py, pe o singură mașină.
+
+Pornește două servere stub locale (aiohttp): unul în locul Bot API-ului
+Telegram (TELEGRAM_API_BASE) și unul în locul Google Directions / Distance
+Matrix (GOOGLE_API_BASE), fiecare cu latență și rată de erori configurabile.
+Apoi aplicația FastAPI din server.py rulează în același proces și primește
+update-uri sintetice direct prin ASGI (coduri, callback-uri, locații, liste
+de rută) de la --users utilizatori virtuali: fiecare trimite un update,
+așteaptă să fie procesat complet, face o pauză (--think-ms) și trimite următorul.
+
+La final: update-uri/s, percentile de latență (confirmarea webhook-ului și
+procesarea completă, pe tip de update) și erorile (HTTP, timeout, handler,
+erori injectate de stub-uri, rezerve, 429). Nicio cerere nu iese din mașină.
+
+    python loadtest.py --users 200 --updates 3000 --tg-latency-ms 40 --google-error-rate 0.05
+"""
+import os, json, time, random, asyncio, argparse, tempfile, statistics
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Tuple
+
+from aiohttp import web
+
+from geo import haversine_km
+
+# ───────── Stub-uri ─────────
+class Stub:
+    """Latență uniformă în [0.5, 1.5] × latency_ms și o fracțiune error_rate de răspunsuri cu eroare."""
+    def __init__(self, latency_ms: float, error_rate: float, seed: int):
+        self.latency_s = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    async def delay(self) -> None:
+        if self.latency_s > 0:
+            await asyncio.sleep(self.latency_s * self.rnd.uniform(0.5, 1.5))
+
+    def fail(self) -> bool:
+        return self.rnd.random() < self.error_rate
+
+_MESSAGE_METHODS = {"sendmessage", "sendlocation", "sendvenue", "sendcontact",
+                    "editmessagetext", "editmessagereplymarkup"}
+
+def telegram_app(stub: Stub, retry_after: int) -> web.Application:
+    msg_id = [0]
+
+    async def handle(request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        form = await request.post()
+        stub.calls[method] += 1
+        await stub.delay()
+        if stub.fail():
+            stub.errors[method] += 1
+            return web.json_response({"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {retry_after}",
+                                      "parameters": {"retry_after": retry_after}}, status=429)
+        if method in _MESSAGE_METHODS:
+            msg_id[0] += 1
+            chat = int(form.get("chat_id") or 0)
+            result: Any = {"message_id": msg_id[0], "date": int(time.time()),
+                           "chat": {"id": chat, "type": "private"}}
+        elif method == "getwebhookinfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "stub", "username": "stub_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    return app
+
+def _pts(s: str) -> List[Tuple[float, float]]:
+    out = []
+    for p in s.split("|"):
+        if p and p != "optimize:true":
+            a, b = p.split(",")
+            out.append((float(a), float(b)))
+    return out
+
+def _secs(a: Tuple[float, float], b: Tuple[float, float]) -> int:
+    return int(haversine_km(a[0], a[1], b[0], b[1]) / 35 * 3600) + 60
+
+def google_app(stub: Stub) -> web.Application:
+    async def distance_matrix(request: web.Request) -> web.Response:
+        q = request.query
+        stub.calls["distancematrix"] += 1
+        await stub.delay()
+        if stub.fail():
+            stub.errors["distancematrix"] += 1
+            return web.json_response({"status": "OVER_QUERY_LIMIT", "rows": []})
+        rows = [{"elements": [{"status": "OK", "duration": {"value": _secs(o, d)},
+                               "duration_in_traffic": {"value": _secs(o, d)}}
+                              for d in _pts(q["destinations"])]}
+                for o in _pts(q["origins"])]
+        return web.json_response({"status": "OK", "rows": rows})
+
+    async def directions(request: web.Request) -> web.Response:
+        q = request.query
+        stub.calls["directions"] += 1
+        await stub.delay()
+        if stub.fail():
+            stub.errors["directions"] += 1
+            return web.Response(status=500, text="stub error")
+        stops = _pts(q.get("waypoints", ""))
+        seq = _pts(q["origin"]) + stops + _pts(q["destination"])
+        legs = [{"duration": {"value": _secs(a, b)}} for a, b in zip(seq, seq[1:])]
+        return web.json_response({"status": "OK", "routes": [{"waypoint_order": list(range(len(stops))),
+                                                              "legs": legs}]})
+
+    app = web.Application()
+    app.router.add_get("/maps/api/distancematrix/json", distance_matrix)
+    app.router.add_get("/maps/api/directions/json", directions)
+    return app
+
+async def serve(app: web.Application) -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+# ───────── Client ASGI (fără rețea) ─────────
+async def asgi_post(app, path: str, body: bytes) -> int:
+    msgs = [{"type": "http.request", "body": body, "more_body": False}]
+    status = [0]
+
+    async def receive():
+        return msgs.pop(0) if msgs else {"type": "http.disconnect"}
+
+    async def send(m):
+        if m["type"] == "http.response.start":
+            status[0] = m["status"]
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"content-type", b"application/json")], "client": ("127.0.0.1", 1),
+             "server": ("127.0.0.1", 80), "scheme": "http"}
+    await app(scope, receive, send)
+    return status[0]
+
+# ───────── Update-uri sintetice ─────────
+KINDS = {"code": 0.35, "callback": 0.25, "location": 0.10, "route": 0.30}
+
+class Synth:
+    def __init__(self, keys: List[Tuple[str, int]], seed: int):
+        self.keys = keys
+        self.rnd = random.Random(seed)
+        self.next_id = 1
+
+    def _user(self, chat: int) -> Dict[str, Any]:
+        return {"id": chat, "is_bot": False, "first_name": f"u{chat}"}
+
+    def _message(self, chat: int, **extra) -> Dict[str, Any]:
+        return {"message_id": self.next_id, "date": int(time.time()),
+                "chat": {"id": chat, "type": "private"}, "from": self._user(chat), **extra}
+
+    def _code(self) -> str:
+        code, n = self.rnd.choice(self.keys)
+        return f"{code}{n}"
+
+    def make(self, chat: int) -> Tuple[str, Dict[str, Any]]:
+        kind = self.rnd.choices(list(KINDS), weights=list(KINDS.values()))[0]
+        uid = self.next_id
+        self.next_id += 1
+        if kind == "code":
+            upd = {"message": self._message(chat, text=self._code())}
+        elif kind == "route":
+            line = " ".join(self._code() for _ in range(self.rnd.randint(3, 8)))
+            upd = {"message": self._message(chat, text=line)}
+        elif kind == "location":
+            loc = {"latitude": self.rnd.uniform(46.9, 47.1), "longitude": self.rnd.uniform(28.7, 29.0)}
+            upd = {"message": self._message(chat, location=loc)}
+        else:
+            code, n = self.rnd.choice(self.keys)
+            data = self.rnd.choice([f"p:{code}:2", f"i:{code}:{n}", "route:first", "route:loc", "route:first:tw", "home"])
+            upd = {"callback_query": {"id": str(uid), "from": self._user(chat), "chat_instance": str(chat),
+                                      "data": data, "message": self._message(chat, text="…")}}
+        upd["update_id"] = uid
+        return kind, upd
+
+def pct(xs: List[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+def summary_ms(xs: List[float]) -> Dict[str, float]:
+    return {"n": len(xs), "p50": round(pct(xs, 50)*1000, 1), "p90": round(pct(xs, 90)*1000, 1),
+            "p99": round(pct(xs, 99)*1000, 1), "max": round(max(xs, default=0)*1000, 1),
+            "mean": round(statistics.fmean(xs)*1000, 1) if xs else 0.0}
+
+# ───────── Rularea ─────────
+async def run(args) -> Dict[str, Any]:
+    tg_stub = Stub(args.tg_latency_ms, args.tg_error_rate, seed=args.seed)
+    g_stub = Stub(args.google_latency_ms, args.google_error_rate, seed=args.seed + 1)
+    tg_runner, tg_base = await serve(telegram_app(tg_stub, args.tg_retry_after))
+    g_runner, g_base = await serve(google_app(g_stub))
+    tmp = tempfile.mkdtemp(prefix="loadtest-")
+
+    # configurarea serverului se citește la import: env întâi
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:loadtest", "TELEGRAM_API_BASE": tg_base,
+        "GOOGLE_API_KEY": "loadtest", "GOOGLE_API_BASE": g_base,
+        "WEBHOOK_SECRET": "loadtest", "DATA_WATCH_S": "0",
+        "SESSION_BACKEND": "memory", "WEBHOOK_LOCK": os.path.join(tmp, "webhook.lock"),
+        "DM_CACHE_PATH": os.path.join(tmp, "dm_cache.sqlite3") if args.dm_cache else "",
+    })
+    os.environ.pop("BASE_URL", None)
+    os.environ.pop("RENDER_EXTERNAL_URL", None)
+    import server
+
+    done: Dict[int, asyncio.Future] = {}
+    process = server._process_update
+
+    async def timed(update):
+        try:
+            await process(update)
+        finally:
+            fut = done.pop(update.update_id, None)
+            if fut is not None and not fut.done():
+                fut.set_result(time.perf_counter())
+    server._process_update = timed        # coada îl ia din modul la startup
+
+    async with server.app.router.lifespan_context(server.app):   # startup/shutdown ca sub uvicorn
+        cat = await server.bot_module.ensure_catalog()
+        synth = Synth(cat.keys(), seed=args.seed)
+        path = f"/webhook/{server.WEBHOOK_SECRET}"
+        loop = asyncio.get_running_loop()
+
+        ack: List[float] = []
+        e2e: Dict[str, List[float]] = defaultdict(list)
+        http_errors: Counter = Counter()
+        timeouts = 0
+        budget = [args.updates]
+
+        async def user(chat: int):
+            nonlocal timeouts
+            rnd = random.Random(chat)
+            await asyncio.sleep(rnd.uniform(0, args.think_ms / 1000))       # pornire eșalonată
+            while budget[0] > 0:
+                budget[0] -= 1
+                kind, upd = synth.make(chat)
+                fut = done[upd["update_id"]] = loop.create_future()
+                t0 = time.perf_counter()
+                status = await asgi_post(server.app, path, json.dumps(upd).encode())
+                ack.append(time.perf_counter() - t0)
+                if status != 200:
+                    http_errors[status] += 1
+                    done.pop(upd["update_id"], None)
+                else:
+                    try:
+                        t1 = await asyncio.wait_for(fut, args.timeout_s)
+                        e2e[kind].append(t1 - t0)
+                    except asyncio.TimeoutError:
+                        timeouts += 1
+                if args.think_ms:
+                    await asyncio.sleep(rnd.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(user(100000 + u) for u in range(args.users)))
+        elapsed = time.perf_counter() - t_start
+        queue = server.app.state.queue.stats()
+        send = server.SEND_LIMITER.stats()
+        fallbacks = {f"{k}/{r}": v for (k, r), v in server.metrics.FALLBACKS._v.items()}
+    await tg_runner.cleanup()
+    await g_runner.cleanup()
+
+    all_e2e = [x for xs in e2e.values() for x in xs]
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "elapsed_s": round(elapsed, 2),
+        "completed": len(all_e2e),
+        "throughput_ups": round(len(all_e2e) / elapsed, 1) if elapsed else 0.0,
+        "ack_ms": summary_ms(ack),
+        "e2e_ms": summary_ms(all_e2e),
+        "e2e_by_kind_ms": {k: summary_ms(v) for k, v in sorted(e2e.items())},
+        "errors": {"http": dict(http_errors), "timeouts": timeouts, "handler_failed": queue["failed"],
+                   "telegram_injected": dict(tg_stub.errors), "google_injected": dict(g_stub.errors),
+                   "retry_after_429": send["retry_after"], "fallbacks": fallbacks},
+        "calls": {"telegram": dict(tg_stub.calls), "google": dict(g_stub.calls)},
+        "queue": {"max_pending_seen": queue["max_pending_seen"], "wait_avg_ms": queue["wait_avg_ms"],
+                  "wait_max_ms": queue["wait_max_ms"]},
+        "send_limiter": send,
+    }
+
+def report(r: Dict[str, Any]) -> None:
+    print(f"\n⏱  {r['completed']} update-uri în {r['elapsed_s']} s → {r['throughput_ups']} update-uri/s")
+    row = lambda name, s: print(f"  {name:<10} n={s['n']:<6} p50={s['p50']:>8.1f}  p90={s['p90']:>8.1f}  "
+                                f"p99={s['p99']:>8.1f}  max={s['max']:>8.1f} ms")
+    row("ack", r["ack_ms"])
+    row("complet", r["e2e_ms"])
+    for kind, s in r["e2e_by_kind_ms"].items():
+        row(kind, s)
+    print(f"  erori: {json.dumps(r['errors'], ensure_ascii=False)}")
+    print(f"  apeluri: {json.dumps(r['calls'], ensure_ascii=False)}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Test de încărcare pentru server.py cu stub-uri locale Telegram/Google.")
+    ap.add_argument("--users", type=int, default=100, help="utilizatori virtuali (chat-uri) simultani")
+    ap.add_argument("--updates", type=int, default=2000, help="update-uri în total")
+    ap.add_argument("--think-ms", type=float, default=1000, help="pauza medie între update-urile unui utilizator")
+    ap.add_argument("--timeout-s", type=float, default=60)
+    ap.add_argument("--tg-latency-ms", type=float, default=30)
+    ap.add_argument("--tg-error-rate", type=float, default=0.0, help="fracțiune de răspunsuri 429")
+    ap.add_argument("--tg-retry-after", type=int, default=1)
+    ap.add_argument("--google-latency-ms", type=float, default=150)
+    ap.add_argument("--google-error-rate", type=float, default=0.0)
+    ap.add_argument("--dm-cache", action="store_true", help="cache Distance Matrix pe disc (temporar)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=None, help="rezultatele și în JSON")
+    args = ap.parse_args()
+
+    r = asyncio.run(run(args))
+    report(r)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(r, f, ensure_ascii=False, indent=1)
+        print(f"✅ {args.out}")
+
+if __name__ == "__main__":
+    main()
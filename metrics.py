@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+metrics.py — contoare și histograme în memorie, expuse în formatul text Prometheus.
+
+Fără dependențe și fără server extern: un inc()/observe() e o adunare într-un
+dict, iar render() construiește textul pentru /metrics doar la citire.
+Valorile care există deja în alte obiecte (stats() ale cozii, cache-urilor)
+se citesc la scrape prin add_collector(), fără contoare duplicate.
+"""
+import math
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]          # (sufix, etichete, valoare)
+
+# secunde: de la 1 ms (cache) la 30 s (Google lent + reîncercări)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _esc(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in labels.items()) + "}"
+
+def _fmt_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._v: Dict[Labels, float] = {}
+
+    def inc(self, *label_values: str, n: float = 1.0) -> None:
+        self._v[label_values] = self._v.get(label_values, 0.0) + n
+
+    def value(self, *label_values: str) -> float:
+        return self._v.get(label_values, 0.0)
+
+    def samples(self) -> Iterable[Sample]:
+        for lv, v in self._v.items():
+            yield "_total", dict(zip(self.labels, lv)), v
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._v: Dict[Labels, List[float]] = {}     # [count per bucket..., +Inf, sum]
+
+    def observe(self, value: float, *label_values: str) -> None:
+        h = self._v.get(label_values)
+        if h is None:
+            h = self._v[label_values] = [0.0] * (len(self.buckets) + 2)
+        h[bisect_left(self.buckets, value)] += 1   # pragul e inclusiv (le)
+        h[-1] += value
+
+    def count(self, *label_values: str) -> int:
+        h = self._v.get(label_values)
+        return int(sum(h[:-1])) if h else 0
+
+    def samples(self) -> Iterable[Sample]:
+        for lv, h in self._v.items():
+            base = dict(zip(self.labels, lv))
+            acc = 0.0
+            for le, c in zip(self.buckets + (math.inf,), h[:-1]):
+                acc += c
+                yield "_bucket", {**base, "le": _fmt_value(le)}, acc
+            yield "_count", base, acc
+            yield "_sum", base, h[-1]
+
+class Gauge:
+    """Valoare calculată la scrape: fn() -> {tuplu etichete: valoare}.
+    kind="counter" pentru totaluri ținute de alt obiect (ex.: hits ale unui cache)."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Dict[Labels, float]], labels: Sequence[str] = (),
+                 kind: str = "gauge"):
+        self.name, self.help, self.labels, self.fn, self.kind = name, help, tuple(labels), fn, kind
+
+    def samples(self) -> Iterable[Sample]:
+        suffix = "_total" if self.kind == "counter" else ""
+        for lv, v in self.fn().items():
+            yield suffix, dict(zip(self.labels, lv)), v
+
+REGISTRY: List[Any] = []
+
+def register(m):
+    REGISTRY.append(m)
+    return m
+
+def add_collector(name: str, help: str, fn: Callable[[], Dict[Labels, float]],
+                  labels: Sequence[str] = (), kind: str = "gauge") -> Gauge:
+    return register(Gauge(name, help, fn, labels, kind))
+
+def render() -> str:
+    out: List[str] = []
+    for m in REGISTRY:
+        try:
+            samples = list(m.samples())
+        except Exception as e:          # un colector stricat nu strică tot scrape-ul
+            out.append(f"# {m.name}: {e!r}")
+            continue
+        head = m.name + ("_total" if m.kind == "counter" else "")   # formatul text 0.0.4
+        out.append(f"# HELP {head} {m.help}")
+        out.append(f"# TYPE {head} {m.kind}")
+        for suffix, labels, v in samples:
+            out.append(f"{m.name}{suffix}{_fmt_labels(labels)} {_fmt_value(v)}")
+    return "\n".join(out) + "\n"
+
+# ───────── Metricile botului ─────────
+UPDATES = register(Counter("bot_updates", "Update-uri procesate, pe handler și rezultat", ("handler", "status")))
+HANDLER_SECONDS = register(Histogram("bot_handler_seconds", "Durata handler-elor", ("handler",)))
+GOOGLE_REQUESTS = register(Counter("google_api_requests", "Cereri HTTP către Google, pe API și status", ("api", "status")))
+GOOGLE_SECONDS = register(Histogram("google_api_seconds", "Durata unei cereri Google", ("api",)))
+DM_CACHE_CELLS = register(Counter("dm_cache_cells", "Celule Distance Matrix din cache (hit) sau cerute (miss)", ("result",)))
+FALLBACKS = register(Counter("bot_fallbacks", "Rezerve folosite în locul Google (tsp/haversine)", ("kind", "reason")))
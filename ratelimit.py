@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ratelimit.py — ritmul apelurilor către Bot API (token bucket per chat + global).
+
+Limitele Telegram: ~30 mesaje/s pe bot, ~1/s într-un chat privat (scurte
+rafale tolerate), 20/min într-un grup. SendLimiter rezervă câte un jeton din
+găleata chat-ului și din cea globală și așteaptă cât e nevoie; la un 429
+(TelegramRetryAfter) golește găleata pe retry_after secunde și reîncearcă.
+SendRateLimit e middleware-ul de sesiune aiogram care aplică totul fiecărui
+apel făcut prin Bot.
+"""
+import time, asyncio
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+import tracing
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock=time.monotonic):
+        self.rate = rate                # jetoane pe secundă
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.t = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+
+    def reserve(self) -> float:
+        """Ia un jeton (și pe datorie) și întoarce câte secunde trebuie așteptat."""
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def block(self, seconds: float) -> None:
+        """Niciun jeton până peste `seconds` (retry_after de la Telegram)."""
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+class SendLimiter:
+    def __init__(self, global_per_s: float = 30.0, chat_per_s: float = 1.0, chat_burst: float = 3.0,
+                 group_per_min: float = 20.0, max_chats: int = 10000):
+        self.chat_per_s = chat_per_s
+        self.chat_burst = chat_burst
+        self.group_per_min = group_per_min
+        self.max_chats = max_chats
+        self.glob = TokenBucket(global_per_s, global_per_s)
+        self._chats: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self.calls = 0
+        self.delayed = 0
+        self.wait_total_s = 0.0
+        self.retry_after = 0
+
+    def _bucket(self, chat: Hashable) -> TokenBucket:
+        b = self._chats.get(chat)
+        if b is None:
+            group = isinstance(chat, str) or (isinstance(chat, int) and chat < 0)   # grup/canal
+            b = (TokenBucket(self.group_per_min / 60, min(self.chat_burst, self.group_per_min)) if group
+                 else TokenBucket(self.chat_per_s, self.chat_burst))
+            self._chats[chat] = b
+            while len(self._chats) > self.max_chats:   # cel mai vechi chat revine oricum la găleata plină
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat)
+        return b
+
+    async def acquire(self, chat: Optional[Hashable] = None) -> float:
+        wait = self.glob.reserve()
+        if chat is not None:
+            wait = max(wait, self._bucket(chat).reserve())
+        self.calls += 1
+        if wait > 0:
+            self.delayed += 1
+            self.wait_total_s += wait
+            await asyncio.sleep(wait)
+        return wait
+
+    def blocked(self, chat: Optional[Hashable], seconds: float) -> None:
+        self.retry_after += 1
+        if chat is not None:
+            self._bucket(chat).block(seconds)
+        else:
+            self.glob.block(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "delayed": self.delayed, "retry_after": self.retry_after,
+                "wait_total_s": round(self.wait_total_s, 2), "chats": len(self._chats)}
+
+class SendRateLimit(BaseRequestMiddleware):
+    """bot.session.middleware(SendRateLimit(limiter)) — ritm + reîncercare la 429."""
+    def __init__(self, limiter: SendLimiter, max_retries: int = 3):
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    async def __call__(self, make_request, bot, method):
+        chat = getattr(method, "chat_id", None)
+        name = type(method).__name__
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            if await self.limiter.acquire(chat):
+                tracing.record("tg:rate_wait", t0)
+            try:
+                with tracing.span(f"tg:{name}"):
+                    return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                print(f"[WARN] 429 {name} chat={chat}: retry_after={e.retry_after}s")
+                self.limiter.blocked(chat, e.retry_after)
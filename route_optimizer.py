@@ -1,12 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, sys, re, json, math, argparse, datetime as dt
-from typing import List, Tuple, Dict, Any
+import os, sys, re, json, asyncio, argparse, datetime as dt
+from typing import List, Tuple, Dict, Any, Optional
+from zoneinfo import ZoneInfo
 from urllib.parse import urlencode
-import requests
 from dotenv import load_dotenv
 
+import gmaps
+from geo import travel_seconds_matrix
+from tsp import solve_path
+from schedule import week_intervals, relative_windows, plan_time_windows
+from fleet import DEPOTS, depot_key, split_routes, route_cost
+from sqlite_cache import SQLiteCache
+
 # ───────── Config ─────────
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")  # ai zis că așa se numește la tine
@@ -14,6 +21,8 @@ if not GOOGLE_API_KEY:
     raise SystemExit("❌ Lipsă GOOGLE_API_KEY în .env")
 
 DATA_DIR = "data"
+TZ = ZoneInfo("Europe/Chisinau")
+
 BRANDS = {
     "l":  ("Linella",     "linella_for_bot.json"),
     "f":  ("Fidesco",     "fidesco_for_bot.json"),
@@ -24,14 +33,6 @@ BRANDS = {
 }
 
 # ───────── Helpers ─────────
-def haversine_km(lat1, lon1, lat2, lon2) -> float:
-    R = 6371.0088
-    p1, p2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dl   = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(p1)*math.cos(p2)*math.sin(dl/2)**2
-    return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1-a)))
-
 def fmt_dur(seconds: int) -> str:
     m = max(0, int(round(seconds/60)))
     h, m = divmod(m, 60)
@@ -93,72 +94,84 @@ def get_points_and_labels(pairs: List[Tuple[str,int]]) -> Tuple[List[Tuple[float
         labels.append(f"{BRANDS[code][0]} {num} — {item.get('address','—')}")
     return coords, labels
 
+def get_hours(pairs: List[Tuple[str,int]]) -> List[Dict[str,str]]:
+    return [(DATA_BY_BRAND.get(code, {}).get(str(num)) or {}).get("hours") or {} for code, num in pairs]
+
 # ───────── Distance Matrix (cu trafic) ─────────
-def distance_matrix_seconds(origins: List[Tuple[float,float]], destinations: List[Tuple[float,float]]) -> List[List[int]]:
-    base = "https://maps.googleapis.com/maps/api/distancematrix/json"
-    o_param = "|".join("{:.6f},{:.6f}".format(lat, lon) for lat,lon in origins)
-    d_param = "|".join("{:.6f},{:.6f}".format(lat, lon) for lat,lon in destinations)
-    params = {
-        "origins": o_param,
-        "destinations": d_param,
-        "mode": "driving",
-        "departure_time": "now",
-        "traffic_model": "best_guess",
-        "key": GOOGLE_API_KEY
-    }
-    r = requests.get(base, params=params, timeout=20)
-    r.raise_for_status()
-    js = r.json()
-    if js.get("status") != "OK":
-        raise RuntimeError(f"DistanceMatrix status: {js.get('status')}")
-    rows = js.get("rows", [])
-    mat = []
-    for row in rows:
-        arr = []
-        for el in row.get("elements", []):
-            if el.get("status") != "OK":
-                arr.append(10**9)
-            else:
-                sec = el.get("duration_in_traffic", el.get("duration", {})).get("value", 10**9)
-                arr.append(int(sec))
-        mat.append(arr)
-    return mat
-
-# ───────── TSP: nearest neighbor + 2-opt ─────────
-def tsp_nearest_then_two_opt(dmat: List[List[int]], start_idx: int = 0) -> List[int]:
-    n = len(dmat)
-    unvisited = set(range(n))
-    path = [start_idx]
-    unvisited.remove(start_idx)
-    cur = start_idx
-    while unvisited:
-        nxt = min(unvisited, key=lambda j: dmat[cur][j])
-        path.append(nxt)
-        unvisited.remove(nxt)
-        cur = nxt
-
-    def path_cost(p):
-        return sum(dmat[p[i]][p[i+1]] for i in range(len(p)-1))
-
-    improved = True
-    best = path[:]
-    best_cost = path_cost(best)
-    while improved:
-        improved = False
-        for i in range(1, len(best)-2):
-            for k in range(i+1, len(best)-1):
-                newp = best[:i] + best[i:k+1][::-1] + best[k+1:]
-                c = path_cost(newp)
-                if c < best_cost:
-                    best, best_cost = newp, c
-                    improved = True
-    return best
+def distance_matrix_seconds(origins: List[Tuple[float,float]], destinations: List[Tuple[float,float]],
+                            cache: Optional[SQLiteCache] = None,
+                            when: Optional[dt.datetime] = None) -> List[List[int]]:
+    """Matrice origini × destinații (secunde), prin cache-ul pe disc + plăci concurente (gmaps.py)."""
+    return asyncio.run(gmaps.cached_distance_matrix(origins, destinations, GOOGLE_API_KEY,
+                                                    cache=cache, when=when))
+
+def travel_matrix(points: List[Tuple[float,float]]) -> List[List[int]]:
+    """Distance Matrix cu trafic; dacă API-ul pică, estimare haversine la 35 km/h."""
+    try:
+        return distance_matrix_seconds(points, points)
+    except Exception as e:
+        print(f"⚠️  Distance Matrix indisponibil ({e}) — folosesc estimarea în linie dreaptă.")
+        return travel_seconds_matrix(points).tolist()
+
+# ───────── Rută cu program (ferestre orare) ─────────
+def parse_depart(text: Optional[str]) -> dt.datetime:
+    now = dt.datetime.now(TZ)
+    if not text:
+        return now
+    h, m = (int(x) for x in text.split(":"))
+    return now.replace(hour=h, minute=m, second=0, microsecond=0)
+
+def print_hours_plan(pts: List[Tuple[float,float]], labels: List[str], hours: List[Dict[str,str]],
+                     depart: dt.datetime, first_label: Optional[str], service_min: int, max_wait_min: int):
+    """pts[0] = plecarea; labels/hours descriu pts[1:]."""
+    mat = travel_matrix(pts)
+    hint, solver = solve_path(mat, start_idx=0)
+    wins = [None] + [relative_windows(week_intervals(h), depart) for h in hours]
+    order, starts, dropped = plan_time_windows(mat, wins, hint, service_s=service_min*60, max_wait_s=max_wait_min*60)
+    if not order:
+        raise SystemExit("❌ Niciun magazin nu e deschis la ora estimată de sosire.")
+    finish = depart + dt.timedelta(seconds=starts[-1] + service_min*60)
+    print(f"🚗 Rută cu program (plecare {depart:%H:%M}, {service_min} min/oprire):")
+    print(f"Final estimat: ~{finish:%H:%M}  (solver: {solver})\n")
+    lines = [f"🚩 {depart:%H:%M} {first_label}"] if first_label else []
+    lines += [f"🕒 {depart + dt.timedelta(seconds=s):%H:%M} {labels[x-1]}" for x, s in zip(order, starts)]
+    for i, line in enumerate(lines, 1):
+        print(f"{i}. {line}")
+    if dropped:
+        print("\n⛔ Închise la sosire (scoase din rută):")
+        for x in dropped:
+            print(f"   • {labels[x-1]}")
+    print("\n🗺️", build_gmaps_directions_url([pts[0]] + [pts[x] for x in order]))
+
+# ───────── Rute pe echipe (mai mulți tehnicieni) ─────────
+def print_team_plan(techs: List[str], coords: List[Tuple[float,float]], labels: List[str],
+                    capacity: Optional[int], service_min: int):
+    starts = [(DEPOTS[k][1], DEPOTS[k][2]) for k in techs]
+    pts = starts + coords
+    mat = travel_matrix(pts)
+    m = len(techs)
+    routes = split_routes(mat, list(range(m)), list(range(m, len(pts))),
+                          capacity=capacity, service_s=service_min*60)
+    for r, path in enumerate(routes, 1):
+        print(f"👷 Tehnician {r} — start {DEPOTS[techs[r-1]][0]}: "
+              f"~{fmt_dur(route_cost(mat, path, service_min*60))} ({len(path)-1} opriri, {service_min} min/oprire)")
+        for i, x in enumerate(path[1:], 1):
+            print(f"   {i}. {labels[x-m]}")
+        if len(path) > 1:
+            print("   🗺️", build_gmaps_directions_url([pts[x] for x in path]))
+        print()
 
 # ───────── Main CLI ─────────
 def main():
     ap = argparse.ArgumentParser(description="Optimizează ruta între magazine (trafic live, Distance Matrix).")
     ap.add_argument("query", help='Ex: "l5 c30 fo70" sau "l5, c30, fo70"')
     ap.add_argument("--origin", help="Lat,Lon pentru punctul de start (ex: 47.010,28.863). Dacă lipsește, start = primul punct.")
+    ap.add_argument("--hours", action="store_true", help="Ține cont de programul magazinelor (scoate/reordonează ce e închis la sosire).")
+    ap.add_argument("--depart", help="Ora plecării HH:MM (azi), pentru --hours. Implicit: acum.")
+    ap.add_argument("--service", type=int, default=15, help="Minute petrecute la fiecare magazin (--hours).")
+    ap.add_argument("--max-wait", type=int, default=30, help="Minute maxime de așteptat la deschidere (--hours).")
+    ap.add_argument("--techs", help=f"Depourile tehnicienilor, separate prin virgulă (ex: takeit,fructe). Chei: {', '.join(DEPOTS)}")
+    ap.add_argument("--capacity", type=int, help="Maxim opriri per tehnician (--techs).")
     args = ap.parse_args()
 
     pairs = parse_multi_codes(args.query)
@@ -190,6 +203,24 @@ def main():
 
     coords, labels = get_points_and_labels(norm)
 
+    if args.techs:
+        techs = [depot_key(t) for t in args.techs.split(",") if t.strip()]
+        if not techs or None in techs:
+            raise SystemExit(f"❌ Depou necunoscut în --techs. Chei: {', '.join(DEPOTS)}")
+        print_team_plan(techs, coords, labels, args.capacity, args.service)
+        return
+
+    if args.hours:
+        depart = parse_depart(args.depart)
+        hours = get_hours(norm)
+        if args.origin:
+            lat_s, lon_s = args.origin.split(",")
+            origin = (float(lat_s.strip()), float(lon_s.strip()))
+            print_hours_plan([origin] + coords, labels, hours, depart, None, args.service, args.max_wait)
+        else:
+            print_hours_plan(coords, labels[1:], hours[1:], depart, labels[0], args.service, args.max_wait)
+        return
+
     # ORIGIN
     if args.origin:
         try:
@@ -197,8 +228,8 @@ def main():
             origin = (float(lat_s.strip()), float(lon_s.strip()))
             # set-up TSP pe puncte: origin + destinațiile
             pts = [origin] + coords
-            mat = distance_matrix_seconds(pts, pts)
-            order = tsp_nearest_then_two_opt(mat, start_idx=0)
+            mat = travel_matrix(pts)
+            order, solver = solve_path(mat, start_idx=0)
             ordered_idx = [i for i in order if i != 0]
             ordered_points = [pts[i] for i in ordered_idx]
             ordered_labels = [labels[i-1] for i in ordered_idx]
@@ -207,7 +238,7 @@ def main():
                 total_s += mat[a][b]
             url = build_gmaps_directions_url([origin] + ordered_points)
             print("🚗 Rută optimizată (trafic actual, start = origin dat):")
-            print(f"Durată estimată: ~{fmt_dur(total_s)}\n")
+            print(f"Durată estimată: ~{fmt_dur(total_s)}  (solver: {solver})\n")
             for i, name in enumerate(ordered_labels, 1):
                 print(f"{i}. {name}")
             print("\n🗺️", url)
@@ -216,14 +247,14 @@ def main():
             raise SystemExit(f"❌ Eroare origin: {e}")
 
     # fără origin -> start din primul punct
-    mat = distance_matrix_seconds(coords, coords)
-    order = tsp_nearest_then_two_opt(mat, start_idx=0)
+    mat = travel_matrix(coords)
+    order, solver = solve_path(mat, start_idx=0)
     ordered_points = [coords[i] for i in order]
     ordered_labels = [labels[i] for i in order]
     total_s = sum(mat[a][b] for a, b in zip(order[:-1], order[1:]))
     url = build_gmaps_directions_url(ordered_points)
     print("🚗 Rută optimizată (trafic actual, start = primul punct):")
-    print(f"Durată estimată: ~{fmt_dur(total_s)}\n")
+    print(f"Durată estimată: ~{fmt_dur(total_s)}  (solver: {solver})\n")
     for i, name in enumerate(ordered_labels, 1):
         print(f"{i}. {name}")
     print("\n🗺️", url)
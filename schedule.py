@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+schedule.py — programul magazinelor ca intervale pe săptămână + rutare cu ferestre orare.
+
+Orele din `hours` (mon..sun) devin intervale [start, end) în minute de la
+luni 00:00. ScheduleTable le compilează o singură dată pentru toate
+magazinele (array-uri int32), așa că „deschis acum?” e un bisect, iar
+„care magazine sunt deschise la ora T” e o singură operație vectorizată.
+plan_time_windows primește timpii de parcurs și ordinea propusă de tsp.py
+și scoate sau reordonează opririle la care tehnicianul ar ajunge cu
+magazinul închis; întoarce și ora estimată a fiecărei opriri.
+"""
+import re, datetime as dt
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DAYS = ["mon","tue","wed","thu","fri","sat","sun"]
+DAY_MIN = 24*60
+WEEK_MIN = 7*DAY_MIN
+
+TW_IMPROVE_MAX = 30   # peste atâtea opriri sărim peste relocări (O(n³))
+
+_TIME_RGX = re.compile(r"(\d{1,2})[:.](\d{2})\s*[-–—]\s*(\d{1,2})[:.](\d{2})")
+_ALWAYS = ("nonstop", "non-stop", "24/7", "24 de ore", "24 hours", "open 24")
+_CLOSED = ("închis", "inchis", "closed")
+
+Interval = Tuple[int, int]
+
+# ───────── Program ─────────
+def day_intervals(text: str) -> Optional[List[Interval]]:
+    """Intervale (minute de la 00:00) pentru o zi; [] = închis, None = necunoscut."""
+    t = (text or "").strip().lower()
+    if not t or t == "nan":
+        return None
+    out = []
+    for m in _TIME_RGX.finditer(t):
+        h1, m1, h2, m2 = map(int, m.groups())
+        a, b = h1*60 + m1, h2*60 + m2
+        if b <= a:            # peste miezul nopții (00:00–00:00 = toată ziua)
+            b += DAY_MIN
+        out.append((a, b))
+    if out:
+        return out
+    if any(w in t for w in _ALWAYS):
+        return [(0, DAY_MIN)]
+    if any(w in t for w in _CLOSED):
+        return []
+    return None
+
+def _merge(raw: List[Interval]) -> List[Interval]:
+    raw = sorted(raw)
+    merged: List[Interval] = []
+    for a, b in raw:
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+        else:
+            merged.append((a, b))
+    return merged
+
+def _add_day(raw: List[Interval], day: int, iv: List[Interval]) -> None:
+    base = day*DAY_MIN
+    for a, b in iv:
+        a, b = base + a, base + b
+        if b > WEEK_MIN:   # duminică noaptea → luni dimineața
+            raw.append((0, b - WEEK_MIN)); b = WEEK_MIN
+        raw.append((a, b))
+
+def compile_week(hours: Dict[str, str]) -> Tuple[List[Interval], int]:
+    """(intervale cunoscute comasate, biții zilelor fără program: bit 0 = luni)."""
+    raw: List[Interval] = []
+    unknown = 0
+    for i, day in enumerate(DAYS):
+        iv = day_intervals((hours or {}).get(day, ""))
+        if iv is None:
+            unknown |= 1 << i
+        else:
+            _add_day(raw, i, iv)
+    return _merge(raw), unknown
+
+def _with_unknown_open(intervals: List[Interval], unknown: int) -> List[Interval]:
+    raw = list(intervals)
+    for i in range(7):
+        if unknown >> i & 1:
+            _add_day(raw, i, [(0, DAY_MIN)])
+    return _merge(raw)
+
+def week_intervals(hours: Dict[str, str], unknown_open: bool = True) -> Optional[List[Interval]]:
+    """Intervale sortate și comasate în minute-din-săptămână.
+
+    None dacă nicio zi nu are program cunoscut; o zi necunoscută contează
+    deschisă toată ziua când unknown_open (rutare: nu aruncăm din lipsă de date).
+    """
+    intervals, unknown = compile_week(hours)
+    if unknown == 0x7f:
+        return None
+    return _with_unknown_open(intervals, unknown) if unknown_open else intervals
+
+# ───────── Tabel compilat pentru toate magazinele ─────────
+class ScheduleTable:
+    """Intervalele tuturor magazinelor în array-uri plate: magazinul i are
+    starts/ends[offs[i]:offs[i+1]] (sortate), plus biții zilelor fără program."""
+
+    def __init__(self, keys: Sequence[Tuple[str, int]], hours_list: Sequence[Dict[str, str]]):
+        starts: List[int] = []; ends: List[int] = []; offs = [0]; unknown = []
+        for h in hours_list:
+            iv, unk = compile_week(h)
+            starts += [a for a, _ in iv]; ends += [b for _, b in iv]
+            offs.append(len(starts)); unknown.append(unk)
+        self._set(keys, starts, ends, offs, unknown)
+
+    def _set(self, keys, starts, ends, offs, unknown) -> None:
+        self.ids: Dict[Tuple[str, int], int] = {k: i for i, k in enumerate(keys)}
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.ends = np.asarray(ends, dtype=np.int32)
+        self.offs = np.asarray(offs, dtype=np.int32)
+        self.owner = np.repeat(np.arange(len(self.offs) - 1, dtype=np.int32), np.diff(self.offs))
+        self.unknown = np.asarray(unknown, dtype=np.uint8)
+        # copii ca liste Python pentru bisect pe un singur magazin
+        self._starts, self._ends, self._offs = self.starts.tolist(), self.ends.tolist(), self.offs.tolist()
+
+    @classmethod
+    def from_arrays(cls, keys: Sequence[Tuple[str, int]], starts, ends, offs, unknown) -> "ScheduleTable":
+        """Din array-uri deja compilate (ex.: snapshot-ul catalogului), fără reparsare."""
+        t = cls.__new__(cls)
+        t._set(keys, starts, ends, offs, unknown)
+        return t
+
+    def __len__(self) -> int:
+        return len(self.unknown)
+
+    def is_open(self, i: int, mow: int, unknown_open: bool = False) -> bool:
+        lo, hi = self._offs[i], self._offs[i+1]
+        j = bisect_right(self._starts, mow, lo, hi) - 1
+        if j >= lo and mow < self._ends[j]:
+            return True
+        return unknown_open and bool(self.unknown[i] >> (mow // DAY_MIN) & 1)
+
+    def open_mask(self, mow: int, unknown_open: bool = False) -> np.ndarray:
+        """Vector bool (un element per magazin): deschis la minutul-din-săptămână mow."""
+        out = np.zeros(len(self), dtype=bool)
+        hit = (self.starts <= mow) & (mow < self.ends)
+        out[self.owner[hit]] = True
+        if unknown_open:
+            out |= ((self.unknown >> (mow // DAY_MIN)) & 1).astype(bool)
+        return out
+
+    def intervals(self, i: int, unknown_open: bool = True) -> Optional[List[Interval]]:
+        """Ca week_intervals, dar din tabelul compilat."""
+        lo, hi = self._offs[i], self._offs[i+1]
+        iv = list(zip(self._starts[lo:hi], self._ends[lo:hi]))
+        unk = int(self.unknown[i])
+        if unk == 0x7f:
+            return None
+        return _with_unknown_open(iv, unk) if unknown_open else iv
+
+def minute_of_week(t: dt.datetime) -> int:
+    return t.weekday()*DAY_MIN + t.hour*60 + t.minute
+
+def relative_windows(intervals: Optional[List[Interval]], depart: dt.datetime,
+                     horizon_s: int = 2*24*3600) -> Optional[List[Tuple[float, float]]]:
+    """Intervalele săptămânale ca secunde față de plecare, pe orizontul dat."""
+    if intervals is None:
+        return None
+    t0 = minute_of_week(depart)*60 + depart.second
+    out = []
+    for week in (-1, 0, 1, 2):
+        shift = week*WEEK_MIN*60 - t0
+        for a, b in intervals:
+            s, e = a*60 + shift, b*60 + shift
+            if e > 0 and s < horizon_s:
+                out.append((float(s), float(e)))
+    out.sort()
+    return out
+
+# ───────── Rutare cu ferestre orare ─────────
+def _ready(wins, t: float) -> Optional[float]:
+    """Cel mai devreme moment >= t în care magazinul e deschis (None = nu mai deschide)."""
+    if wins is None:
+        return t
+    for a, b in wins:
+        if t < b:
+            return max(t, a)
+    return None
+
+def _walk(d, wins, order: Sequence[int], service_s: float, max_wait_s: float):
+    """(ore de începere per oprire, ora de final) sau (parțial, None) la prima oprire ratată."""
+    t = 0.0; prev = 0; starts: List[float] = []
+    for x in order:
+        t += d[prev][x]
+        r = _ready(wins[x], t)
+        if r is None or r - t > max_wait_s:
+            return starts, None
+        starts.append(r)
+        t = r + service_s
+        prev = x
+    return starts, t
+
+def plan_time_windows(dmat, wins: Sequence[Optional[List[Tuple[float, float]]]], order_hint: Sequence[int],
+                      service_s: float = 15*60, max_wait_s: float = 30*60) -> Tuple[List[int], List[float], List[int]]:
+    """Nodul 0 = plecarea (t=0). wins[i]: ferestre (secunde față de plecare) sau None.
+
+    Întoarce (ordine, ora de începere a fiecărei opriri în secunde, opriri scoase).
+    """
+    d = dmat.tolist() if hasattr(dmat, "tolist") else dmat
+    ok = lambda seq: _walk(d, wins, seq, service_s, max_wait_s)[1]
+
+    def repair(seq):
+        kept, dropped = [], []
+        for x in seq:
+            (kept if ok(kept + [x]) is not None else dropped).append(x)
+        return kept, dropped
+
+    def greedy(stops):
+        # următoarea oprire = cea la care putem începe cel mai devreme
+        kept, t, prev, rem = [], 0.0, 0, set(stops)
+        while rem:
+            best = None
+            for x in rem:
+                arr = t + d[prev][x]
+                r = _ready(wins[x], arr)
+                if r is None or r - arr > max_wait_s:
+                    continue
+                if best is None or (r, d[prev][x]) < best[0]:
+                    best = ((r, d[prev][x]), x)
+            if best is None:
+                break
+            (r, _), x = best
+            kept.append(x); rem.discard(x)
+            t, prev = r + service_s, x
+        return kept, [x for x in stops if x in rem]
+
+    def reinsert(kept, dropped):
+        still = []
+        for x in dropped:
+            best = None
+            for pos in range(len(kept) + 1):
+                fin = ok(kept[:pos] + [x] + kept[pos:])
+                if fin is not None and (best is None or fin < best[0]):
+                    best = (fin, pos)
+            if best is None:
+                still.append(x)
+            else:
+                kept = kept[:best[1]] + [x] + kept[best[1]:]
+        return kept, still
+
+    def relocate(kept):
+        if len(kept) > TW_IMPROVE_MAX:
+            return kept
+        best_fin = ok(kept)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(kept)):
+                rest = kept[:i] + kept[i+1:]
+                for pos in range(len(rest) + 1):
+                    if pos == i:
+                        continue
+                    cand = rest[:pos] + [kept[i]] + rest[pos:]
+                    fin = ok(cand)
+                    if fin is not None and fin < best_fin - 1e-6:
+                        kept, best_fin, improved = cand, fin, True
+                        break
+                if improved:
+                    break
+        return kept
+
+    stops = [x for x in order_hint if x != 0]
+    best = None
+    for kept, dropped in (repair(stops), greedy(stops)):
+        kept, dropped = reinsert(kept, dropped)
+        kept = relocate(kept)
+        score = (-len(kept), ok(kept) or 0.0)
+        if best is None or score < best[0]:
+            best = (score, kept, dropped)
+    _, kept, dropped = best
+    starts, _ = _walk(d, wins, kept, service_s, max_wait_s)
+    return kept, starts, dropped
@@ -1,10 +1,18 @@
 # server.py — Aiogram 3.22 + FastAPI (Render webhook)
+import time
+_T0 = time.perf_counter()
 import os
+import asyncio
 import logging
+from typing import Optional
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import Update
+from aiogram.dispatcher.event.bases import UNHANDLED
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("server")
@@ -13,18 +21,70 @@ log = logging.getLogger("server")
 TOKEN = os.environ.get("TELEGRAM_TOKEN")
 if not TOKEN:
     raise RuntimeError("TELEGRAM_TOKEN lipsește în Environment (Render).")
-bot = Bot(TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+# TELEGRAM_API_BASE: alt server Bot API (local sau stub-ul din loadtest.py); gol = api.telegram.org
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "")
+_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE)) if TELEGRAM_API_BASE else None
+bot = Bot(TOKEN, session=_session, default=DefaultBotProperties(parse_mode="HTML"))
+
+# Ritmul trimiterilor (token bucket per chat + global, reîncercare la 429).
+# Limita globală se împarte între workerii uvicorn.
+from ratelimit import SendLimiter, SendRateLimit
+SEND_LIMITER = SendLimiter(
+    global_per_s=float(os.getenv("SEND_GLOBAL_PER_S", "30")) / max(1, int(os.getenv("WEB_CONCURRENCY", "1"))),
+    chat_per_s=float(os.getenv("SEND_CHAT_PER_S", "1")),
+    chat_burst=float(os.getenv("SEND_CHAT_BURST", "3")),
+    group_per_min=float(os.getenv("SEND_GROUP_PER_MIN", "20")),
+)
+bot.session.middleware(SendRateLimit(SEND_LIMITER, max_retries=int(os.getenv("SEND_MAX_RETRIES", "3"))))
 
 # 2) Dispatcher + router din bot.py (bot.py NU creează Bot la import)
+import bot as bot_module
+import gmaps
 from bot import router as bot_router
+from updates import ChatQueue, SeenUpdates
+import metrics
+import tracing
+from metrics import UPDATES, HANDLER_SECONDS
 dp = Dispatcher()
 dp.include_router(bot_router)
+
+async def _handler_metrics(handler, event, data):
+    """Middleware interior: numărul și durata fiecărui handler (după numele funcției)."""
+    name = data["handler"].callback.__name__
+    t0 = time.perf_counter()
+    status = "error"
+    try:
+        with tracing.span(f"handler:{name}"):
+            result = await handler(event, data)
+        status = "ok"
+        return result
+    finally:
+        HANDLER_SECONDS.observe(time.perf_counter() - t0, name)
+        UPDATES.inc(name, status)
+
+dp.message.middleware(_handler_metrics)
+dp.callback_query.middleware(_handler_metrics)
 log.info("[routers] Inclus router din bot.py ✅")
+bot_module.STARTUP["import_ms"] = round((time.perf_counter() - _T0)*1000, 1)
 
 # 3) FastAPI + webhook
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "changeme")
 BASE_URL = os.getenv("BASE_URL") or os.getenv("RENDER_EXTERNAL_URL")
 
+# Coada de update-uri: webhook-ul răspunde imediat, workerii procesează (ordonat per chat)
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_MAX = int(os.getenv("UPDATE_QUEUE_MAX", "1000"))
+UPDATE_DRAIN_S = float(os.getenv("UPDATE_DRAIN_S", "20"))
+
+# Mai multe procese (uvicorn --workers $WEB_CONCURRENCY, opțional; implicit 1): starea comună
+# stă în SQLite (sesiuni + update_id-uri văzute), iar webhook-ul îl setează un singur proces.
+# Ordinea FIFO per chat e garantată doar în interiorul unui worker: update-urile aceluiași chat
+# pot ajunge în procese diferite. Catalogul, cache-ul de rute, /metrics, trace-urile și
+# /debug/profile sunt tot per worker.
+STATE_DB = os.getenv("STATE_DB", os.path.join("data", "state.sqlite3"))
+UPDATE_DEDUP_S = float(os.getenv("UPDATE_DEDUP_S", "3600"))
+WEBHOOK_LOCK = os.getenv("WEBHOOK_LOCK", os.path.join("data", "webhook.lock"))
+
 app = FastAPI(title="Telegram Bot Webhook (Render)")
 
 @app.get("/")
@@ -33,30 +93,191 @@ async def health():
         "status": "ok",
         "webhook": f"/webhook/{WEBHOOK_SECRET}",
         "router_included": True,
+        "data": "ready" if bot_module.CATALOG is not None else "loading",
+        "startup": bot_module.STARTUP,
+        "queue": app.state.queue.stats() if getattr(app.state, "queue", None) else None,
+        "route_cache": bot_module.ROUTE_CACHE.stats(),
+        "sessions": bot_module.SESSIONS.stats(),
+        "send": SEND_LIMITER.stats(),
+        "dedup": app.state.seen.stats() if getattr(app.state, "seen", None) else None,
+        "worker": {"pid": os.getpid(), "workers": bot_module.WEB_CONCURRENCY,
+                   "webhook_owner": getattr(app.state, "webhook_lock", None) is not None},
     }
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces/{secret}")
+async def debug_traces(secret: str, slow: bool = False, limit: int = 50):
+    """Ultimele update-uri urmărite (TRACE=1), cu span-urile lor; slow=true doar cele lente."""
+    if secret != WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="bad secret")
+    return {"enabled": tracing.TRACE_ENABLED, "slow_ms": tracing.TRACE_SLOW_MS,
+            "profile_chat": tracing.PROFILE_CHAT, "traces": tracing.snapshot(slow, limit)}
+
+@app.post("/debug/profile/{secret}")
+async def debug_profile(secret: str, chat: Optional[int] = None):
+    """cProfile pe update-urile unui chat (fără chat = oprit); profilele ajung în PROFILE_DIR."""
+    if secret != WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="bad secret")
+    tracing.profile_chat(chat)
+    # cu mai mulți workeri comutatorul schimbă doar procesul care a primit cererea
+    return {"profile_chat": tracing.PROFILE_CHAT, "dir": tracing.PROFILE_DIR,
+            "pid": os.getpid(), "workers": bot_module.WEB_CONCURRENCY}
+
+def _stat_gauges(get_stats, keys):
+    """Colector: câmpurile `keys` din get_stats() (None = componenta nu e pornită)."""
+    def fn():
+        st = get_stats()
+        return {(k,): st[k] for k in keys} if st else {}
+    return fn
+
+def _cache_stats():
+    out = {}
+    for name, st in (("route", bot_module.ROUTE_CACHE.stats()),
+                     ("session", bot_module.SESSIONS.stats().get("cache"))):
+        if st:
+            out[(name, "hit")] = st["hits"]
+            out[(name, "miss")] = st["misses"]
+    return out
+
+_queue_stats = lambda: app.state.queue.stats() if getattr(app.state, "queue", None) else None
+metrics.add_collector("bot_queue", "Coada de update-uri: în așteptare, în lucru, chat-uri",
+                      _stat_gauges(_queue_stats, ("pending", "in_flight", "chats_waiting", "max_pending_seen")), ("state",))
+metrics.add_collector("bot_queue_updates", "Update-uri primite/respinse (503) de coadă",
+                      _stat_gauges(_queue_stats, ("accepted", "rejected")), ("result",), kind="counter")
+metrics.add_collector("bot_cache_lookups", "Căutări în cache-urile din proces", _cache_stats,
+                      ("cache", "result"), kind="counter")
+metrics.add_collector("bot_duplicate_updates", "Retrimiteri Telegram ignorate (update_id deja văzut)",
+                      lambda: {(): app.state.seen.duplicates} if getattr(app.state, "seen", None) else {},
+                      kind="counter")
+metrics.add_collector("telegram_send", "Apeluri Bot API: total, întârziate de limitator, 429",
+                      _stat_gauges(SEND_LIMITER.stats, ("calls", "delayed", "retry_after")), ("kind",), kind="counter")
+metrics.add_collector("bot_catalog_stores", "Magazine în catalogul încărcat",
+                      lambda: {(): len(bot_module.CATALOG)} if bot_module.CATALOG is not None else {})
+
+def update_chat_key(update: Update):
+    """Cheia de ordonare: chat-ul (sau utilizatorul); fără niciunul, update-ul e independent."""
+    try:
+        ev = update.event
+    except Exception:            # tip de update necunoscut de aiogram
+        return ("upd", update.update_id)
+    chat = getattr(ev, "chat", None) or getattr(getattr(ev, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(ev, "from_user", None)
+    return ("u", user.id) if user is not None else ("upd", update.update_id)
+
+async def _process_update(update: Update):
+    tr = tracing.resume(update.update_id)
+    chat = update_chat_key(update)
+    prof = tracing.profiler_for(chat)
+    try:
+        with tracing.span("ensure_catalog"):
+            await bot_module.ensure_catalog()
+        with tracing.span("dispatch"):
+            handled = await dp.feed_update(bot, update)
+        if handled is UNHANDLED:
+            UPDATES.inc("unhandled", "ok")
+    finally:
+        tracing.profiler_done(prof, chat, update.update_id)
+        tracing.finish(tr)
+
+def _update_failed(update: Update, e: BaseException):
+    log.error(f"[update {update.update_id}] {e!r}", exc_info=e)
+
+async def _load_data():
+    await bot_module.ensure_catalog()
+    bot_module.STARTUP["ready_ms"] = round((time.perf_counter() - _T0)*1000, 1)
+    log.info(f"[startup] raport: {bot_module.STARTUP}")
+
+def _webhook_lock():
+    """Lock exclusiv pe fișier: doar procesul care îl obține (re)setează webhook-ul.
+    Întoarce fișierul deschis (ținut până la oprire) sau None dacă îl are alt worker."""
+    os.makedirs(os.path.dirname(WEBHOOK_LOCK) or ".", exist_ok=True)
+    f = open(WEBHOOK_LOCK, "a")
+    try:
+        import fcntl
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except ImportError:           # fără fcntl (Windows, local): un singur proces
+        pass
+    except OSError:
+        f.close()
+        return None
+    return f
+
+async def _register_webhook():
+    url = f"{BASE_URL}/webhook/{WEBHOOK_SECRET}"
+    info = await bot.get_webhook_info()
+    if info.url == url:
+        # deja setat (restart de worker): nu aruncăm update-urile în așteptare
+        log.info(f"[startup] webhook deja setat -> {url}")
+        return
+    await bot.set_webhook(url, drop_pending_updates=True)
+    log.info(f"[startup] set_webhook -> {url}")
+
 @app.on_event("startup")
 async def on_startup():
-    if BASE_URL:
-        url = f"{BASE_URL}/webhook/{WEBHOOK_SECRET}"
-        await bot.set_webhook(url, drop_pending_updates=True)
-        log.info(f"[startup] set_webhook -> {url}")
+    # datele se încarcă în fundal; „/” răspunde imediat, webhook-ul le așteaptă
+    # un singur client HTTP (keep-alive) pentru toate apelurile Google
+    await gmaps.start_session()
+    app.state.data_task = asyncio.create_task(_load_data())
+    app.state.queue = ChatQueue(_process_update, workers=UPDATE_WORKERS, max_pending=UPDATE_QUEUE_MAX,
+                                on_error=_update_failed)
+    app.state.queue.start()
+    app.state.seen = SeenUpdates(STATE_DB if bot_module.WEB_CONCURRENCY > 1 else "", window_s=UPDATE_DEDUP_S)
+    if bot_module.WEB_CONCURRENCY > 1:
+        log.warning(f"[startup] pid {os.getpid()}: {bot_module.WEB_CONCURRENCY} workeri — ordinea update-urilor "
+                    "unui chat e garantată doar în același worker; metricile/trace-urile sunt per worker")
+    # reîncărcare la cald a data/*_for_bot.json (DATA_WATCH_S=0 o oprește)
+    app.state.watch_task = None
+    if bot_module.DATA_WATCH_S > 0:
+        app.state.watch_task = asyncio.create_task(bot_module.watch_data())
+    app.state.webhook_lock = _webhook_lock()
+    if app.state.webhook_lock is None:
+        log.info(f"[startup] pid {os.getpid()}: webhook-ul e gestionat de alt worker")
+    elif BASE_URL:
+        await _register_webhook()
     else:
         log.warning("[startup] BASE_URL/RENDER_EXTERNAL_URL lipsește — setează manual setWebhook din browser.")
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    if getattr(app.state, "watch_task", None):
+        app.state.watch_task.cancel()
+    if getattr(app.state, "queue", None):
+        drained = await app.state.queue.drain(UPDATE_DRAIN_S)
+        log.info(f"[shutdown] coadă {'golită' if drained else 'NEgolită'}: {app.state.queue.stats()}")
+    await gmaps.close_session()
+    await asyncio.to_thread(bot_module.SESSIONS.close)     # scrie sesiunile rămase în așteptare
+    if getattr(app.state, "seen", None):
+        await asyncio.to_thread(app.state.seen.close)
+    if getattr(app.state, "webhook_lock", None) is None:
+        return                      # doar procesul care a setat webhook-ul îl șterge
     try:
         await bot.delete_webhook()
         log.info("[shutdown] delete_webhook OK")
     except Exception as e:
         log.warning(f"[shutdown] delete_webhook err: {e}")
+    app.state.webhook_lock.close()
 
 @app.post("/webhook/{secret}")
 async def telegram_webhook(secret: str, request: Request):
     if secret != WEBHOOK_SECRET:
         raise HTTPException(status_code=403, detail="bad secret")
-    data = await request.json()
-    update = Update.model_validate(data, context={"bot": bot})
-    await dp.feed_update(bot, update)
+    tr = tracing.begin()
+    with tracing.span("webhook"):
+        data = await request.json()
+        update = Update.model_validate(data, context={"bot": bot})
+        if not await app.state.seen.claim(update.update_id):
+            return {"ok": True, "duplicate": True}     # retrimitere deja preluată (de noi sau alt worker)
+        chat = update_chat_key(update)
+        tracing.hand_off(tr, update.update_id, chat)
+        accepted = app.state.queue.submit(chat, update)
+    if not accepted:
+        # coadă plină: Telegram va retrimite update-ul mai târziu
+        tracing.drop(update.update_id)
+        await app.state.seen.release(update.update_id)
+        return JSONResponse({"ok": False, "error": "busy"}, status_code=503)
     return {"ok": True}
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sessions.py — starea per utilizator (locație, brand curent, mod de rută).
+
+Două backend-uri cu aceeași interfață (await get / set / flush / close / stats):
+- MemorySessionStore: LRU + TTL în proces (se pierde la restart);
+- SQLiteSessionStore: tabel pe disc (WAL) + LRU mic în memorie. set() doar
+  notează câmpurile schimbate; un thread de scriere le aplică în lot la
+  fiecare flush_s secunde (sau imediat ce apar, cu flush_s=0), deci nici
+  un val de mesaje, nici un commit lent nu ajung în event loop. get()
+  servește din memorie, iar citirea din bază (cache ratat) rulează într-un
+  thread (asyncio.to_thread).
+Memoria rămâne plafonată oricâți utilizatori ar scrie botului.
+"""
+import os, json, time, asyncio, sqlite3, threading
+from typing import Any, Dict
+
+from ttl_cache import TTLCache
+
+Session = Dict[str, Any]
+
+class MemorySessionStore:
+    def __init__(self, max_items: int = 5000, ttl_s: float = 30*24*3600):
+        self._lock = threading.Lock()
+        self._cache = TTLCache(max_items=max_items, ttl_s=ttl_s, clock=time.time)
+
+    async def get(self, uid: int) -> Session:
+        with self._lock:
+            return dict(self._cache.get(uid) or {})
+
+    def set(self, uid: int, **fields: Any) -> None:
+        with self._lock:
+            s = dict(self._cache.get(uid) or {})
+            s.update(fields)
+            self._cache.put(uid, s)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "memory", **self._cache.stats()}
+
+_CHUNK = 500   # sub limita de variabile SQLite pe interogare
+
+class SQLiteSessionStore:
+    def __init__(self, path: str, ttl_s: float = 30*24*3600, cache_items: int = 2000,
+                 flush_s: float = 2.0, max_dirty: int = 500, prune_s: float = 600.0):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl_s = ttl_s
+        self.flush_s = flush_s
+        self.max_dirty = max_dirty
+        self.prune_s = prune_s
+        self._lock = threading.Lock()       # cache + modificări în așteptare (doar memorie, scurt)
+        self._db_lock = threading.Lock()    # conexiunea: thread-ul de scriere și citirile din to_thread
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (uid INTEGER PRIMARY KEY, v TEXT NOT NULL, ts REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_ts ON sessions(ts)")
+        self._db.commit()
+        self._cache = TTLCache(max_items=cache_items, ttl_s=ttl_s, clock=time.time)
+        self._dirty: Dict[int, Session] = {}      # uid -> câmpuri schimbate, încă nescrise
+        self._writing: Dict[int, Session] = {}    # lotul care se scrie chiar acum
+        self._gen = 0                             # crește după fiecare lot scris
+        self._pruned = 0.0
+        self.writes = 0
+        self.batches = 0
+        self.db_reads = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._flusher, name="sessions-flush", daemon=True)
+        self._thread.start()
+
+    def _load(self, uid: int) -> Session:
+        with self._db_lock:
+            row = self._db.execute("SELECT v FROM sessions WHERE uid = ? AND ts >= ?",
+                                   (uid, time.time() - self.ttl_s)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    async def get(self, uid: int) -> Session:
+        while True:
+            with self._lock:
+                s = self._cache.get(uid)
+                if s is not None:
+                    return dict(s)
+                gen = self._gen
+            base = await asyncio.to_thread(self._load, uid)
+            with self._lock:
+                if gen != self._gen:            # un lot s-a scris între timp: recitim
+                    continue
+                self.db_reads += 1
+                s = {**base, **self._writing.get(uid, {}), **self._dirty.get(uid, {})}
+                self._cache.put(uid, s)
+                return dict(s)
+
+    def set(self, uid: int, **fields: Any) -> None:
+        """Doar memorie: câmpurile intră în lotul următor al thread-ului de scriere."""
+        with self._lock:
+            self._dirty[uid] = {**self._dirty.get(uid, {}), **fields}
+            if uid in self._cache:              # fără să conteze ca hit/miss
+                self._cache.put(uid, {**self._cache.get(uid), **fields})
+            if self.flush_s <= 0 or len(self._dirty) >= self.max_dirty:
+                self._wake.set()
+
+    def flush(self) -> None:
+        """Scrie lotul curent (din thread-ul de scriere sau la închidere, niciodată din event loop)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            self._writing = batch
+        try:
+            with self._db_lock:
+                now = time.time()
+                self._db.execute("BEGIN IMMEDIATE")     # citire + scriere atomic față de ceilalți workeri
+                try:
+                    uids = list(batch)
+                    cur: Dict[int, Session] = {}
+                    for i in range(0, len(uids), _CHUNK):
+                        part = uids[i:i+_CHUNK]
+                        q = f"SELECT uid, v FROM sessions WHERE ts >= ? AND uid IN ({','.join('?'*len(part))})"
+                        for uid, v in self._db.execute(q, [now - self.ttl_s, *part]):
+                            cur[uid] = json.loads(v)
+                    rows = [(uid, json.dumps({**cur.get(uid, {}), **f}, ensure_ascii=False), now)
+                            for uid, f in batch.items()]
+                    self._db.executemany("INSERT OR REPLACE INTO sessions (uid, v, ts) VALUES (?, ?, ?)", rows)
+                    if now - self._pruned >= self.prune_s:
+                        self._db.execute("DELETE FROM sessions WHERE ts < ?", (now - self.ttl_s,))
+                        self._pruned = now
+                    self._db.commit()
+                except BaseException:
+                    self._db.rollback()
+                    raise
+        except BaseException:
+            with self._lock:                    # lotul rămâne de scris data viitoare
+                for uid, f in batch.items():
+                    self._dirty[uid] = {**f, **self._dirty.get(uid, {})}
+            raise
+        finally:
+            with self._lock:
+                self._writing = {}
+                self._gen += 1
+        self.writes += len(rows)
+        self.batches += 1
+
+    def _flusher(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_s if self.flush_s > 0 else None)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"[WARN] sessions flush: {e!r}")
+                self._stop.wait(1.0)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "sqlite", "pending_writes": len(self._dirty), "writes": self.writes,
+                    "batches": self.batches, "db_reads": self.db_reads, "cache": self._cache.stats()}
+
+def open_store(backend: str, path: str = "", ttl_s: float = 30*24*3600,
+               cache_items: int = 5000, flush_s: float = 2.0):
+    """backend: "memory" (cache_items = plafonul total) sau "sqlite" (path = fișierul bazei)."""
+    if backend == "memory" or not path:
+        return MemorySessionStore(max_items=cache_items, ttl_s=ttl_s)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, ttl_s=ttl_s, cache_items=cache_items, flush_s=flush_s)
+    raise ValueError(f"SESSION_BACKEND necunoscut: {backend}")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sqlite_cache.py — cache cheie → JSON pe disc (SQLite), cu TTL și plafon de mărime.
+
+Folosit pentru răspunsuri Google care nu se schimbă des (ex.: timpi de
+parcurs între magazine). Merge și cu path=":memory:" (teste, fără rețea).
+"""
+import os, json, time, sqlite3, threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+_CHUNK = 500   # sub limita de variabile SQLite pe interogare
+
+class SQLiteCache:
+    def __init__(self, path: str, table: str = "kv", ttl_s: float = 14*24*3600,
+                 max_items: int = 200_000, clock: Callable[[], float] = time.time):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.table = table
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (k TEXT PRIMARY KEY, v TEXT NOT NULL, ts REAL NOT NULL)")
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_ts ON {table}(ts)")
+        self._db.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Doar intrările găsite și neexpirate."""
+        keys = list(dict.fromkeys(keys))
+        min_ts = self.clock() - self.ttl_s
+        out: Dict[str, Any] = {}
+        with self._lock:
+            for i in range(0, len(keys), _CHUNK):
+                part = keys[i:i+_CHUNK]
+                q = f"SELECT k, v FROM {self.table} WHERE ts >= ? AND k IN ({','.join('?'*len(part))})"
+                for k, v in self._db.execute(q, [min_ts, *part]):
+                    out[k] = json.loads(v)
+        return out
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.get_many([key]).get(key, default)
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        now = self.clock()
+        rows = [(k, json.dumps(v, ensure_ascii=False), now) for k, v in items.items()]
+        with self._lock:
+            self._db.executemany(f"INSERT OR REPLACE INTO {self.table} (k, v, ts) VALUES (?, ?, ?)", rows)
+            self._evict()
+            self._db.commit()
+
+    def put(self, key: str, value: Any) -> None:
+        self.put_many({key: value})
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _evict(self) -> None:
+        # întâi expiratele, apoi cele mai vechi peste plafon
+        self._db.execute(f"DELETE FROM {self.table} WHERE ts < ?", (self.clock() - self.ttl_s,))
+        n = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        if n > self.max_items:
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE k IN (SELECT k FROM {self.table} ORDER BY ts LIMIT ?)",
+                (n - self.max_items,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+def open_cache(path: Optional[str], **kw) -> Optional[SQLiteCache]:
+    """None dacă path e gol (cache dezactivat din env)."""
+    return SQLiteCache(path, **kw) if path else None
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tracing.py — intervale cronometrate (spans) per update, opționale (TRACE=1).
+
+Un Trace începe în webhook, trece prin coadă (așteptarea e și ea un span),
+handler, Google și trimiterile către Telegram. Trace-ul curent stă într-un
+contextvar, deci span("nume") funcționează oriunde pe drumul update-ului,
+inclusiv în task-urile pornite din el. Trace-urile terminate intră într-un
+buffer circular; cele peste TRACE_SLOW_MS se scriu în jurnalul de update-uri
+lente cu defalcarea pe span-uri. Cu tracing oprit, span() întoarce un context
+gol partajat (un contextvar.get() și atât).
+
+profile_chat(id) pornește cProfile pentru update-urile unui singur chat.
+Profilul acoperă tot event loop-ul cât rulează handler-ul, deci și alte
+task-uri concurente; e gândit pentru depanare, nu pentru producție continuă.
+"""
+import os, io, json, time, pstats, cProfile, contextvars, datetime as dt
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Deque, Dict, List, Optional
+
+TRACE_ENABLED = os.getenv("TRACE", "0") == "1"
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "200"))          # ultimele N update-uri
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "3000"))
+TRACE_SLOW_LOG = os.getenv("TRACE_SLOW_LOG", "")               # gol = stdout
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("data", "profiles"))
+
+class Trace:
+    __slots__ = ("update_id", "chat", "started", "t0", "spans", "depth", "total_ms")
+
+    def __init__(self, update_id: Any = None, chat: Any = None):
+        self.update_id = update_id
+        self.chat = chat
+        self.started = dt.datetime.now().isoformat(timespec="milliseconds")
+        self.t0 = time.perf_counter()
+        self.spans: List[tuple] = []          # (nume, start ms, durată ms, adâncime, extra)
+        self.depth = 0
+        self.total_ms: Optional[float] = None
+
+    def add(self, name: str, t_start: float, t_end: float, extra: Optional[str] = None) -> None:
+        self.spans.append((name, round((t_start - self.t0)*1000, 2), round((t_end - t_start)*1000, 2),
+                           self.depth, extra))
+
+    def ordered(self) -> List[tuple]:
+        # span-urile se adaugă la închidere (copiii înaintea părintelui); afișarea e după start
+        return sorted(self.spans, key=lambda s: (s[1], s[3]))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"update_id": self.update_id, "chat": self.chat, "started": self.started, "total_ms": self.total_ms,
+                "spans": [{"name": n, "at_ms": a, "ms": d, "depth": k, **({"info": x} if x else {})}
+                          for n, a, d, k, x in self.ordered()]}
+
+    def breakdown(self) -> str:
+        return "\n".join(f"  {'  '*k}{n:<28} +{a:>8.1f}ms {d:>8.1f}ms{'  ' + x if x else ''}"
+                         for n, a, d, k, x in self.ordered())
+
+_current: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("trace", default=None)
+_PENDING: Dict[Any, Trace] = {}              # update_id -> trace între webhook și worker
+RECENT: Deque[Trace] = deque(maxlen=TRACE_BUFFER)
+SLOW: Deque[Trace] = deque(maxlen=TRACE_BUFFER)
+_NULL = nullcontext()
+
+class _Span:
+    __slots__ = ("tr", "name", "extra", "t")
+
+    def __init__(self, tr: Trace, name: str, extra: Optional[str]):
+        self.tr, self.name, self.extra = tr, name, extra
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        self.tr.depth += 1
+        return self
+
+    def __exit__(self, et, e, tb):
+        self.tr.depth -= 1
+        self.tr.add(self.name, self.t, time.perf_counter(),
+                    self.extra if et is None else f"{self.extra or ''} {et.__name__}".strip())
+        return False
+
+def span(name: str, extra: Optional[str] = None):
+    """with span("directions_optimize"): ... — nu face nimic dacă nu există trace activ."""
+    tr = _current.get()
+    return _NULL if tr is None else _Span(tr, name, extra)
+
+def record(name: str, t_start: float, extra: Optional[str] = None) -> None:
+    """Span deja terminat (început la t_start = perf_counter(), terminat acum)."""
+    tr = _current.get()
+    if tr is not None:
+        tr.add(name, t_start, time.perf_counter(), extra)
+
+# ───────── Ciclul de viață al unui update ─────────
+def begin() -> Optional[Trace]:
+    """În webhook: trace nou, activ în contextul curent (None dacă tracing e oprit)."""
+    if not TRACE_ENABLED:
+        return None
+    tr = Trace()
+    _current.set(tr)
+    return tr
+
+def hand_off(tr: Optional[Trace], update_id: Any, chat: Any) -> None:
+    """Trace-ul trece la workerul cozii (alt task, alt context)."""
+    if tr is not None:
+        tr.update_id, tr.chat = update_id, chat
+        _PENDING[update_id] = tr
+
+def drop(update_id: Any) -> None:
+    _PENDING.pop(update_id, None)
+
+def resume(update_id: Any) -> Optional[Trace]:
+    """În worker: reactivează trace-ul și notează cât a stat update-ul în coadă."""
+    tr = _PENDING.pop(update_id, None)
+    if tr is not None:
+        _current.set(tr)
+        last = max((a + d for _, a, d, _, _ in tr.spans), default=0.0)
+        tr.add("queue_wait", tr.t0 + last/1000, time.perf_counter())
+    return tr
+
+def finish(tr: Optional[Trace]) -> None:
+    if tr is None:
+        return
+    _current.set(None)
+    tr.total_ms = round((time.perf_counter() - tr.t0)*1000, 2)
+    RECENT.append(tr)
+    if tr.total_ms >= TRACE_SLOW_MS:
+        SLOW.append(tr)
+        _log_slow(tr)
+
+def _log_slow(tr: Trace) -> None:
+    if TRACE_SLOW_LOG:
+        try:
+            with open(TRACE_SLOW_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(tr.to_dict(), ensure_ascii=False) + "\n")
+            return
+        except OSError as e:
+            print(f"[WARN] TRACE_SLOW_LOG: {e!r}")
+    print(f"[SLOW] update {tr.update_id} chat {tr.chat}: {tr.total_ms:.0f} ms\n{tr.breakdown()}")
+
+def snapshot(slow_only: bool = False, limit: int = 50) -> List[Dict[str, Any]]:
+    src = SLOW if slow_only else RECENT
+    return [tr.to_dict() for tr in list(src)[-limit:]][::-1]
+
+# ───────── cProfile pentru un singur chat ─────────
+PROFILE_CHAT: Optional[int] = int(os.environ["PROFILE_CHAT"]) if os.getenv("PROFILE_CHAT") else None
+_profiling = False
+
+def profile_chat(chat: Optional[int]) -> None:
+    """Pornește (id) sau oprește (None) profilarea update-urilor unui chat."""
+    global PROFILE_CHAT
+    PROFILE_CHAT = chat
+
+def profiler_for(chat: Any) -> Optional[cProfile.Profile]:
+    """Un profiler pornit dacă chat-ul e cel urmărit și nu rulează deja altul."""
+    global _profiling
+    if PROFILE_CHAT is None or chat != PROFILE_CHAT or _profiling:
+        return None
+    _profiling = True
+    p = cProfile.Profile()
+    p.enable()
+    return p
+
+def profiler_done(p: Optional[cProfile.Profile], chat: Any, update_id: Any, top: int = 25) -> Optional[str]:
+    """Oprește profilerul, salvează .prof în PROFILE_DIR și întoarce calea."""
+    global _profiling
+    if p is None:
+        return None
+    p.disable()
+    _profiling = False
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"chat{chat}_upd{update_id}.prof")
+    p.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(p, stream=out).sort_stats("cumulative").print_stats(top)
+    print(f"[PROFILE] update {update_id} -> {path}\n{out.getvalue()}")
+    return path
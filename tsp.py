@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tsp.py — ordonarea opririlor pe o matrice de costuri (secunde sau km).
+
+Drum deschis: pornește din start_idx, se termină oriunde. Matricea poate fi
+asimetrică (trafic), deci inversarea unui segment își recalculează și
+costul interior (sume prefix înainte/înapoi), nu doar cele două muchii.
+
+tsp_local_search: vecinul cel mai apropiat, apoi 2-opt + Or-opt evaluate
+prin delta de cost, cu liste de vecini și „don't-look bits”.
+held_karp_path: optim exact (programare dinamică pe măști de biți) pentru
+rute mici; solve_path alege singur între cele două și spune ce a folosit.
+"""
+from collections import deque
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from geo import nearest_neighbor_order
+
+NEIGHBORS_K = 10      # candidați per nod
+OR_OPT_MAX = 3        # lungimea maximă a segmentului mutat
+HELD_KARP_MAX = 15    # noduri (inclusiv startul) până la care rezolvăm exact
+
+SOLVER_EXACT = "held-karp"
+SOLVER_HEURISTIC = "local-search"
+_EPS = 1e-9
+
+def path_cost(dmat, path: Sequence[int]) -> float:
+    return sum(dmat[a][b] for a, b in zip(path[:-1], path[1:]))
+
+def neighbor_lists(d: np.ndarray, k: int = NEIGHBORS_K) -> List[List[int]]:
+    """Cei mai apropiați k vecini ai fiecărui nod, după costul dus-întors."""
+    n = len(d)
+    k = min(k, n - 1)
+    if k <= 0:
+        return [[] for _ in range(n)]
+    sym = d + d.T
+    np.fill_diagonal(sym, np.inf)
+    part = np.argpartition(sym, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(sym, part, axis=1).argsort(axis=1)
+    return np.take_along_axis(part, order, axis=1).tolist()
+
+class _Tour:
+    """Drum pe liste: p (ordinea), pos (poziția fiecărui nod) și sume prefix
+    ale costurilor înainte (fw) și înapoi (bw) — pentru delta în O(1)."""
+
+    def __init__(self, d: List[List[float]], path: List[int]):
+        self.d = d
+        self.set(path)
+
+    def set(self, path: List[int]) -> None:
+        d = self.d
+        self.p = path
+        self.n = len(path)
+        self.pos = [0] * self.n
+        fw = [0.0] * self.n
+        bw = [0.0] * self.n
+        for t, x in enumerate(path):
+            self.pos[x] = t
+            if t:
+                y = path[t - 1]
+                fw[t] = fw[t - 1] + d[y][x]
+                bw[t] = bw[t - 1] + d[x][y]
+        self.fw, self.bw = fw, bw
+
+    def two_opt_delta(self, i: int, k: int) -> float:
+        """Inversarea p[i..k] (1 <= i < k)."""
+        d, p = self.d, self.p
+        a, b, c = p[i - 1], p[i], p[k]
+        delta = d[a][c] - d[a][b] + (self.bw[k] - self.bw[i]) - (self.fw[k] - self.fw[i])
+        if k + 1 < self.n:
+            e = p[k + 1]
+            delta += d[b][e] - d[c][e]
+        return delta
+
+    def or_opt_delta(self, i: int, L: int, j: int, rev: bool) -> float:
+        """Mută p[i..i+L-1] între p[j] și p[j+1] (j în afara segmentului), opțional inversat."""
+        d, p, n = self.d, self.p, self.n
+        s0, sl = p[i], p[i + L - 1]
+        a = p[i - 1]
+        e = p[i + L] if i + L < n else None
+        delta = -d[a][s0]
+        if e is not None:
+            delta += d[a][e] - d[sl][e]
+        u = p[j]
+        v = p[j + 1] if j + 1 < n else None
+        first, last = (sl, s0) if rev else (s0, sl)
+        delta += d[u][first]
+        if v is not None:
+            delta += d[last][v] - d[u][v]
+        if rev:
+            delta += (self.bw[i + L - 1] - self.bw[i]) - (self.fw[i + L - 1] - self.fw[i])
+        return delta
+
+    def apply_two_opt(self, i: int, k: int) -> None:
+        p = self.p
+        self.set(p[:i] + p[i:k + 1][::-1] + p[k + 1:])
+
+    def apply_or_opt(self, i: int, L: int, j: int, rev: bool) -> None:
+        p = self.p
+        seg = p[i:i + L]
+        if rev:
+            seg = seg[::-1]
+        u = p[j]
+        rest = p[:i] + p[i + L:]
+        at = rest.index(u) + 1
+        self.set(rest[:at] + seg + rest[at:])
+
+def _improve_node(t: _Tour, x: int, neigh: List[List[int]]):
+    """Prima mutare îmbunătățitoare care implică nodul x; întoarce nodurile atinse."""
+    p, pos, n = t.p, t.pos, t.n
+    ix = pos[x]
+    # 2-opt: muchie nouă x -> c (x = p[i-1]) sau b -> x (x = p[k+1])
+    cands = list(neigh[x])
+    if p[-1] not in cands:
+        cands.append(p[-1])
+    for c in cands:
+        i, k = ix + 1, pos[c]
+        if 1 <= i < k and t.two_opt_delta(i, k) < -_EPS:
+            touched = {x, p[i], c, p[k + 1] if k + 1 < n else x}
+            t.apply_two_opt(i, k)
+            return touched
+    for b in neigh[x]:
+        i, k = pos[b], ix - 1
+        if 1 <= i < k and t.two_opt_delta(i, k) < -_EPS:
+            touched = {x, b, p[k], p[i - 1]}
+            t.apply_two_opt(i, k)
+            return touched
+    # Or-opt: segment care începe la x, inserat lângă un vecin
+    if ix == 0:
+        return None
+    for L in range(1, OR_OPT_MAX + 1):
+        if ix + L > n:
+            break
+        seg_lo, seg_hi = ix, ix + L - 1
+        sl = p[seg_hi]
+        slots = set()
+        for y in neigh[x]:
+            slots.add(pos[y]); slots.add(pos[y] - 1)
+        for y in neigh[sl]:
+            slots.add(pos[y] - 1); slots.add(pos[y])
+        slots.add(n - 1)
+        for j in slots:
+            if j < 0 or seg_lo - 1 <= j <= seg_hi:
+                continue
+            for rev in (False, True):
+                if rev and L == 1:
+                    continue
+                if t.or_opt_delta(ix, L, j, rev) < -_EPS:
+                    touched = {x, sl, p[ix - 1], p[j]}
+                    if seg_hi + 1 < n: touched.add(p[seg_hi + 1])
+                    if j + 1 < n: touched.add(p[j + 1])
+                    t.apply_or_opt(ix, L, j, rev)
+                    return touched
+    return None
+
+def local_search(dmat, path: List[int], neighbors_k: int = NEIGHBORS_K) -> List[int]:
+    """Îmbunătățește un drum deschis (primul nod rămâne fix) până la optim local."""
+    d = np.asarray(dmat, dtype=np.float64)
+    if len(path) < 3:
+        return list(path)
+    neigh = neighbor_lists(d, neighbors_k)
+    t = _Tour(d.tolist(), list(path))
+    queue = deque(path)
+    queued = set(path)
+    while queue:
+        x = queue.popleft()
+        queued.discard(x)
+        touched = _improve_node(t, x, neigh)
+        if touched:
+            for y in (x, *touched):
+                if y not in queued:
+                    queue.append(y); queued.add(y)
+    return t.p
+
+def tsp_local_search(dmat, start_idx: int = 0) -> List[int]:
+    """Același contract ca vechiul tsp_nearest_then_two_opt: drum deschis din start_idx."""
+    d = np.asarray(dmat, dtype=np.float64)
+    if len(d) == 0:
+        return []
+    path = [start_idx] + nearest_neighbor_order(d, start_idx)
+    return local_search(d, path)
+
+# ───────── Held-Karp (exact) ─────────
+def held_karp_path(dmat, start_idx: int = 0) -> List[int]:
+    """Drum deschis optim din start_idx. O(2^m · m²) timp, O(2^m · m) memorie,
+    cu m = n-1; fiecare strat (măști cu același număr de biți) e vectorizat."""
+    d = np.asarray(dmat, dtype=np.float64)
+    n = len(d)
+    others = [i for i in range(n) if i != start_idx]
+    m = len(others)
+    if m <= 1:
+        return [start_idx] + others
+    D = d[np.ix_(others, others)]
+    full = 1 << m
+    masks_all = np.arange(full)
+    bits = np.zeros(full, dtype=np.int64)
+    for b in range(m):
+        bits += (masks_all >> b) & 1
+
+    # dp[mask, j]: cel mai ieftin drum start → (toate din mask) care se termină în j
+    dp = np.full((full, m), np.inf)
+    parent = np.full((full, m), -1, dtype=np.int8)
+    dp[1 << np.arange(m), np.arange(m)] = d[start_idx, others]
+    for k in range(1, m):
+        masks = np.flatnonzero(bits == k)
+        tot = dp[masks][:, :, None] + D[None, :, :]        # (măști, i, j)
+        best_i = tot.argmin(axis=1)
+        best = np.take_along_axis(tot, best_i[:, None, :], axis=1)[:, 0, :]
+        for j in range(m):
+            free = ((masks >> j) & 1) == 0
+            tgt = masks[free] | (1 << j)                   # o singură sursă per (tgt, j)
+            dp[tgt, j] = best[free, j]
+            parent[tgt, j] = best_i[free, j]
+
+    mask = full - 1
+    j = int(dp[mask].argmin())
+    rev = []
+    while j >= 0:
+        rev.append(others[j])
+        i = int(parent[mask, j])
+        mask ^= 1 << j
+        j = i
+    return [start_idx] + rev[::-1]
+
+def solve_path(dmat, start_idx: int = 0) -> Tuple[List[int], str]:
+    """Drum deschis din start_idx + numele solverului folosit (exact sau euristic)."""
+    n = len(dmat)
+    if n <= HELD_KARP_MAX:
+        return held_karp_path(dmat, start_idx), SOLVER_EXACT
+    return tsp_local_search(dmat, start_idx), SOLVER_HEURISTIC
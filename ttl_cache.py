@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ttl_cache.py — cache în memorie LRU + TTL, cu varianta async „singleflight”.
+
+TTLCache: plafon de intrări (cele mai vechi folosite ies primele) și
+expirare după ttl_s. AsyncTTLCache.get_or_compute: cererile identice
+simultane așteaptă același calcul în curs, în loc să-l repete fiecare.
+"""
+import time, asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+class TTLCache:
+    def __init__(self, max_items: int = 512, ttl_s: float = 900.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_items = max_items
+        self.ttl_s = ttl_s
+        self.clock = clock
+        self._d: "OrderedDict[Hashable, tuple]" = OrderedDict()   # cheie -> (expiră_la, valoare)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        e = self._d.get(key)
+        if e is not None and e[0] > self.clock():
+            self._d.move_to_end(key)
+            self.hits += 1
+            return e[1]
+        if e is not None:
+            del self._d[key]
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any, ttl_s: Optional[float] = None) -> None:
+        self._d[key] = (self.clock() + (self.ttl_s if ttl_s is None else ttl_s), value)
+        self._d.move_to_end(key)
+        while len(self._d) > self.max_items:
+            self._d.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        e = self._d.pop(key, None)
+        return default if e is None else e[1]
+
+    def clear(self) -> None:
+        self._d.clear()
+
+    def __len__(self) -> int:
+        return len(self._d)
+
+    def __contains__(self, key: Hashable) -> bool:
+        e = self._d.get(key)
+        return e is not None and e[0] > self.clock()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"size": len(self._d), "max_items": self.max_items, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0, "evictions": self.evictions}
+
+class AsyncTTLCache(TTLCache):
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]],
+                             cache_if: Callable[[Any], bool] = lambda v: True) -> Any:
+        """Valoarea din cache sau rezultatul lui compute(); un singur calcul per cheie odată.
+        Excepțiile ajung la toți cei care așteaptă și nu se memorează."""
+        v = self.get(key, _MISSING)
+        if v is not _MISSING:
+            return v
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            v = await compute()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()          # marcat ca „văzut” dacă nu așteaptă nimeni altcineva
+            raise
+        else:
+            if cache_if(v):
+                self.put(key, v)
+            fut.set_result(v)
+            return v
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        out = super().stats()
+        out.update(coalesced=self.coalesced, inflight=len(self._inflight))
+        return out
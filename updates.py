@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+updates.py — coadă de update-uri pe chat, procesată de un număr fix de workeri.
+
+Webhook-ul doar pune update-ul în coadă și răspunde imediat. Fiecare chat
+are propria listă FIFO și e luat de cel mult un worker odată, deci ordinea
+dintr-un chat se păstrează, iar chat-uri diferite rulează în paralel.
+Coada e plafonată: peste max_pending, submit() refuză (serverul răspunde
+503 și Telegram retrimite mai târziu). La oprire, drain() așteaptă golirea.
+SeenUpdates ține minte update_id-urile primite recent (comun tuturor
+proceselor prin SQLite), ca retrimiterile Telegram să nu fie procesate de două ori;
+accesul la bază rulează într-un thread, nu în event loop.
+"""
+import os, time, asyncio, sqlite3, threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from ttl_cache import TTLCache
+
+Handler = Callable[[Any], Awaitable[None]]
+
+class ChatQueue:
+    def __init__(self, handler: Handler, workers: int = 8, max_pending: int = 1000,
+                 on_error: Optional[Callable[[Any, BaseException], None]] = None):
+        self.handler = handler
+        self.n_workers = max(1, workers)
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self._chats: Dict[Hashable, Deque[Tuple[float, Any]]] = {}
+        self._ready: "asyncio.Queue[Hashable]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._idle = asyncio.Event(); self._idle.set()
+        self._closing = False
+        # metrici
+        self.pending = 0
+        self.in_flight = 0
+        self.max_pending_seen = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.n_workers)]
+
+    def submit(self, chat: Hashable, item: Any) -> bool:
+        """False = coada e plină sau se închide (backpressure)."""
+        if self._closing or self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        q = self._chats.get(chat)
+        if q is None:
+            q = self._chats[chat] = deque()
+            self._ready.put_nowait(chat)     # chat nou → gata de preluat
+        q.append((time.monotonic(), item))
+        self.pending += 1
+        self.accepted += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        self._idle.clear()
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            chat = await self._ready.get()
+            q = self._chats[chat]
+            t_in, item = q.popleft()
+            self.pending -= 1
+            self.in_flight += 1
+            wait = time.monotonic() - t_in
+            self.wait_total_s += wait
+            self.wait_max_s = max(self.wait_max_s, wait)
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                if self.on_error:
+                    self.on_error(item, e)
+            finally:
+                self.in_flight -= 1
+                if q:
+                    self._ready.put_nowait(chat)   # restul chat-ului, la coada listei (echitabil)
+                else:
+                    del self._chats[chat]
+                if not self.pending and not self.in_flight:
+                    self._idle.set()
+
+    async def drain(self, timeout: float = 20.0) -> bool:
+        """Nu mai primește nimic nou și așteaptă terminarea celor din coadă. True = golită."""
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            ok = True
+        except asyncio.TimeoutError:
+            ok = False
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        return ok
+
+    def stats(self) -> Dict[str, Any]:
+        done = self.processed + self.failed
+        return {
+            "workers": self.n_workers,
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "chats_waiting": len(self._chats),
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_avg_ms": round(self.wait_total_s / done * 1000, 1) if done else 0.0,
+            "wait_max_ms": round(self.wait_max_s * 1000, 1),
+        }
+
+class SeenUpdates:
+    """Fereastră de deduplicare: await claim(update_id) e True doar prima dată în window_s.
+
+    Cu path gol rămâne doar în proces; cu path, tabelul SQLite e împărțit de
+    toți workerii uvicorn (INSERT OR IGNORE decide atomic cine îl procesează).
+    Scrierile în bază rulează în asyncio.to_thread; dacă baza e blocată peste
+    timeout_s, update-ul e acceptat (o procesare dublă e mai ieftină decât
+    un webhook blocat sau un update pierdut).
+    """
+    def __init__(self, path: str = "", window_s: float = 3600.0, max_local: int = 20000,
+                 prune_every: int = 500, timeout_s: float = 2.0):
+        self.window_s = window_s
+        self.prune_every = prune_every
+        self._local = TTLCache(max_items=max_local, ttl_s=window_s, clock=time.time)
+        self._lock = threading.Lock()       # conexiunea (folosită din thread-uri)
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=timeout_s)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY, ts REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS seen_updates_ts ON seen_updates(ts)")
+            self._db.commit()
+        self._claims = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.db_errors = 0
+
+    def _insert(self, update_id: int) -> bool:
+        with self._lock:
+            now = time.time()
+            cur = self._db.execute("INSERT OR IGNORE INTO seen_updates (update_id, ts) VALUES (?, ?)",
+                                   (update_id, now))
+            self._claims += 1
+            if self._claims % self.prune_every == 0:
+                self._db.execute("DELETE FROM seen_updates WHERE ts < ?", (now - self.window_s,))
+            self._db.commit()
+            return cur.rowcount > 0
+
+    def _delete(self, update_id: int) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+            self._db.commit()
+
+    async def claim(self, update_id: int) -> bool:
+        """True = update nou (de procesat); False = deja primit de un proces."""
+        if update_id in self._local:
+            self.duplicates += 1
+            return False
+        if self._db is not None:
+            try:
+                fresh = await asyncio.to_thread(self._insert, update_id)
+            except sqlite3.Error as e:
+                self.db_errors += 1
+                print(f"[WARN] dedup update {update_id}: {e!r} — îl accept")
+                fresh = True
+            if not fresh or update_id in self._local:   # alt proces / altă cerere din același proces
+                self._local.put(update_id, True)
+                self.duplicates += 1
+                return False
+        self._local.put(update_id, True)
+        self.accepted += 1
+        return True
+
+    async def release(self, update_id: int) -> None:
+        """Renunță la claim (ex.: coada plină → 503), ca retrimiterea să fie acceptată."""
+        self._local.pop(update_id)
+        self.accepted -= 1
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._delete, update_id)
+            except sqlite3.Error as e:
+                self.db_errors += 1
+                print(f"[WARN] dedup release {update_id}: {e!r}")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"shared": self._db is not None, "window_s": self.window_s,
+                "accepted": self.accepted, "duplicates": self.duplicates, "db_errors": self.db_errors}